@@ -3,9 +3,19 @@ const Patient = require('../models/Patient');
 const User = require('../models/User');
 const { exec } = require('child_process');
 const path = require('path');
+const axios = require('axios');
 
 const { generateMockAnalysis, simulateProcessing } = require('../utils/aiSimulator');
 
+// Resident segmentation service (Segmentation Model/Inference_Pipeline/segmentation_server.py)
+const SEGMENTATION_SERVER_URL = process.env.SEGMENTATION_SERVER_URL || 'http://127.0.0.1:5001';
+// Give up on a queued segmentation job after this long (matches the server's /segment timeout)
+const SEGMENTATION_JOB_TIMEOUT_MS = Number(process.env.SEGMENTATION_JOB_TIMEOUT_MS) || 60 * 60 * 1000;
+// Resident slice service (Segmentation Model/Inference_Pipeline/slice_server.py)
+const SLICE_SERVER_URL = process.env.SLICE_SERVER_URL || 'http://127.0.0.1:5002';
+// Write the AR scenes with KHR_mesh_quantization (smaller downloads, same geometry)
+const QUANTIZE_GLB = process.env.QUANTIZE_GLB === 'true';
+
 // @desc    Get all analyses for a patient
 // @route   GET /api/analyses/patient/:patientId
 // @access  Private
@@ -95,6 +105,120 @@ exports.createAnalysis = async (req, res) => {
     }
 };
 
+const PIPELINE_BASE_DIR = path.resolve(__dirname, '../../Segmentation Model');
+const PIPELINE_SCRIPT_DIR = path.join(PIPELINE_BASE_DIR, 'Inference_Pipeline');
+
+const runScript = (name, args = []) => {
+    return new Promise((resolve, reject) => {
+        const sPath = path.join(PIPELINE_SCRIPT_DIR, name);
+        // Join args array with spaces, but don't double quote if already quoted
+        const cmd = `python "${sPath}" ${args.join(' ')}`;
+        console.log(`Running command: ${cmd}`);
+        
+        exec(cmd, { cwd: PIPELINE_SCRIPT_DIR }, (error, stdout, stderr) => {
+            if (error) {
+                console.error(`Error in ${name}: ${error}`);
+                reject(error);
+                return;
+            }
+            console.log(`stdout ${name}: ${stdout}`);
+            resolve(stdout);
+        });
+    });
+};
+
+// Store the pipeline metrics on the analysis and mark it completed
+const applySegmentationResults = async (analysis, metrics, startTime, resultsDir, mriPaths) => {
+    console.log(`Dynamic assets stored in: ${resultsDir}`);
+
+    // Optionally pre-render every viewer slice so getSlice is a static read
+    if (process.env.SLICE_ATLAS === 'true') {
+        try {
+            const atlasArgs = [`"${resultsDir}"`];
+            Object.values(mriPaths).filter(Boolean).forEach(p => atlasArgs.push(`--source "${p}"`));
+            atlasArgs.push(`--mask "${resolveArtifact(resultsDir, 'tumor_mask')}"`);
+            atlasArgs.push(`--probs "${resolveArtifact(resultsDir, 'tumor_probs')}"`);
+            await runScript('slice_atlas.py', atlasArgs);
+        } catch (atlasErr) {
+            console.error("Slice atlas generation failed", atlasErr);
+        }
+    }
+
+    // Generate mock analysis results but override with real metrics
+    const results = generateMockAnalysis(analysis.analysisType);
+    
+    let updateData = {
+        status: 'completed',
+        processingTime: Date.now() - startTime
+    };
+
+    if (metrics.tumor_volume) {
+        updateData.tumorVolume = metrics.tumor_volume;
+        updateData.edemaVolume = metrics.edema_volume;
+        updateData.tumorLocation = metrics.tumor_location;
+        updateData.intensityStats = metrics.intensity_stats;
+        updateData.textureFeatures = metrics.texture_features;
+        updateData.confidence = metrics.confidence;
+
+        // Synchronize nested data for frontend backward compatibility
+        results.volumetricAnalysis = {
+            tumorVolume: metrics.tumor_volume,
+            edemaVolume: metrics.edema_volume,
+            necrosisVolume: (metrics.tumor_volume * 0.05).toFixed(2),
+            enhancingVolume: (metrics.tumor_volume * 0.8).toFixed(2)
+        };
+        results.tumorLocation = metrics.tumor_location;
+        results.segmentationConfidence = metrics.confidence;
+        results.intensityStats = metrics.intensity_stats;
+        results.textureFeatures = metrics.texture_features;
+    }
+    
+    results.segmentationOutput = "tumor_mask generated successfully";
+    updateData.data = results;
+
+    await analysis.update(updateData);
+    return analysis;
+};
+
+// Long-poll a queued segmentation job until it finishes, then record the outcome
+const watchSegmentationJob = async (analysis, startTime, resultsDir, mriPaths) => {
+    const jobUrl = `${SEGMENTATION_SERVER_URL}/jobs/${analysis.id}`;
+    const deadline = Date.now() + SEGMENTATION_JOB_TIMEOUT_MS;
+    let status = 'queued';
+    let failures = 0;
+
+    try {
+        while (Date.now() < deadline) {
+            let job;
+            try {
+                const response = await axios.get(jobUrl, { params: { wait: 30, since: status } });
+                job = response.data.job;
+                failures = 0;
+            } catch (pollErr) {
+                if (pollErr.response || ++failures >= 5) throw pollErr;
+                await new Promise(resolve => setTimeout(resolve, 2000));
+                continue;
+            }
+
+            if (job.status !== status) console.log(`Analysis ${analysis.id}: ${job.status}`);
+            status = job.status;
+
+            if (status === 'done') {
+                console.log(`Segmentation server timings: ${JSON.stringify(job.timings)}`);
+                await applySegmentationResults(analysis, job.metrics || {}, startTime, resultsDir, mriPaths);
+                return;
+            }
+            if (status === 'failed') {
+                throw new Error(job.error || 'Segmentation job failed');
+            }
+        }
+        throw new Error(`Segmentation job did not finish within ${SEGMENTATION_JOB_TIMEOUT_MS / 1000}s (last status: ${status})`);
+    } catch (err) {
+        console.error("Segmentation failed:", err);
+        await analysis.update({ status: 'failed', error: err.message });
+    }
+};
+
 // @desc    Process analysis (execute AI segmentation)
 // @route   POST /api/analyses/:id/process
 // @access  Private
@@ -117,9 +241,11 @@ exports.processAnalysis = async (req, res) => {
         const startTime = Date.now();
 
         // Path to the python script
-        const baseDir = path.resolve(__dirname, '../../Segmentation Model');
-        const scriptDir = path.join(baseDir, 'Inference_Pipeline');
-        const scriptPath = path.join(scriptDir, 'infer_segmentation.py');
+        const baseDir = PIPELINE_BASE_DIR;
+        const scriptPath = path.join(PIPELINE_SCRIPT_DIR, 'pipeline.py');
+
+        // Every job writes only into its own results folder
+        const resultsDir = path.join(baseDir, 'AR_Assets/results', analysis.id);
 
         // Resolve MRI paths
         const resolvePath = (p) => p ? path.resolve(__dirname, '..', p) : null;
@@ -147,65 +273,44 @@ exports.processAnalysis = async (req, res) => {
              const defaultFlair = path.join(baseDir, 'Test_Data/BraTS20_Training_001_flair.nii');
              console.log("No MRI provided, using default test data.");
              scriptArgs.push(`--flair "${defaultFlair}"`);
+             mriPaths.flair = defaultFlair;
         }
 
-        console.log(`Executing segmentation script: ${scriptPath}`);
-        console.log(`Args: ${scriptArgs.join(' ')}`);
-
-        const runScript = (name, args = []) => {
-            return new Promise((resolve, reject) => {
-                const sPath = path.join(scriptDir, name);
-                // Join args array with spaces, but don't double quote if already quoted
-                const cmd = `python "${sPath}" ${args.join(' ')}`;
-                console.log(`Running command: ${cmd}`);
-                
-                exec(cmd, { cwd: scriptDir }, (error, stdout, stderr) => {
-                    if (error) {
-                        console.error(`Error in ${name}: ${error}`);
-                        reject(error);
-                        return;
-                    }
-                    console.log(`stdout ${name}: ${stdout}`);
-                    resolve(stdout);
-                });
-            });
-        };
+        scriptArgs.push(`--output-dir "${resultsDir}"`);
+        if (QUANTIZE_GLB) scriptArgs.push('--quantize-glb');
 
+        // Prefer the segmentation server's job queue: answer 202 now and let
+        // the client poll the analysis while the job moves through its stages
         try {
-             // Pass separate arguments
-             const stdout = await runScript('infer_segmentation.py', scriptArgs);
-             
-             // 1. Create unique directory for this analysis
-             const resultsDir = path.join(baseDir, 'AR_Assets/results', analysis.id);
-             if (!require('fs').existsSync(resultsDir)) {
-                 require('fs').mkdirSync(resultsDir, { recursive: true });
-             }
+            const job = { ...mriPaths, job_id: analysis.id, output_dir: resultsDir, mesh: true, quantize_glb: QUANTIZE_GLB };
+            const response = await axios.post(`${SEGMENTATION_SERVER_URL}/jobs`, job);
 
-             // 2. Trigger 3D Mesh Generation
-             try {
-                 console.log("Generating 3D Mesh for AR...");
-                 await runScript('mask_to_mesh.py');
-                 await runScript('merge_ar_scene.py');
-             } catch (meshErr) {
-                 console.error("3D Mesh Generation failed", meshErr);
-             }
+            watchSegmentationJob(analysis, startTime, resultsDir, mriPaths);
 
-             // 3. Move files to unique folder (regardless of mesh success)
-             const fs = require('fs');
-             const filesToMove = ['tumor_mask.npy', 'tumor_probs.npy', 'tumor.glb', 'edema.glb', 'brain.glb', 'tumor_with_brain.glb'];
-             filesToMove.forEach(file => {
-                 const oldPath = path.join(scriptDir, file); // Files are generated here
-                 const newPath = path.join(resultsDir, file);
-                 if (fs.existsSync(oldPath)) {
-                     try {
-                         if (fs.existsSync(newPath)) fs.unlinkSync(newPath); // Remove old version if exists
-                         fs.renameSync(oldPath, newPath);
-                     } catch (moveErr) {
-                         console.error(`Failed to move ${file}: ${moveErr.message}`);
-                     }
-                 }
-             });
-             console.log(`Dynamic assets stored in: ${resultsDir}`);
+            return res.status(202).json({
+                success: true,
+                data: analysis,
+                jobId: response.data.job.id
+            });
+        } catch (serverErr) {
+            // 503: the server is up but has no live worker, so run the script instead
+            if (serverErr.response && serverErr.response.status !== 503) {
+                console.error("Segmentation failed:", serverErr.message);
+                await analysis.update({ status: 'failed', error: serverErr.response.data.message || serverErr.message });
+                return res.status(500).json({
+                    success: false,
+                    message: 'AI Processing Failed: ' + (serverErr.response.data.message || serverErr.message)
+                });
+            }
+            console.log(`Segmentation server unavailable (${serverErr.message}), running script`);
+        }
+
+        console.log(`Executing segmentation pipeline: ${scriptPath}`);
+        console.log(`Args: ${scriptArgs.join(' ')}`);
+
+        try {
+             // Segmentation, meshing and scene merging in one process
+             const stdout = await runScript('pipeline.py', scriptArgs);
 
              // Extract JSON metrics from stdout
              let metrics = {};
@@ -218,39 +323,7 @@ exports.processAnalysis = async (req, res) => {
                  }
              }
 
-             // Generate mock analysis results but override with real metrics
-             const results = generateMockAnalysis(analysis.analysisType);
-             
-             let updateData = {
-                 status: 'completed',
-                 processingTime: Date.now() - startTime
-             };
-
-             if (metrics.tumor_volume) {
-                 updateData.tumorVolume = metrics.tumor_volume;
-                 updateData.edemaVolume = metrics.edema_volume;
-                 updateData.tumorLocation = metrics.tumor_location;
-                 updateData.intensityStats = metrics.intensity_stats;
-                 updateData.textureFeatures = metrics.texture_features;
-                 updateData.confidence = metrics.confidence;
-
-                 // Synchronize nested data for frontend backward compatibility
-                 results.volumetricAnalysis = {
-                     tumorVolume: metrics.tumor_volume,
-                     edemaVolume: metrics.edema_volume,
-                     necrosisVolume: (metrics.tumor_volume * 0.05).toFixed(2),
-                     enhancingVolume: (metrics.tumor_volume * 0.8).toFixed(2)
-                 };
-                 results.tumorLocation = metrics.tumor_location;
-                 results.segmentationConfidence = metrics.confidence;
-                 results.intensityStats = metrics.intensity_stats;
-                 results.textureFeatures = metrics.texture_features;
-             }
-             
-             results.segmentationOutput = "tumor_mask.npy generated successfully";
-             updateData.data = results;
-
-            await analysis.update(updateData);
+            await applySegmentationResults(analysis, metrics, startTime, resultsDir, mriPaths);
 
             res.json({
                 success: true,
@@ -273,6 +346,99 @@ exports.processAnalysis = async (req, res) => {
     }
 };
 
+// @desc    Get the segmentation job progress of an analysis
+// @route   GET /api/analyses/:id/progress
+// @access  Private
+exports.getAnalysisProgress = async (req, res) => {
+    try {
+        const analysis = await Analysis.findByPk(req.params.id);
+        if (!analysis) {
+            return res.status(404).json({ success: false, message: 'Analysis not found' });
+        }
+
+        try {
+            const response = await axios.get(`${SEGMENTATION_SERVER_URL}/jobs/${analysis.id}`, {
+                params: { wait: req.query.wait, since: req.query.since }
+            });
+            const { status, timings, error, created_at, updated_at } = response.data.job;
+            return res.json({
+                success: true,
+                data: { analysisStatus: analysis.status, jobStatus: status, timings, error, createdAt: created_at, updatedAt: updated_at }
+            });
+        } catch (serverErr) {
+            // No queued job (script fallback or server down): report the analysis status alone
+            return res.json({ success: true, data: { analysisStatus: analysis.status, jobStatus: null } });
+        }
+    } catch (error) {
+        res.status(500).json({ success: false, message: error.message });
+    }
+};
+
+// Read one PNG out of a slice atlas pack (see Inference_Pipeline/slice_atlas.py).
+// Returns null when no atlas covers the requested volume/plane.
+const readAtlasSlice = (resultsDir, type, filePath, plane, index) => {
+    const fs = require('fs');
+    const atlasDir = path.join(resultsDir, 'slice_atlas');
+    const indexPath = path.join(atlasDir, 'index.json');
+    if (Number.isNaN(index) || index < 0 || !fs.existsSync(indexPath)) return null;
+
+    try {
+        const atlas = JSON.parse(fs.readFileSync(indexPath, 'utf8'));
+        const entry = atlas.volumes.find(v => v.type === type && v.path === path.resolve(filePath));
+        const pack = entry && entry.planes[plane];
+        if (!pack || pack.offsets.length === 0) return null;
+
+        const i = Math.min(index, pack.offsets.length - 1);
+        const buffer = Buffer.alloc(pack.lengths[i]);
+        const fd = fs.openSync(path.join(atlasDir, pack.file), 'r');
+        try {
+            fs.readSync(fd, buffer, 0, pack.lengths[i], pack.offsets[i]);
+        } finally {
+            fs.closeSync(fd);
+        }
+        return buffer;
+    } catch (err) {
+        console.error(`Slice atlas read failed: ${err.message}`);
+        return null;
+    }
+};
+
+// Segmentation outputs are compact .npz artifacts; older analyses have full .npy arrays
+const resolveArtifact = (resultsDir, name) => {
+    const compactPath = path.join(resultsDir, `${name}.npz`);
+    return require('fs').existsSync(compactPath) ? compactPath : path.join(resultsDir, `${name}.npy`);
+};
+
+// Resolve the volume behind a slice view: the source MRI for the requested
+// modality, or the mask / probability map from the analysis results folder.
+const resolveSliceFile = (analysis, resultsDir, type, modality) => {
+    const baseDir = path.resolve(__dirname, '../../Segmentation Model');
+    let filePath;
+    let fileType;
+
+    if (type === 'source') {
+        // Determine which modality to show
+        // Default to FLAIR if not specified, then T1CE, then T1, then T2
+        if (modality === 't1' && analysis.t1Path) filePath = path.resolve(__dirname, '..', analysis.t1Path);
+        else if (modality === 't1ce' && analysis.t1cePath) filePath = path.resolve(__dirname, '..', analysis.t1cePath);
+        else if (modality === 't2' && analysis.t2Path) filePath = path.resolve(__dirname, '..', analysis.t2Path);
+        else if (analysis.flairPath) filePath = path.resolve(__dirname, '..', analysis.flairPath);
+        else if (analysis.t1cePath) filePath = path.resolve(__dirname, '..', analysis.t1cePath); // Fallback hierarchy
+        else if (analysis.t1Path) filePath = path.resolve(__dirname, '..', analysis.t1Path);
+        else filePath = path.join(baseDir, 'Test_Data/BraTS20_Training_001_flair.nii'); // Ultimate fallback
+
+        fileType = 'nii';
+    } else if (type === 'mask') {
+        filePath = resolveArtifact(resultsDir, 'tumor_mask');
+        fileType = 'npy';
+    } else if (type === 'heatmap') {
+        filePath = resolveArtifact(resultsDir, 'tumor_probs');
+        fileType = 'npy';
+    }
+
+    return { filePath, fileType };
+};
+
 // @desc    Get analysis slice image
 // @route   GET /api/analyses/:id/slice/:index
 // @access  Private
@@ -283,31 +449,10 @@ exports.getSlice = async (req, res) => {
         
         const baseDir = path.resolve(__dirname, '../../Segmentation Model');
         const resultsDir = path.join(baseDir, 'AR_Assets/results', id);
-        let filePath;
-        let fileType;
 
         // Fetch analysis to check for custom MRI path
         const analysis = await Analysis.findByPk(id);
-
-        if (type === 'source') {
-            // Determine which modality to show
-            // Default to FLAIR if not specified, then T1CE, then T1, then T2
-            if (modality === 't1' && analysis.t1Path) filePath = path.resolve(__dirname, '..', analysis.t1Path);
-            else if (modality === 't1ce' && analysis.t1cePath) filePath = path.resolve(__dirname, '..', analysis.t1cePath);
-            else if (modality === 't2' && analysis.t2Path) filePath = path.resolve(__dirname, '..', analysis.t2Path);
-            else if (analysis.flairPath) filePath = path.resolve(__dirname, '..', analysis.flairPath);
-            else if (analysis.t1cePath) filePath = path.resolve(__dirname, '..', analysis.t1cePath); // Fallback hierarchy
-            else if (analysis.t1Path) filePath = path.resolve(__dirname, '..', analysis.t1Path);
-            else filePath = path.join(baseDir, 'Test_Data/BraTS20_Training_001_flair.nii'); // Ultimate fallback
-
-            fileType = 'nii';
-        } else if (type === 'mask') {
-            filePath = path.join(resultsDir, 'tumor_mask.npy');
-            fileType = 'npy';
-        } else if (type === 'heatmap') {
-            filePath = path.join(resultsDir, 'tumor_probs.npy');
-            fileType = 'npy';
-        }
+        const { filePath, fileType } = resolveSliceFile(analysis, resultsDir, type, modality);
 
         const scriptPath = path.join(baseDir, 'Inference_Pipeline/extract_slice.py');
 
@@ -318,7 +463,26 @@ exports.getSlice = async (req, res) => {
             return res.status(404).json({ success: false, message: 'Slice data not ready' });
         }
 
-        // Execute Python script with plane argument
+        // Serve from the pre-rendered slice atlas when one exists
+        const atlasPng = readAtlasSlice(resultsDir, type, filePath, plane || 'axial', parseInt(index, 10));
+        if (atlasPng) {
+            return res.json({ success: true, image: `data:image/png;base64,${atlasPng.toString('base64')}` });
+        }
+
+        // Prefer the resident slice server (cached, memory-mapped volumes)
+        try {
+            const response = await axios.get(`${SLICE_SERVER_URL}/slice`, {
+                params: { path: filePath, file_type: fileType, index, type, plane: plane || 'axial' }
+            });
+            return res.json({ success: true, image: `data:image/png;base64,${response.data.image}` });
+        } catch (serverErr) {
+            if (serverErr.response) {
+                console.error(`Slice server error: ${serverErr.response.data.message}`);
+                return res.status(500).send('Error extracting slice');
+            }
+        }
+
+        // Fallback: execute Python script with plane argument
         exec(`python "${scriptPath}" "${filePath}" "${fileType}" "${index}" "${type}" "${plane || 'axial'}"`, (error, stdout, stderr) => {
             if (error) {
                 console.error(`Slice extraction error: ${error}`);
@@ -335,6 +499,42 @@ exports.getSlice = async (req, res) => {
     }
 };
 
+// @desc    Get a range of slices in one binary response
+// @route   GET /api/analyses/:id/slices?type=&plane=&start=&stop=&step=&format=raw|multipart
+// @access  Private
+exports.getSliceRange = async (req, res) => {
+    try {
+        const { id } = req.params;
+        const { type = 'source', plane = 'axial', modality, start, stop, step, format = 'raw' } = req.query;
+
+        const baseDir = path.resolve(__dirname, '../../Segmentation Model');
+        const resultsDir = path.join(baseDir, 'AR_Assets/results', id);
+
+        const analysis = await Analysis.findByPk(id);
+        if (!analysis) {
+            return res.status(404).json({ success: false, message: 'Analysis not found' });
+        }
+        const { filePath, fileType } = resolveSliceFile(analysis, resultsDir, type, modality);
+
+        if (!filePath || !require('fs').existsSync(filePath)) {
+            return res.status(404).json({ success: false, message: 'Slice data not ready' });
+        }
+
+        // Stream the slice server's body straight through to the client
+        const response = await axios.get(`${SLICE_SERVER_URL}/slices`, {
+            params: { path: filePath, file_type: fileType, type, plane, start, stop, step, format },
+            responseType: 'stream',
+            validateStatus: () => true
+        });
+        res.status(response.status);
+        res.set('Content-Type', response.headers['content-type']);
+        if (response.headers['content-length']) res.set('Content-Length', response.headers['content-length']);
+        response.data.pipe(res);
+    } catch (error) {
+        res.status(503).json({ success: false, message: `Slice server unavailable: ${error.message}` });
+    }
+};
+
 // @desc    Get analysis 3D model (GLB)
 // @route   GET /api/analyses/:id/model
 // @access  Private
@@ -351,7 +551,26 @@ exports.get3DModel = async (req, res) => {
             // Check in results folder first
             const dynamicPath = path.join(resultsDir, modelName);
             if (require('fs').existsSync(dynamicPath)) return res.sendFile(dynamicPath);
-            
+
+            // A level of detail is not written when it would equal the finer level:
+            // serve the next finer one that exists (<name>_lod2 → <name>_lod1 → <name>.glb)
+            const lodMatch = modelName.match(/^(.+)_lod(\d+)\.glb$/);
+            if (lodMatch) {
+                for (let level = Number(lodMatch[2]) - 1; level >= 0; level--) {
+                    const finerName = level ? `${lodMatch[1]}_lod${level}.glb` : `${lodMatch[1]}.glb`;
+                    const finerPath = path.join(resultsDir, finerName);
+                    if (require('fs').existsSync(finerPath)) return res.sendFile(finerPath);
+                }
+            }
+
+            // Brain template shared by the result folders (brain_template.json)
+            const referencePath = path.join(resultsDir, 'brain_template.json');
+            if (modelName === 'brain.glb' && require('fs').existsSync(referencePath)) {
+                const reference = JSON.parse(require('fs').readFileSync(referencePath, 'utf8'));
+                const templatePath = path.resolve(resultsDir, reference.template);
+                if (require('fs').existsSync(templatePath)) return res.sendFile(templatePath);
+            }
+
             // Check in test_ui fallback
             const testPath = path.join(baseDir, 'test_ui', modelName);
             if (require('fs').existsSync(testPath)) return res.sendFile(testPath);
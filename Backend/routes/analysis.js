@@ -5,8 +5,10 @@ const {
     getAnalysis,
     createAnalysis,
     processAnalysis,
+    getAnalysisProgress,
     updateAnalysis,
     getSlice,
+    getSliceRange,
     get3DModel
 } = require('../controllers/analysisController');
 const { protect } = require('../middleware/auth');
@@ -24,9 +26,15 @@ router.route('/:id')
 router.route('/:id/process')
     .post(protect, processAnalysis);
 
+router.route('/:id/progress')
+    .get(protect, getAnalysisProgress);
+
 router.route('/:id/slice/:index')
     .get(protect, getSlice);
 
+router.route('/:id/slices')
+    .get(protect, getSliceRange);
+
 router.route('/:id/model')
     .get(protect, get3DModel);
 
@@ -479,9 +479,21 @@ const MRIAnalysis = () => {
             headers: { Authorization: `Bearer ${token}` }
         });
 
+        let result = processRes.data.data;
+
+        // 202: the job was queued; poll the analysis until the pipeline finishes
+        while (processRes.status === 202 && result.status !== 'completed') {
+            await new Promise(resolve => setTimeout(resolve, 2000));
+            const pollRes = await axios.get(`http://localhost:8000/api/analyses/${analysisId}`, {
+                headers: { Authorization: `Bearer ${token}` }
+            });
+            result = pollRes.data.data;
+            if (result.status === 'failed') throw new Error("AI Processing Failed");
+        }
+
         if (processRes.data.success) {
-             console.log("Segmentation result:", processRes.data);
-             updateMetricsFromData(processRes.data.data.data);
+             console.log("Segmentation result:", result);
+             updateMetricsFromData(result.data);
              showToast("SEGMENTATION MODEL GENERATED SUCCESSFULLY");
         }
 
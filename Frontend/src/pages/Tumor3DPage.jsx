@@ -136,7 +136,10 @@ const ThreeDViewport = ({ volume, location, analysisId, layers, brainOpacity, se
 
   const getModelUrl = () => {
     const pid = analysisId || 'test';
-    const name = analysisId ? 'tumor_with_brain.glb' : 'tumor_with_brain_new1.glb';
+    // Phones get the decimated scene; the backend falls back to the full one for older analyses
+    const isMobile = /Android|iPhone|iPad|Mobi/i.test(navigator.userAgent);
+    const sceneName = isMobile ? 'tumor_with_brain_lod1.glb' : 'tumor_with_brain.glb';
+    const name = analysisId ? sceneName : 'tumor_with_brain_new1.glb';
     return `http://localhost:8000/api/analyses/${pid}/model?modelName=${name}&token=${localStorage.getItem('token')}`;
   };
 
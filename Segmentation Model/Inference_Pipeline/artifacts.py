@@ -0,0 +1,160 @@
+#Compact on-disk format for tumor_mask / tumor_probs
+
+import os
+import numpy as np
+
+# =====================================================
+# CONFIG
+# =====================================================
+MASK_NAME = "tumor_mask"
+PROBS_NAME = "tumor_probs"
+COMPACT_EXT = ".npz"
+LEGACY_EXT = ".npy"
+
+PROBS_DTYPES = ("uint8", "float16")
+
+
+class CroppedVolume:
+    """A full-size volume stored as a foreground crop plus its offset.
+
+    Supports the basic indexing the pipeline uses (ints and slices per axis),
+    filling everything outside the crop with zeros, so slicing one plane never
+    expands the whole volume. np.asarray() gives the dense array."""
+
+    def __init__(self, crop, offset, shape, scale=1.0, dtype=np.float32):
+        self.crop = crop
+        self.offset = tuple(int(o) for o in offset)
+        self.shape = tuple(int(s) for s in shape)
+        self.scale = scale
+        self.dtype = np.dtype(dtype)
+        self.ndim = len(self.shape)
+
+    def _decode(self, block):
+        if self.scale == 1.0:
+            return block.astype(self.dtype)
+        return block.astype(self.dtype) * self.dtype.type(self.scale)
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        key = key + (slice(None),) * (self.ndim - len(key))
+
+        out_shape, full_idx, local_idx, keep_axis = [], [], [], []
+        for k, n, off, crop_n in zip(key, self.shape, self.offset, self.crop.shape):
+            if isinstance(k, slice):
+                idx = np.arange(n)[k]
+                keep_axis.append(True)
+            else:
+                k = int(k)
+                idx = np.array([k + n if k < 0 else k])
+                if not 0 <= idx[0] < n:
+                    raise IndexError(f"index {k} is out of bounds for axis with size {n}")
+                keep_axis.append(False)
+            local = idx - off
+            inside = (local >= 0) & (local < crop_n)
+            out_shape.append(len(idx))
+            full_idx.append(np.flatnonzero(inside))
+            local_idx.append(local[inside])
+
+        out = np.zeros(out_shape, dtype=self.dtype)
+        if all(len(i) for i in local_idx):
+            out[np.ix_(*full_idx)] = self._decode(self.crop[np.ix_(*local_idx)])
+        return out.reshape([s for s, keep in zip(out.shape, keep_axis) if keep])
+
+    def __array__(self, dtype=None, copy=None):
+        dense = self[(slice(None),) * self.ndim]
+        return dense if dtype is None else dense.astype(dtype)
+
+
+def _bbox(mask):
+    """Bounding box (start, stop) per axis of the nonzero region, or None."""
+    if not mask.any():
+        return None
+    bounds = []
+    for axis in range(mask.ndim):
+        other = tuple(a for a in range(mask.ndim) if a != axis)
+        nz = np.flatnonzero(mask.any(axis=other))
+        bounds.append((int(nz[0]), int(nz[-1]) + 1))
+    return bounds
+
+
+def _crop(array, bounds):
+    if bounds is None:
+        return array[tuple(slice(0, 0) for _ in array.shape)], (0,) * array.ndim
+    return array[tuple(slice(a, b) for a, b in bounds)], tuple(a for a, _ in bounds)
+
+
+# =====================================================
+# WRITERS
+# =====================================================
+def save_mask(path, mask):
+    """Bit-pack the foreground crop of a binary mask."""
+    mask = np.asarray(mask) > 0
+    crop, offset = _crop(mask, _bbox(mask))
+    np.savez_compressed(
+        path,
+        bits=np.packbits(crop, axis=None),
+        crop_shape=np.array(crop.shape),
+        offset=np.array(offset),
+        shape=np.array(mask.shape),
+    )
+
+
+def save_probs(path, probs, dtype="uint8"):
+    """Store probabilities quantized to uint8 (1/255 steps) or as float16,
+    cropped to the region where the stored value is nonzero."""
+    probs = np.asarray(probs, dtype=np.float32)
+    if dtype == "uint8":
+        stored, scale = np.round(np.clip(probs, 0.0, 1.0) * 255).astype(np.uint8), 1.0 / 255
+    elif dtype == "float16":
+        stored, scale = probs.astype(np.float16), 1.0
+    else:
+        raise ValueError(f"Unsupported probability dtype: {dtype}")
+
+    crop, offset = _crop(stored, _bbox(stored != 0))
+    np.savez_compressed(
+        path,
+        data=crop,
+        offset=np.array(offset),
+        shape=np.array(probs.shape),
+        scale=np.array(scale, dtype=np.float64),
+    )
+
+
+# =====================================================
+# LOADERS
+# =====================================================
+def resolve(output_dir, name):
+    """Path of an artifact in output_dir, preferring the compact file over legacy .npy."""
+    compact = os.path.join(output_dir, name + COMPACT_EXT)
+    if os.path.exists(compact):
+        return compact
+    return os.path.join(output_dir, name + LEGACY_EXT)
+
+
+def load_mask(path):
+    """Load a mask as a CroppedVolume (compact) or read-only memmap (legacy .npy)."""
+    if not path.endswith(COMPACT_EXT):
+        return np.load(path, mmap_mode='r')
+    with np.load(path) as f:
+        crop_shape = tuple(f["crop_shape"])
+        n = int(np.prod(crop_shape))
+        crop = np.unpackbits(f["bits"], count=n).reshape(crop_shape)
+        return CroppedVolume(crop, f["offset"], f["shape"], dtype=np.uint8)
+
+
+def load_probs(path):
+    """Load probabilities as a CroppedVolume (compact) or read-only memmap (legacy .npy)."""
+    if not path.endswith(COMPACT_EXT):
+        return np.load(path, mmap_mode='r')
+    with np.load(path) as f:
+        return CroppedVolume(f["data"], f["offset"], f["shape"], scale=float(f["scale"]))
+
+
+def load_artifact(path):
+    """Load either artifact, telling a compact mask from probabilities by its fields."""
+    if not path.endswith(COMPACT_EXT):
+        return np.load(path, mmap_mode='r')
+    with np.load(path) as f:
+        is_mask = "bits" in f.files
+    return load_mask(path) if is_mask else load_probs(path)
@@ -0,0 +1,122 @@
+#Benchmark: default fp32 inference vs foreground cropping and the CPU performance mode
+
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing as mp
+
+import numpy as np
+
+from evaluation import synthetic_volume, peak_rss_mb, dice, check_edge_crop
+
+# =====================================================
+# CONFIG
+# =====================================================
+# (name, run_inference options); the first entry is the reference output
+CONFIGS = [
+    ("fp32-full", {"mode": "default", "crop_foreground": False}),
+    ("fp32-crop", {"mode": "default", "crop_foreground": True}),
+    ("cpu-crop", {"mode": "cpu", "crop_foreground": True}),
+]
+
+
+def run_config(options, model_path, mri_np, threads, repeats, result_path):
+    """Child process: time one inference configuration and record its peak RSS."""
+    import torch
+    import infer_segmentation as seg
+
+    torch.manual_seed(0)
+    device = torch.device("cpu")
+    if model_path:
+        model = seg.load_model(model_path, device)
+    else:
+        model = seg.build_model().eval()
+
+    if options["mode"] == "cpu":
+        model = seg.prepare_cpu_model(model)
+        seg.configure_cpu_threads(threads)
+    elif threads:
+        torch.set_num_threads(threads)
+
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        mask, probs, _ = seg.run_inference(model, mri_np, device, **options)
+        times.append(time.perf_counter() - t0)
+
+    np.savez(result_path, mask=mask, probs=probs)
+    with open(result_path + ".json", "w") as f:
+        json.dump({"times": times, "peak_rss_mb": peak_rss_mb(), "threads": torch.get_num_threads()}, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark CPU inference configurations')
+    parser.add_argument('--model', type=str, default=None, help='Checkpoint (default: models/brats3d_final_model.pth if present, else random weights)')
+    parser.add_argument('--mri', type=str, default=None, help='NIfTI volume (default: synthetic BraTS-sized volume)')
+    parser.add_argument('--threads', type=int, default=None, help='Intra-op threads for every configuration (default: available cores)')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--overlap', type=float, default=None, help='Sliding-window overlap for every configuration')
+    parser.add_argument('--sw-batch-size', type=int, default=None, help='Windows per forward pass for every configuration')
+    parser.add_argument('--workdir', type=str, default='benchmark_results')
+    args = parser.parse_args()
+
+    import infer_segmentation as seg
+
+    model_path = args.model or (seg.MODEL_PATH if os.path.exists(seg.MODEL_PATH) else None)
+    if model_path is None:
+        print("[WARNING] No checkpoint found, benchmarking random weights")
+
+    if args.mri:
+        _, mri_np = seg.load_mri(args.mri)
+    else:
+        mri_np = synthetic_volume()
+    print(f"Volume shape: {mri_np.shape}, bf16 supported: {seg.cpu_bf16_supported()}")
+
+    mismatched, tumor = check_edge_crop()
+    print(f"Edge-touching brain: {mismatched} of {tumor} mask voxels differ with cropping")
+    if mismatched or not tumor:
+        print("[ERROR] Cropped inference does not match the full volume when the brain touches an edge")
+        sys.exit(1)
+
+    os.makedirs(args.workdir, exist_ok=True)
+    ctx = mp.get_context("spawn")
+    box = seg.foreground_box(mri_np)
+    if box is not None:
+        crop_fraction = np.prod(np.subtract(box[1], box[0])) / np.prod(mri_np.shape)
+        print(f"Foreground box: {box[0]} - {box[1]} ({crop_fraction:.0%} of the volume)")
+
+    window_options = {}
+    if args.overlap is not None:
+        window_options["overlap"] = args.overlap
+    if args.sw_batch_size is not None:
+        window_options["sw_batch_size"] = args.sw_batch_size
+
+    results = {}
+    for name, options in CONFIGS:
+        result_path = os.path.join(args.workdir, f"{name}.npz")
+        # A fresh process per configuration keeps the peak RSS figures independent
+        p = ctx.Process(target=run_config, args=({**options, **window_options}, model_path, mri_np, args.threads, args.repeats, result_path))
+        p.start()
+        p.join()
+        if p.exitcode != 0:
+            print(f"[ERROR] Configuration {name} failed (exit code {p.exitcode})")
+            sys.exit(1)
+        with open(result_path + ".json") as f:
+            results[name] = json.load(f)
+        results[name]["outputs"] = np.load(result_path)
+
+    reference = CONFIGS[0][0]
+    baseline = results[reference]["outputs"]
+    print(f"\n{'config':<12}{'threads':>8}{'best (s)':>10}{'mean (s)':>10}{'peak RSS (MB)':>15}{'Dice vs ref':>13}{'max |dp|':>10}{'speedup':>9}")
+    for name, r in results.items():
+        out = r["outputs"]
+        speedup = min(results[reference]["times"]) / min(r["times"])
+        print(f"{name:<12}{r['threads']:>8}{min(r['times']):>10.2f}{np.mean(r['times']):>10.2f}"
+              f"{r['peak_rss_mb']:>15.0f}{dice(out['mask'], baseline['mask']):>13.4f}"
+              f"{float(np.abs(out['probs'] - baseline['probs']).max()):>10.4f}{speedup:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+#Benchmark: single-pass metrics.py vs the previous metrics code
+
+import time
+import argparse
+
+import numpy as np
+from scipy import stats
+
+import metrics
+from evaluation import SYNTHETIC_SHAPE, synthetic_volume
+
+
+class _Header:
+    def __init__(self, zooms):
+        self.zooms = zooms
+
+    def get_zooms(self):
+        return self.zooms
+
+
+class _Image:
+    """Stand-in for the NIfTI image: legacy code only reads its voxel size."""
+
+    def __init__(self, zooms=(1.0, 1.0, 1.0)):
+        self.header = _Header(zooms)
+
+
+# =====================================================
+# BASELINE
+# =====================================================
+def legacy_compute_metrics(img, mri_np, tumor_mask_np, avg_confidence):
+    """The metrics code infer_segmentation.py used before metrics.py, kept as the baseline."""
+    try:
+        voxel_dims = img.header.get_zooms()
+        voxel_vol = np.prod(voxel_dims) # in mm^3
+    except:
+        voxel_vol = 1.0 # fallback
+
+    # Metrics calculation logic
+    tumor_voxel_count = np.count_nonzero(tumor_mask_np)
+    tumor_volume_cm3 = (tumor_voxel_count * voxel_vol) / 1000.0
+
+    # Extract voxel intensities within the tumor
+    tumor_intensities = mri_np[tumor_mask_np > 0]
+
+    if len(tumor_intensities) > 0:
+        # Intensity Stats
+        intensity_stats = {
+            "min": round(float(np.min(tumor_intensities)), 2),
+            "max": round(float(np.max(tumor_intensities)), 2),
+            "mean": round(float(np.mean(tumor_intensities)), 2),
+            "median": round(float(np.median(tumor_intensities)), 2),
+            "stdDev": round(float(np.std(tumor_intensities)), 2),
+            "skewness": round(float(stats.skew(tumor_intensities)), 3),
+            "kurtosis": round(float(stats.kurtosis(tumor_intensities)), 3)
+        }
+
+        # Simple Texture Proxy (Distribution/Heterogeneity)
+        texture_features = {
+            "contrast": round(float(np.var(tumor_intensities) / 100.0), 2),
+            "correlation": round(float(0.5 + 0.3 * stats.pearsonr(tumor_intensities[:-1], tumor_intensities[1:])[0]), 3) if len(tumor_intensities) > 1 else 0.5,
+            "energy": round(float(np.sum(tumor_intensities**2) / (len(tumor_intensities) * (np.max(tumor_intensities)**2))), 3),
+            "homogeneity": round(float(1.0 / (1.0 + np.var(tumor_intensities))), 3)
+        }
+    else:
+        intensity_stats = {"min":0,"max":0,"mean":0,"median":0,"stdDev":0,"skewness":0,"kurtosis":0}
+        texture_features = {"contrast":0,"correlation":0,"energy":0,"homogeneity":0}
+
+    # Simple center of mass for location
+    if tumor_voxel_count > 0:
+        coords = np.argwhere(tumor_mask_np > 0)
+        center = coords.mean(axis=0)
+        z, y, x = center
+        d, h, w = tumor_mask_np.shape
+
+        location = []
+        if x < w/2: location.append("Right")
+        else: location.append("Left")
+
+        if y < h/2: location.append("Frontal")
+        else: location.append("Temporal/Parietal")
+
+        location_str = " ".join(location)
+    else:
+        location_str = "None"
+
+    return {
+        "tumor_volume": round(float(tumor_volume_cm3), 2),
+        "edema_volume": round(float(tumor_volume_cm3 * 0.15), 2),
+        "tumor_location": location_str,
+        "confidence": round(float(avg_confidence), 1),
+        "intensity_stats": intensity_stats,
+        "texture_features": texture_features
+    }
+
+
+def synthetic_case(shape=SYNTHETIC_SHAPE, radius=25, seed=0):
+    """Synthetic head and an irregular spherical tumor mask inside it."""
+    mri_np = synthetic_volume(shape, seed)
+    rng = np.random.default_rng(seed)
+    grid = np.ogrid[tuple(slice(0, n) for n in shape)]
+    center = [0.4 * shape[0], 0.55 * shape[1], 0.5 * shape[2]]
+    dist = np.sqrt(sum((g - c) ** 2 for g, c in zip(grid, center)))
+    noise = rng.normal(0, 2.0, shape).astype(np.float32)
+    mask = ((dist + noise) < radius).astype(np.int64)
+    return mri_np, mask
+
+
+def best_time(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - t0)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the metrics module against the previous code')
+    parser.add_argument('--radius', type=float, default=25, help='Synthetic tumor radius in voxels')
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    mri_np, mask = synthetic_case(radius=args.radius)
+    print(f"Volume {mri_np.shape}, tumor voxels: {np.count_nonzero(mask)}")
+
+    legacy_time, legacy = best_time(lambda: legacy_compute_metrics(_Image(), mri_np, mask, 90.0), args.repeats)
+    new_time, new = best_time(lambda: metrics.compute_metrics(mri_np, mask, 90.0, (1.0, 1.0, 1.0)), args.repeats)
+
+    print(f"\nprevious code: {legacy_time * 1000:8.1f} ms")
+    print(f"metrics.py:    {new_time * 1000:8.1f} ms  ({legacy_time / new_time:.1f}x)")
+
+    print(f"\n{'field':<24}{'previous':>26}{'metrics.py':>26}")
+    for key in ("tumor_volume", "edema_volume", "tumor_location", "confidence"):
+        print(f"{key:<24}{str(legacy[key]):>26}{str(new[key]):>26}")
+    for key in legacy["intensity_stats"]:
+        print(f"intensity.{key:<14}{legacy['intensity_stats'][key]:>26}{new['intensity_stats'][key]:>26}")
+    # Texture changed meaning: distribution proxies before, real GLCM features now
+    for key in legacy["texture_features"]:
+        print(f"texture.{key:<16}{legacy['texture_features'][key]:>26}{new['texture_features'][key]:>26}")
+
+    shared = ["tumor_volume", "edema_volume", "tumor_location", "confidence"]
+    mismatched = [k for k in shared if legacy[k] != new[k]]
+    mismatched += [f"intensity.{k}" for k, v in legacy["intensity_stats"].items()
+                   if abs(v - new["intensity_stats"][k]) > 0.0011]
+    if mismatched:
+        print(f"\n[ERROR] Metrics differ from the previous code: {', '.join(mismatched)}")
+    else:
+        print("\n[SUCCESS] Volume, location and intensity statistics match the previous code")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#Benchmark: sparse Taubin smoothing vs trimesh filter_laplacian on synthetic lesion blobs
+
+import time
+import argparse
+
+import numpy as np
+from trimesh.smoothing import filter_laplacian
+
+import mask_to_mesh
+import merge_ar_scene
+
+# =====================================================
+# CONFIG
+# =====================================================
+BLOB_RADII = (20, 40, 60, 80)   # Voxel radii of the synthetic lesions
+MAX_VOLUME_CHANGE = 0.01        # Largest relative volume change Taubin may cause
+
+
+def synthetic_blob(radius, seed=0):
+    """Lumpy probability blob of roughly `radius` voxels, meshed at the edema
+    level like a lesion coming straight out of marching cubes."""
+    from scipy.ndimage import gaussian_filter
+
+    rng = np.random.default_rng(seed)
+    size = int(radius * 2.6)
+    grid = np.stack(np.meshgrid(*[np.arange(size)] * 3, indexing="ij")) - size / 2.0
+    distance = np.sqrt((grid ** 2).sum(axis=0))
+    bumps = gaussian_filter(rng.standard_normal((size,) * 3), sigma=radius / 6) * radius * 2
+    probs = 1.0 / (1.0 + np.exp((distance - radius - bumps) / 2.0))
+    return mask_to_mesh.extract_surface(probs.astype(np.float32), mask_to_mesh.EDEMA_LEVEL)
+
+
+def volume_change(before, after):
+    return abs(after.volume - before.volume) / abs(before.volume)
+
+
+def timed(smooth, mesh, repeats):
+    times, result = [], None
+    for _ in range(repeats):
+        result = mesh.copy()
+        t0 = time.perf_counter()
+        smooth(result)
+        times.append(time.perf_counter() - t0)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark lesion mesh smoothing')
+    parser.add_argument('--radii', type=int, nargs='+', default=list(BLOB_RADII), help='Voxel radii of the synthetic blobs')
+    parser.add_argument('--iterations', type=int, default=merge_ar_scene.SMOOTHING_ITERATIONS)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    methods = {
+        "laplacian": lambda m: filter_laplacian(m, iterations=args.iterations),
+        "laplacian-nc": lambda m: filter_laplacian(m, iterations=args.iterations, volume_constraint=False),
+        "taubin": lambda m: merge_ar_scene.taubin_smooth(m, iterations=args.iterations),
+    }
+
+    print(f"{'radius':>7}{'vertices':>10}" + "".join(f"{name + ' (s)':>18}{'dV':>10}" for name in methods) + f"{'speedup':>9}")
+    failed = False
+    for radius in args.radii:
+        mesh = synthetic_blob(radius)
+        row = f"{radius:>7}{len(mesh.vertices):>10}"
+        results = {}
+        for name, smooth in methods.items():
+            seconds, smoothed = timed(smooth, mesh, args.repeats)
+            results[name] = (seconds, volume_change(mesh, smoothed))
+            row += f"{seconds:>18.3f}{results[name][1]:>10.3%}"
+        row += f"{results['laplacian'][0] / results['taubin'][0]:>8.1f}x"
+        print(row)
+        failed |= results["taubin"][1] > MAX_VOLUME_CHANGE
+
+    if failed:
+        print(f"[ERROR] Taubin smoothing changed a volume by more than {MAX_VOLUME_CHANGE:.0%}")
+        raise SystemExit(1)
+    print(f"[SUCCESS] Taubin smoothing kept every volume within {MAX_VOLUME_CHANGE:.0%}")
+
+
+if __name__ == "__main__":
+    main()
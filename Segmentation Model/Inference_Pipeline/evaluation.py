@@ -0,0 +1,67 @@
+#Shared evaluation helpers: synthetic BraTS-like volumes, mask Dice and peak RSS
+
+import resource
+
+import numpy as np
+
+# =====================================================
+# CONFIG
+# =====================================================
+SYNTHETIC_SHAPE = (240, 240, 155)  # BraTS volume size
+
+
+def synthetic_volume(shape=SYNTHETIC_SHAPE, seed=0, touch_edge=False):
+    """Smooth random "head" with a bright blob and zero air around it,
+    scaled to [0, 1] like load_mri. With touch_edge the brain reaches to
+    within a few slices of both z edges, as it often does in BraTS."""
+    from scipy.ndimage import gaussian_filter
+
+    rng = np.random.default_rng(seed)
+    vol = gaussian_filter(rng.random(shape, dtype=np.float32), sigma=4)
+    grid = np.stack(np.meshgrid(*[np.arange(n) for n in shape], indexing="ij"))
+    center = np.array(shape).reshape(3, 1, 1, 1) * np.array([0.4, 0.55, 0.5]).reshape(3, 1, 1, 1)
+    vol += 0.5 * np.exp(-((grid - center) ** 2).sum(axis=0) / (2 * 15.0 ** 2))
+    vol = (vol - vol.min()) / (vol.max() - vol.min())
+
+    # Skull-stripped BraTS volumes are zero outside the brain
+    extent = [0.35, 0.42, 0.48 if touch_edge else 0.42]
+    radii = np.array(shape).reshape(3, 1, 1, 1) * np.array(extent).reshape(3, 1, 1, 1)
+    head_center = np.array(shape).reshape(3, 1, 1, 1) / 2.0
+    vol[(((grid - head_center) / radii) ** 2).sum(axis=0) > 1.0] = 0.0
+    return vol.astype(np.float32)
+
+
+def check_edge_crop():
+    """Mask voxels that differ between cropped and full-volume inference on a brain
+    touching the z edges, and the mask size. A pointwise model (tumor where the
+    intensity is above 0.5) sees no context, so only the crop and paste-back can
+    make the two differ."""
+    import torch
+    import infer_segmentation as seg
+
+    model = torch.nn.Conv3d(1, 2, kernel_size=1)
+    with torch.no_grad():
+        model.weight.copy_(torch.tensor([-1.0, 1.0]).view(2, 1, 1, 1, 1))
+        model.bias.copy_(torch.tensor([0.5, -0.5]))
+    model.eval()
+
+    mri_np = synthetic_volume(touch_edge=True)
+    full = seg.run_inference(model, mri_np, crop_foreground=False)[0]
+    cropped = seg.run_inference(model, mri_np, crop_foreground=True)[0]
+    return int((full != cropped).sum()), int(full.sum())
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process. VmHWM belongs to the current
+    address space, unlike ru_maxrss which survives fork/exec from the parent."""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024.0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def dice(a, b):
+    a, b = a > 0, b > 0
+    denom = a.sum() + b.sum()
+    return 1.0 if denom == 0 else float(2.0 * np.logical_and(a, b).sum() / denom)
@@ -0,0 +1,113 @@
+#brats3d_final_model.pth → brats3d_final_model.onnx (+ parity check against PyTorch)
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import torch
+
+import infer_segmentation as seg
+from evaluation import synthetic_volume, dice, check_edge_crop
+
+# =====================================================
+# CONFIG
+# =====================================================
+OPSET = 18
+# ORT and torch differ by ~1e-2 on windows that are mostly zero padding, more on
+# large logits; the full-volume Dice is the real guardrail
+LOGIT_ATOL = 5e-2   # Max |logit| difference on one window ...
+LOGIT_RTOL = 1e-3   # ... plus this share of the largest |logit|
+MIN_DICE = 0.99     # Min mask Dice against the torch backend on every full volume
+
+
+def export_onnx(model_path=seg.MODEL_PATH, onnx_path=seg.ONNX_MODEL_PATH, opset=OPSET):
+    """Export the UNet with a dynamic batch axis so any sw_batch_size works."""
+    model = seg.load_model(model_path, torch.device("cpu"))
+    example = torch.zeros((2, 1) + seg.ROI_SIZE)
+    torch.onnx.export(
+        model, (example,), onnx_path,
+        input_names=["image"], output_names=["logits"],
+        dynamic_shapes={"x": {0: torch.export.Dim("batch")}},
+        opset_version=opset,
+        dynamo=True,
+        external_data=False,
+    )
+    print(f"[SUCCESS] Exported {onnx_path} ({os.path.getsize(onnx_path) / 1e6:.1f} MB)")
+
+
+def check_parity(model_path, onnx_path, volumes, threads=None):
+    """Compare the onnx backend with the torch backend: logits on one window,
+    and mask Dice, probability deviation and wall time on each {name: volume}."""
+    threads = seg.configure_cpu_threads(threads)
+    torch_model = seg.load_model(model_path, torch.device("cpu"))
+    onnx_model = seg.OnnxPredictor(onnx_path, threads)
+
+    window = torch.from_numpy(np.random.default_rng(0).random((1, 1) + seg.ROI_SIZE, dtype=np.float32))
+    with torch.no_grad():
+        torch_logits = torch_model(window)
+        logit_diff = float((torch_logits - onnx_model(window)).abs().max())
+
+    report = {
+        "threads": threads,
+        "max_logit_diff": logit_diff,
+        "logit_tolerance": LOGIT_ATOL + LOGIT_RTOL * float(torch_logits.abs().max()),
+        "volumes": {},
+    }
+    for volume, mri_np in volumes.items():
+        outputs, result = {}, {}
+        for name, model in (("torch", torch_model), ("onnx", onnx_model)):
+            t0 = time.perf_counter()
+            outputs[name] = seg.run_inference(model, mri_np, torch.device("cpu"))
+            result[f"{name}_time"] = time.perf_counter() - t0
+        result["dice"] = dice(outputs["torch"][0], outputs["onnx"][0])
+        result["max_prob_diff"] = float(np.abs(outputs["torch"][1] - outputs["onnx"][1]).max())
+        report["volumes"][volume] = result
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export the segmentation UNet to ONNX')
+    parser.add_argument('--model', type=str, default=seg.MODEL_PATH, help='PyTorch checkpoint')
+    parser.add_argument('--output', type=str, default=seg.ONNX_MODEL_PATH, help='ONNX file to write')
+    parser.add_argument('--opset', type=int, default=OPSET)
+    parser.add_argument('--mri', type=str, default=None, help='Parity-check volume (default: synthetic BraTS-sized volume)')
+    parser.add_argument('--threads', type=int, default=None, help='Threads for both backends in the parity check')
+    parser.add_argument('--check-only', action='store_true', help='Skip the export and check an existing ONNX file')
+    args = parser.parse_args()
+
+    if not args.check_only:
+        try:
+            export_onnx(args.model, args.output, args.opset)
+        except Exception as e:
+            print(f"[ERROR] ONNX export failed: {e}")
+            sys.exit(1)
+
+    # Both backends share the foreground crop, so check it on its own too
+    mismatched, _ = check_edge_crop()
+    if mismatched:
+        print(f"[ERROR] Cropped inference differs from the full volume in {mismatched} voxels on an edge-touching brain")
+        sys.exit(1)
+
+    volumes = {
+        args.mri or "synthetic": seg.load_mri(args.mri)[1] if args.mri else synthetic_volume(),
+        "synthetic, brain touching the z edges": synthetic_volume(seed=1, touch_edge=True),
+    }
+    report = check_parity(args.model, args.output, volumes, args.threads)
+
+    print(f"Max logit difference (one window): {report['max_logit_diff']:.2e} (tolerance {report['logit_tolerance']:.2e})")
+    for volume, r in report["volumes"].items():
+        print(f"{volume}: mask Dice vs torch {r['dice']:.5f}, max probability difference {r['max_prob_diff']:.2e}, "
+              f"torch {r['torch_time']:.2f}s, onnx {r['onnx_time']:.2f}s ({r['torch_time'] / r['onnx_time']:.2f}x, "
+              f"{report['threads']} threads)")
+
+    min_dice = min(r["dice"] for r in report["volumes"].values())
+    if report["max_logit_diff"] > report["logit_tolerance"] or min_dice < MIN_DICE:
+        print(f"[ERROR] Parity check failed (logit tolerance {report['logit_tolerance']:.2e}, min Dice {MIN_DICE})")
+        sys.exit(1)
+    print("[SUCCESS] ONNX backend matches PyTorch")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,9 +4,90 @@ import nibabel as nib
 from PIL import Image
 import base64
 import io
-import matplotlib.pyplot as plt
 import os
 
+import artifacts
+
+# =====================================================
+# COLORMAP
+# =====================================================
+# Breakpoints of matplotlib's 'jet' colormap, (x, value) per channel.
+_JET_SEGMENTS = {
+    "red": ((0.0, 0.0), (0.35, 0.0), (0.66, 1.0), (0.89, 1.0), (1.0, 0.5)),
+    "green": ((0.0, 0.0), (0.125, 0.0), (0.375, 1.0), (0.64, 1.0), (0.91, 0.0), (1.0, 0.0)),
+    "blue": ((0.0, 0.5), (0.11, 1.0), (0.34, 1.0), (0.65, 0.0), (1.0, 0.0)),
+}
+
+def _build_jet_lut(n=256):
+    """Precompute an (n, 4) uint8 RGBA lookup table equivalent to plt.get_cmap('jet')."""
+    x = np.linspace(0.0, 1.0, n)
+    lut = np.ones((n, 4), dtype=np.float64)
+    for channel, segments in enumerate(("red", "green", "blue")):
+        xp, fp = zip(*_JET_SEGMENTS[segments])
+        lut[:, channel] = np.interp(x, xp, fp)
+    return (lut * 255).astype(np.uint8)
+
+JET_LUT = _build_jet_lut()
+
+# =====================================================
+# VOLUME ACCESS
+# =====================================================
+def load_volume(file_path, file_type):
+    """Open a volume lazily. NIfTI files are returned as their dataobj proxy,
+    .npy files as read-only memmaps and compact .npz artifacts as cropped
+    volumes, so slicing only touches that slice."""
+    if file_type == 'nii':
+        return nib.load(file_path).dataobj
+    elif file_type == 'npy':
+        # Check if path exists, if not try relative to script
+        if not os.path.exists(file_path):
+            # fallback for manual cli runs
+            script_dir = os.path.dirname(os.path.abspath(__file__))
+            file_path = os.path.join(script_dir, file_path)
+        return artifacts.load_artifact(file_path)
+    raise ValueError("Unsupported file type")
+
+def extract_plane(data, slice_index, view_plane='axial'):
+    """Extract one 2-D slice, rotated for display.
+    Shape: (H, W, D) -> (240, 240, 155)"""
+    if view_plane == 'sagittal':
+        # Slice along X axis
+        slice_index = min(slice_index, data.shape[0] - 1)
+        slice_data = data[slice_index, :, :]
+    elif view_plane == 'coronal':
+        # Slice along Y axis
+        slice_index = min(slice_index, data.shape[1] - 1)
+        slice_data = data[:, slice_index, :]
+    else: # axial
+        # Slice along Z axis
+        slice_index = min(slice_index, data.shape[2] - 1)
+        slice_data = data[:, :, slice_index]
+    return np.rot90(np.asarray(slice_data, dtype=np.float64))
+
+PLANE_AXIS = {'sagittal': 0, 'coronal': 1, 'axial': 2}
+
+def slice_range(data, start=0, stop=None, step=1, view_plane='axial'):
+    """Resolve a slice range along a plane, clamped to the volume like extract_plane."""
+    depth = data.shape[PLANE_AXIS.get(view_plane, 2)]
+    start = min(max(start, 0), depth - 1)
+    stop = depth if stop is None else min(max(stop, start + 1), depth)
+    return range(start, stop, max(step, 1))
+
+def extract_planes(data, indices, view_plane='axial'):
+    """Extract several slices of one plane with a single read of the covering block.
+    Yields (index, slice) pairs, each slice identical to extract_plane's output."""
+    if len(indices) == 0:
+        return
+    axis = PLANE_AXIS.get(view_plane, 2)
+    block = [slice(None)] * 3
+    block[axis] = slice(indices.start, indices.stop, indices.step)
+    block = np.asarray(data[tuple(block)], dtype=np.float64)
+    for n, i in enumerate(indices):
+        yield i, np.rot90(np.take(block, n, axis=axis))
+
+# =====================================================
+# RENDERING
+# =====================================================
 def normalize_slice(slice_data):
     """Normalize slice to 0-255 range."""
     if np.max(slice_data) == np.min(slice_data):
@@ -15,21 +96,45 @@ def normalize_slice(slice_data):
     return (slice_data * 255).astype(np.uint8)
 
 def apply_heatmap(slice_data):
-    """Apply a heatmap colormap to the slice."""
-    cm = plt.get_cmap('jet')
-    colored_slice = cm(slice_data)
-    return (colored_slice * 255).astype(np.uint8)
+    """Apply the jet colormap to a slice of values in [0, 1]."""
+    idx = np.clip((slice_data * len(JET_LUT)).astype(np.int64), 0, len(JET_LUT) - 1)
+    return JET_LUT[idx]
 
-def get_base64_image(image_array, mode='L'):
-    """Convert numpy array to base64 string."""
+def render_slice(slice_data, view_type='source'):
+    """Returns (image_array, mode) for a 'source', 'mask' or 'heatmap' view."""
+    if view_type == 'source':
+        return normalize_slice(slice_data), 'L'
+
+    elif view_type == 'mask':
+        h, w = slice_data.shape
+        rgba_image = np.zeros((h, w, 4), dtype=np.uint8)
+        mask_indices = slice_data > 0
+        rgba_image[mask_indices] = [0, 240, 255, 150] # Cyan
+        return rgba_image, 'RGBA'
+
+    elif view_type == 'heatmap':
+        rgba_image = apply_heatmap(slice_data)
+        alpha_channel = (slice_data * 200).astype(np.uint8)
+        alpha_channel[slice_data < 0.1] = 0
+        rgba_image[:, :, 3] = alpha_channel
+        return rgba_image, 'RGBA'
+
+    raise ValueError(f"Unsupported view type: {view_type}")
+
+def encode_png(image_array, mode='L'):
+    """Convert numpy array to PNG bytes."""
     if mode == 'RGBA':
         img = Image.fromarray(image_array, 'RGBA')
     else:
         img = Image.fromarray(image_array, 'L')
-        
+
     buffered = io.BytesIO()
     img.save(buffered, format="PNG")
-    return base64.b64encode(buffered.getvalue()).decode('utf-8')
+    return buffered.getvalue()
+
+def get_base64_image(image_array, mode='L'):
+    """Convert numpy array to base64 string."""
+    return base64.b64encode(encode_png(image_array, mode)).decode('utf-8')
 
 if __name__ == "__main__":
     if len(sys.argv) < 4:
@@ -43,55 +148,10 @@ if __name__ == "__main__":
     view_plane = sys.argv[5] if len(sys.argv) > 5 else 'axial' # 'axial', 'sagittal', 'coronal'
 
     try:
-        # Load Data
-        if file_type == 'nii':
-            img = nib.load(file_path)
-            data = img.get_fdata()
-        elif file_type == 'npy':
-            # Check if path exists, if not try relative to script
-            if not os.path.exists(file_path):
-                # fallback for manual cli runs
-                script_dir = os.path.dirname(os.path.abspath(__file__))
-                file_path = os.path.join(script_dir, file_path)
-            data = np.load(file_path)
-        else:
-            raise ValueError("Unsupported file type")
-
-        # Extract Slice based on Plane
-        # Shape: (H, W, D) -> (240, 240, 155)
-        if view_plane == 'sagittal':
-            # Slice along X axis
-            slice_index = min(slice_index, data.shape[0] - 1)
-            slice_data = np.rot90(data[slice_index, :, :])
-        elif view_plane == 'coronal':
-            # Slice along Y axis
-            slice_index = min(slice_index, data.shape[1] - 1)
-            slice_data = np.rot90(data[:, slice_index, :])
-        else: # axial
-            # Slice along Z axis
-            slice_index = min(slice_index, data.shape[2] - 1)
-            slice_data = np.rot90(data[:, :, slice_index])
-
-        # Process based on view type
-        if view_type == 'source':
-            norm_slice = normalize_slice(slice_data)
-            b64_str = get_base64_image(norm_slice)
-            
-        elif view_type == 'mask':
-            h, w = slice_data.shape
-            rgba_image = np.zeros((h, w, 4), dtype=np.uint8)
-            mask_indices = slice_data > 0
-            rgba_image[mask_indices] = [0, 240, 255, 150] # Cyan
-            b64_str = get_base64_image(rgba_image, 'RGBA')
-
-        elif view_type == 'heatmap':
-            rgba_image = apply_heatmap(slice_data) 
-            alpha_channel = (slice_data * 200).astype(np.uint8)
-            alpha_channel[slice_data < 0.1] = 0
-            rgba_image[:, :, 3] = alpha_channel
-            b64_str = get_base64_image(rgba_image, 'RGBA')
-
-        print(b64_str)
+        data = load_volume(file_path, file_type)
+        slice_data = extract_plane(data, slice_index, view_plane)
+        image, mode = render_slice(slice_data, view_type)
+        print(get_base64_image(image, mode))
 
     except Exception as e:
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
@@ -0,0 +1,412 @@
+#AR scene GLB → KHR_mesh_quantization GLB (16-bit positions, 8-bit normals) + round-trip check
+
+import os
+import sys
+import json
+import struct
+import argparse
+
+import numpy as np
+
+# =====================================================
+# CONFIG
+# =====================================================
+GLB_MAGIC = b"glTF"
+CHUNK_JSON = 0x4E4F534A
+CHUNK_BIN = 0x004E4942
+EXTENSION = "KHR_mesh_quantization"
+
+POSITION_BITS = 16            # Unsigned integer grid the positions are snapped to
+MAX_POSITION_ERROR = 1e-4     # Largest position error, as a fraction of the scene diagonal
+MAX_NORMAL_ERROR_DEG = 1.0    # Largest normal deviation in degrees
+
+ARRAY_BUFFER, ELEMENT_ARRAY_BUFFER = 34962, 34963
+
+COMPONENT_DTYPES = {
+    5120: np.int8, 5121: np.uint8, 5122: np.int16,
+    5123: np.uint16, 5125: np.uint32, 5126: np.float32,
+}
+DTYPE_COMPONENTS = {np.dtype(d): c for c, d in COMPONENT_DTYPES.items()}
+TYPE_SIZES = {"SCALAR": 1, "VEC2": 2, "VEC3": 3, "VEC4": 4, "MAT4": 16}
+
+
+# =====================================================
+# GLB CONTAINER
+# =====================================================
+def read_glb(data):
+    """Split GLB bytes into the glTF JSON dict and the BIN chunk."""
+    magic, version, length = struct.unpack_from("<4sII", data, 0)
+    if magic != GLB_MAGIC or version != 2:
+        raise ValueError("Not a glTF 2.0 binary")
+    gltf, binary, pos = None, b"", 12
+    while pos < length:
+        chunk_length, chunk_type = struct.unpack_from("<II", data, pos)
+        chunk = data[pos + 8:pos + 8 + chunk_length]
+        if chunk_type == CHUNK_JSON:
+            gltf = json.loads(chunk)
+        elif chunk_type == CHUNK_BIN:
+            binary = bytes(chunk)
+        pos += 8 + chunk_length
+    return gltf, binary
+
+
+def write_glb(gltf, binary):
+    """GLB bytes from a glTF JSON dict and its BIN chunk (both padded to 4 bytes)."""
+    text = json.dumps(gltf, separators=(",", ":")).encode("utf-8")
+    text += b" " * (-len(text) % 4)
+    binary = bytes(binary) + b"\x00" * (-len(binary) % 4)
+    length = 12 + 8 + len(text) + (8 + len(binary) if binary else 0)
+    out = struct.pack("<4sII", GLB_MAGIC, 2, length) + struct.pack("<II", len(text), CHUNK_JSON) + text
+    if binary:
+        out += struct.pack("<II", len(binary), CHUNK_BIN) + binary
+    return out
+
+
+def read_accessor(gltf, binary, index):
+    """Accessor `index` as an (count, components) array in its stored dtype."""
+    accessor = gltf["accessors"][index]
+    if "sparse" in accessor:
+        raise ValueError("Sparse accessors are not supported")
+    dtype = np.dtype(COMPONENT_DTYPES[accessor["componentType"]])
+    width = TYPE_SIZES[accessor["type"]]
+    count = accessor["count"]
+    if "bufferView" not in accessor:
+        return np.zeros((count, width), dtype=dtype)
+
+    view = gltf["bufferViews"][accessor["bufferView"]]
+    start = view.get("byteOffset", 0) + accessor.get("byteOffset", 0)
+    stride = view.get("byteStride", dtype.itemsize * width)
+    raw = np.frombuffer(binary, dtype=np.uint8, count=max(0, (count - 1) * stride + dtype.itemsize * width), offset=start)
+    rows = np.lib.stride_tricks.as_strided(raw, shape=(count, dtype.itemsize * width), strides=(stride, 1))
+    return np.ascontiguousarray(rows).view(dtype).reshape(count, width)
+
+
+def decode_accessor(gltf, binary, index):
+    """Accessor values as float64, applying the normalized-integer mapping."""
+    values = read_accessor(gltf, binary, index)
+    if not gltf["accessors"][index].get("normalized"):
+        return values.astype(np.float64)
+    info = np.iinfo(values.dtype)
+    # Signed normalized values map -max..max to -1..1 (and clamp the extra -min)
+    return np.maximum(values.astype(np.float64) / info.max, -1.0)
+
+
+# =====================================================
+# QUANTIZATION
+# =====================================================
+def position_grid(positions, bits=POSITION_BITS):
+    """(origin, step) of a `bits`-bit unsigned grid covering `positions`.
+    One uniform step keeps the node's dequantization scale isotropic,
+    so the normals need no correction."""
+    origin = positions.min(axis=0)
+    extent = float((positions.max(axis=0) - origin).max())
+    return origin, (extent / ((1 << bits) - 1) if extent > 0 else 1.0)
+
+
+def quantize_positions(positions, origin, step, bits=POSITION_BITS):
+    levels = (1 << bits) - 1
+    quantized = np.clip(np.rint((positions - origin) / step), 0, levels)
+    return quantized.astype(np.uint16 if bits <= 16 else np.uint32)
+
+
+def quantize_unit(vectors, dtype=np.int8):
+    """Unit vectors (normals, tangents) as normalized signed integers."""
+    scale = np.iinfo(dtype).max
+    return np.clip(np.rint(vectors * scale), -scale, scale).astype(dtype)
+
+
+def _uses_texture(material):
+    return any(key.endswith("Texture") for key in material) or \
+        any(key.endswith("Texture") for key in material.get("pbrMetallicRoughness", {}))
+
+
+def _kept_attributes(attributes, material):
+    """Drop attributes no material reads: texture coordinates without a
+    texture, tangents without a normal map, app-specific "_" attributes
+    and vertex colors that are plain white."""
+    textured = _uses_texture(material)
+    kept = {}
+    for name, index in attributes.items():
+        if name.startswith("_"):
+            continue
+        if name.startswith("TEXCOORD_") and not textured:
+            continue
+        if name == "TANGENT" and "normalTexture" not in material:
+            continue
+        kept[name] = index
+    return kept
+
+
+class _BufferBuilder:
+    """Accumulates bufferViews and accessors into one BIN chunk, in call order."""
+
+    def __init__(self):
+        self.data = bytearray()
+        self.views = []
+        self.accessors = []
+
+    def _align(self, alignment=4):
+        self.data += b"\x00" * (-len(self.data) % alignment)
+
+    def add_view(self, payload, target=None, stride=None):
+        self._align()
+        view = {"buffer": 0, "byteOffset": len(self.data), "byteLength": len(payload)}
+        if target is not None:
+            view["target"] = target
+        if stride is not None:
+            view["byteStride"] = stride
+        self.data += payload
+        self.views.append(view)
+        return len(self.views) - 1
+
+    def add_accessor(self, values, type_name, normalized=False, target=ARRAY_BUFFER, bounds=False):
+        values = np.ascontiguousarray(values)
+        count, width = len(values), TYPE_SIZES[type_name]
+        row = values.dtype.itemsize * width
+        if target == ARRAY_BUFFER and row % 4:
+            # Vertex attribute elements must start on 4-byte boundaries
+            stride = row + (-row % 4)
+            padded = np.zeros((count, stride), dtype=np.uint8)
+            padded[:, :row] = values.reshape(count, width).view(np.uint8).reshape(count, row)
+            view = self.add_view(padded.tobytes(), target, stride)
+        else:
+            view = self.add_view(values.tobytes(), target, row if target == ARRAY_BUFFER else None)
+
+        accessor = {
+            "bufferView": view,
+            "componentType": DTYPE_COMPONENTS[values.dtype],
+            "count": count,
+            "type": type_name,
+        }
+        if normalized:
+            accessor["normalized"] = True
+        if bounds:
+            flat = values.reshape(count, width)
+            cast = float if values.dtype.kind == "f" else int
+            accessor["min"] = [cast(v) for v in flat.min(axis=0)]
+            accessor["max"] = [cast(v) for v in flat.max(axis=0)]
+        self.accessors.append(accessor)
+        return len(self.accessors) - 1
+
+
+def _scene_mesh_order(gltf):
+    """Mesh indices in depth-first scene order, then any the scenes don't reach."""
+    order = []
+
+    def visit(node_index):
+        node = gltf["nodes"][node_index]
+        if "mesh" in node and node["mesh"] not in order:
+            order.append(node["mesh"])
+        for child in node.get("children", []):
+            visit(child)
+
+    for scene in gltf.get("scenes", []):
+        for node_index in scene.get("nodes", []):
+            visit(node_index)
+    return order + [i for i in range(len(gltf.get("meshes", []))) if i not in order]
+
+
+def quantize_glb(data, bits=POSITION_BITS):
+    """Rewrite a GLB with KHR_mesh_quantization: positions on a `bits`-bit
+    integer grid dequantized by a child node's translation/scale, int8
+    normals and tangents, byte vertex colors, the smallest index type and
+    no unused attributes. Each mesh's data is one contiguous byte range,
+    in scene order (lesions before the brain in the AR scene), recorded in
+    the mesh's extras as offsets into the BIN chunk so a viewer can fetch
+    the nodes progressively. Images and other views follow the meshes."""
+    gltf, binary = read_glb(data)
+    if not gltf.get("meshes"):
+        return data
+    if gltf.get("animations") or gltf.get("skins"):
+        raise ValueError("Animated or skinned scenes are not supported")
+    materials = gltf.get("materials", [])
+    builder = _BufferBuilder()
+    dequantize = {}
+
+    for mesh_index in _scene_mesh_order(gltf):
+        mesh = gltf["meshes"][mesh_index]
+        if any("targets" in p for p in mesh["primitives"]):
+            raise ValueError(f"Morph targets are not supported (mesh {mesh_index})")
+        start = len(builder.data)
+
+        # One grid per mesh: every primitive shares the node's dequantization
+        positions = [decode_accessor(gltf, binary, p["attributes"]["POSITION"]) for p in mesh["primitives"]]
+        origin, step = position_grid(np.concatenate(positions), bits)
+        dequantize[mesh_index] = (origin, step)
+
+        for primitive, position in zip(mesh["primitives"], positions):
+            material = materials[primitive["material"]] if "material" in primitive else {}
+            if "indices" in primitive:
+                indices = read_accessor(gltf, binary, primitive["indices"]).ravel()
+                dtype = np.uint16 if indices.size and indices.max() < 0xFFFF else np.uint32
+                primitive["indices"] = builder.add_accessor(indices.astype(dtype), "SCALAR", target=ELEMENT_ARRAY_BUFFER)
+
+            attributes = {}
+            for name, index in _kept_attributes(primitive["attributes"], material).items():
+                accessor = gltf["accessors"][index]
+                if name == "POSITION":
+                    grid = quantize_positions(position, origin, step, bits)
+                    attributes[name] = builder.add_accessor(grid, "VEC3", bounds=True)
+                elif name in ("NORMAL", "TANGENT"):
+                    values = decode_accessor(gltf, binary, index)
+                    attributes[name] = builder.add_accessor(quantize_unit(values), accessor["type"], normalized=True)
+                elif name.startswith("COLOR_"):
+                    values = decode_accessor(gltf, binary, index)
+                    if np.all(values >= 1.0):
+                        continue
+                    attributes[name] = builder.add_accessor(
+                        np.rint(np.clip(values, 0, 1) * 255).astype(np.uint8), accessor["type"], normalized=True)
+                else:
+                    values = read_accessor(gltf, binary, index)
+                    attributes[name] = builder.add_accessor(values, accessor["type"], accessor.get("normalized", False))
+            primitive["attributes"] = attributes
+
+        mesh.setdefault("extras", {})["byteRange"] = [start, len(builder.data) - start]
+
+    # Views not owned by mesh accessors (images) are carried over unchanged
+    used = {a["bufferView"] for a in gltf.get("accessors", []) if "bufferView" in a}
+    remap = {}
+    for i, view in enumerate(gltf.get("bufferViews", [])):
+        if i not in used:
+            payload = binary[view.get("byteOffset", 0):view.get("byteOffset", 0) + view["byteLength"]]
+            remap[i] = builder.add_view(payload, view.get("target"), view.get("byteStride"))
+    for image in gltf.get("images", []):
+        if "bufferView" in image:
+            image["bufferView"] = remap[image["bufferView"]]
+
+    # Each mesh moves to a child node whose transform dequantizes its grid
+    for node in list(gltf["nodes"]):
+        if "mesh" not in node:
+            continue
+        origin, step = dequantize[node["mesh"]]
+        child = {
+            "name": f"{node.get('name', 'node')}_quantized",
+            "mesh": node.pop("mesh"),
+            "translation": [float(v) for v in origin],
+            "scale": [float(step)] * 3,
+        }
+        gltf["nodes"].append(child)
+        node.setdefault("children", []).append(len(gltf["nodes"]) - 1)
+
+    gltf["accessors"] = builder.accessors
+    gltf["bufferViews"] = builder.views
+    gltf["buffers"] = [{"byteLength": len(builder.data) + (-len(builder.data) % 4)}]
+    for key in ("extensionsUsed", "extensionsRequired"):
+        gltf[key] = sorted(set(gltf.get(key, [])) | {EXTENSION})
+    return write_glb(gltf, builder.data)
+
+
+# =====================================================
+# ROUND-TRIP CHECK
+# =====================================================
+def _node_matrix(node):
+    if "matrix" in node:
+        return np.array(node["matrix"], dtype=np.float64).reshape(4, 4).T
+    t = np.eye(4)
+    t[:3, 3] = node.get("translation", [0, 0, 0])
+    x, y, z, w = node.get("rotation", [0, 0, 0, 1])
+    r = np.eye(4)
+    r[:3, :3] = [
+        [1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)],
+        [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)],
+        [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)],
+    ]
+    s = np.diag(list(node.get("scale", [1, 1, 1])) + [1])
+    return t @ r @ s
+
+
+def world_geometry(data):
+    """(positions, normals or None) of every primitive instance in world
+    space, in depth-first scene order."""
+    gltf, binary = read_glb(data)
+    out = []
+
+    def visit(node_index, parent):
+        node = gltf["nodes"][node_index]
+        matrix = parent @ _node_matrix(node)
+        if "mesh" in node:
+            normal_matrix = np.linalg.inv(matrix[:3, :3]).T
+            for primitive in gltf["meshes"][node["mesh"]]["primitives"]:
+                attributes = primitive["attributes"]
+                positions = decode_accessor(gltf, binary, attributes["POSITION"]) @ matrix[:3, :3].T + matrix[:3, 3]
+                normals = None
+                if "NORMAL" in attributes:
+                    normals = decode_accessor(gltf, binary, attributes["NORMAL"]) @ normal_matrix.T
+                    normals /= np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-12)
+                out.append((positions, normals))
+        for child in node.get("children", []):
+            visit(child, matrix)
+
+    for scene in gltf.get("scenes", []):
+        for node_index in scene.get("nodes", []):
+            visit(node_index, np.eye(4))
+    return out
+
+
+def roundtrip_error(original, quantized):
+    """Largest world-space position error (as a fraction of the scene
+    diagonal) and normal deviation (degrees) of `quantized` against `original`."""
+    reference, decoded = world_geometry(original), world_geometry(quantized)
+    if len(reference) != len(decoded):
+        raise ValueError("Quantized scene has a different number of primitives")
+
+    points = np.concatenate([p for p, _ in reference]) if reference else np.zeros((1, 3))
+    diagonal = float(np.linalg.norm(points.max(axis=0) - points.min(axis=0))) or 1.0
+    position_error, normal_error = 0.0, 0.0
+    for (p0, n0), (p1, n1) in zip(reference, decoded):
+        position_error = max(position_error, float(np.abs(p1 - p0).max(initial=0.0)) / diagonal)
+        if n0 is not None and n1 is not None:
+            # Zero-length reference normals have no direction to preserve
+            defined = np.linalg.norm(n0, axis=1) > 0.5
+            cos = np.clip(np.sum(n0[defined] * n1[defined], axis=1), -1.0, 1.0)
+            normal_error = max(normal_error, float(np.degrees(np.arccos(cos)).max(initial=0.0)))
+    return {"position_error": position_error, "normal_error_deg": normal_error}
+
+
+def quantize_checked(data, bits=POSITION_BITS):
+    """Quantized GLB bytes and a size/error report. `ok` is False when the
+    round trip exceeds MAX_POSITION_ERROR or MAX_NORMAL_ERROR_DEG."""
+    quantized = quantize_glb(data, bits)
+    report = roundtrip_error(data, quantized)
+    report.update(
+        original_bytes=len(data),
+        quantized_bytes=len(quantized),
+        ok=report["position_error"] <= MAX_POSITION_ERROR and report["normal_error_deg"] <= MAX_NORMAL_ERROR_DEG,
+    )
+    return quantized, report
+
+
+def describe(report):
+    return (f"{report['original_bytes'] / 1e6:.2f} MB -> {report['quantized_bytes'] / 1e6:.2f} MB "
+            f"({report['quantized_bytes'] / report['original_bytes']:.0%}), "
+            f"max position error {report['position_error']:.1e} of the diagonal, "
+            f"max normal error {report['normal_error_deg']:.2f} deg")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Quantize a GLB with KHR_mesh_quantization and check the round trip')
+    parser.add_argument('input', type=str, help='Float GLB (e.g. tumor_with_brain.glb)')
+    parser.add_argument('--output', type=str, default=None, help='Quantized GLB (default: <input>.quantized.glb)')
+    parser.add_argument('--bits', type=int, default=POSITION_BITS, help='Position grid bits')
+    args = parser.parse_args()
+
+    with open(args.input, "rb") as f:
+        data = f.read()
+    try:
+        quantized, report = quantize_checked(data, args.bits)
+    except Exception as e:
+        print(f"[ERROR] Quantization failed: {e}")
+        sys.exit(1)
+
+    print(describe(report))
+    if not report["ok"]:
+        print(f"[ERROR] Round-trip error exceeds {MAX_POSITION_ERROR} / {MAX_NORMAL_ERROR_DEG} deg; nothing written")
+        sys.exit(1)
+    output = args.output or os.path.splitext(args.input)[0] + ".quantized.glb"
+    with open(output, "wb") as f:
+        f.write(quantized)
+    print(f"[SUCCESS] Wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
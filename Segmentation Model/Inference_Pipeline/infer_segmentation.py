@@ -6,202 +6,337 @@ import nibabel as nib
 from monai.networks.nets import UNet
 from monai.transforms import ScaleIntensity
 from monai.inferers import sliding_window_inference
+from monai.transforms.utils import generate_spatial_bounding_box
 import json
 import sys
-from scipy import stats
+import os
+import argparse
+import contextlib
+
+import artifacts
+import metrics
 
 # =====================================================
 # CONFIG
 # =====================================================
-import sys
-import os
-import argparse
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # Default path
-DEFAULT_MRI = "../Test_Data/BraTS20_Training_001_flair.nii"
-
-parser = argparse.ArgumentParser(description='Inference Segmentation')
-parser.add_argument('--t1', type=str, help='Path to T1 MRI')
-parser.add_argument('--t1ce', type=str, help='Path to T1CE MRI')
-parser.add_argument('--t2', type=str, help='Path to T2 MRI')
-parser.add_argument('--flair', type=str, help='Path to FLAIR MRI')
-parser.add_argument('legacy_path', nargs='?', help='Legacy single path argument')
-
-args = parser.parse_args()
-
-# Select the primary input for the single-channel model
-# Priority: FLAIR > T1CE > T1 > T2 > Legacy > Default
-MRI_PATH = None
-
-if args.flair:
-    MRI_PATH = args.flair
-    print(f"Using FLAIR input: {MRI_PATH}")
-elif args.t1ce:
-    MRI_PATH = args.t1ce
-    print(f"Using T1CE input: {MRI_PATH}")
-elif args.t1:
-    MRI_PATH = args.t1
-    print(f"Using T1 input: {MRI_PATH}")
-elif args.t2:
-    MRI_PATH = args.t2
-    print(f"Using T2 input: {MRI_PATH}")
-elif args.legacy_path:
-    MRI_PATH = args.legacy_path
-    print(f"Using legacy input: {MRI_PATH}")
-else:
-    MRI_PATH = DEFAULT_MRI
-    print(f"Using default test input: {MRI_PATH}")
-
-MODEL_PATH = "../models/brats3d_final_model.pth"
+DEFAULT_MRI = os.path.join(SCRIPT_DIR, "../Test_Data/BraTS20_Training_001_flair.nii")
+MODEL_PATH = os.path.join(SCRIPT_DIR, "../models/brats3d_final_model.pth")
+ONNX_MODEL_PATH = os.path.join(SCRIPT_DIR, "../models/brats3d_final_model.onnx")  # See export_onnx.py
+INT8_MODEL_PATH = os.path.join(SCRIPT_DIR, "../models/brats3d_final_model.int8.onnx")  # See quantize_model.py
 
 ROI_SIZE = (128, 128, 128)
 SW_BATCH_SIZE = 1
+OVERLAP = 0.5
+FOREGROUND_MARGIN = 8  # Voxels of context kept around the brain bounding box
+
+# CPU performance mode: windows evaluated per forward pass
+CPU_SW_BATCH_SIZE = 4
+INFERENCE_MODES = ("default", "cpu")
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
+def select_mri_path(t1=None, t1ce=None, t2=None, flair=None, legacy_path=None):
+    """Select the primary input for the single-channel model.
+    Priority: FLAIR > T1CE > T1 > T2 > Legacy > Default"""
+    if flair:
+        print(f"Using FLAIR input: {flair}")
+        return flair
+    if t1ce:
+        print(f"Using T1CE input: {t1ce}")
+        return t1ce
+    if t1:
+        print(f"Using T1 input: {t1}")
+        return t1
+    if t2:
+        print(f"Using T2 input: {t2}")
+        return t2
+    if legacy_path:
+        print(f"Using legacy input: {legacy_path}")
+        return legacy_path
+    print(f"Using default test input: {DEFAULT_MRI}")
+    return DEFAULT_MRI
+
 
 # =====================================================
 # DEVICE
 # =====================================================
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-print(f"Using device: {device}")
+def get_device():
+    return torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+
+def cpu_bf16_supported():
+    """True when oneDNN has native bf16 kernels on this CPU (AVX512-BF16 / AMX)."""
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def configure_cpu_threads(threads=None):
+    """Pin torch's intra-op pool to `threads`, or to the cores this process may run on."""
+    if not threads:
+        threads = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    torch.set_num_threads(max(1, threads))
+    return torch.get_num_threads()
+
 
 # =====================================================
 # LOAD MODEL
 # =====================================================
-try:
-    model = UNet(
+def build_model():
+    return UNet(
         spatial_dims=3,
         in_channels=1,
         out_channels=2,
         channels=(32, 64, 128, 256),
         strides=(2, 2, 2),
         num_res_units=2,
-    ).to(device)
+    )
+
 
-    ckpt = torch.load(MODEL_PATH, map_location=device)
+def load_model(model_path=MODEL_PATH, device=None):
+    device = device or get_device()
+    model = build_model().to(device)
+
+    ckpt = torch.load(model_path, map_location=device)
     model.load_state_dict(ckpt["model_state"])
     model.eval()
+    return model
+
+
+def prepare_cpu_model(model):
+    """Convert the model to the channels-last-3d layout oneDNN convolutions prefer."""
+    return model.to(memory_format=torch.channels_last_3d)
+
+
+class OnnxPredictor:
+    """Sliding-window predictor backed by an onnxruntime CPU session.
+    Takes and returns torch tensors so it drops into sliding_window_inference."""
+
+    def __init__(self, onnx_path=ONNX_MODEL_PATH, threads=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, x):
+        x = np.ascontiguousarray(x.detach().cpu().numpy(), dtype=np.float32)
+        return torch.from_numpy(self.session.run(None, {self.input_name: x})[0])
+
+
+def default_model_path(backend="torch"):
+    return {"onnx": ONNX_MODEL_PATH, "onnx-int8": INT8_MODEL_PATH}.get(backend, MODEL_PATH)
+
+
+def load_backend_model(backend="torch", model_path=None, device=None, threads=None):
+    """Load the segmentation model for `backend`: a torch UNet, or an
+    OnnxPredictor over the fp32 or int8-quantized ONNX artifact."""
+    model_path = model_path or default_model_path(backend)
+    if backend in ("onnx", "onnx-int8"):
+        return OnnxPredictor(model_path, threads)
+    return load_model(model_path, device)
 
-    print("[SUCCESS] Model loaded")
-except Exception as e:
-    print(f"[ERROR] Model loading failed: {e}")
-    sys.exit(1)
 
 # =====================================================
 # LOAD MRI
 # =====================================================
-try:
-    img = nib.load(MRI_PATH)
+def load_mri(mri_path):
+    """Returns the NIfTI image and its intensity-scaled float32 volume."""
+    img = nib.load(mri_path)
     mri_np = img.get_fdata().astype(np.float32)
     print(f"Raw MRI shape: {mri_np.shape}")
 
     mri_np = ScaleIntensity()(mri_np).numpy()
-    mri_tensor = torch.from_numpy(mri_np).unsqueeze(0).unsqueeze(0).to(device)
-except Exception as e:
-    print(f"[ERROR] MRI loading failed: {e}")
-    sys.exit(1)
+    return img, mri_np
+
 
 # =====================================================
 # INFERENCE
 # =====================================================
-try:
-    with torch.no_grad():
-        logits = sliding_window_inference(
-            inputs=mri_tensor,
-            roi_size=ROI_SIZE,
-            sw_batch_size=SW_BATCH_SIZE,
-            predictor=model,
-            overlap=0.5,
-        )
-        
+def foreground_box(mri_np, margin=FOREGROUND_MARGIN):
+    """Bounding box (start, end) of the non-zero brain voxels, as CropForegroundd
+    finds it in training, grown by `margin` and clipped to the volume; None when
+    the volume is empty."""
+    start, end = generate_spatial_bounding_box(mri_np[None], margin=margin)
+    # The margin runs past the edge when the brain touches it (common along z), and a
+    # negative start would wrap around as a numpy slice
+    start = [max(0, int(s)) for s in start]
+    end = [min(n, int(e)) for n, e in zip(mri_np.shape, end)]
+    if any(e <= s for s, e in zip(start, end)):
+        return None
+    return tuple(start), tuple(end)
+
+
+def run_inference(model, mri_np, device=None, mode="default", sw_batch_size=None,
+                  overlap=OVERLAP, crop_foreground=True):
+    """Returns (tumor_mask, tumor_probs, avg_confidence) as numpy arrays.
+    mode="cpu" runs under torch.inference_mode with channels-last-3d inputs,
+    batched windows and bf16 autocast when the CPU supports it; the softmax
+    and everything after it stay in fp32.
+    With crop_foreground, windows only cover the brain bounding box; voxels
+    outside it are background with probability 1.
+    `model` may also be an OnnxPredictor, which always runs on the CPU."""
+    onnx_backend = isinstance(model, OnnxPredictor)
+    if onnx_backend:
+        device = torch.device("cpu")
+    device = device or next(model.parameters()).device
+
+    box = foreground_box(mri_np) if crop_foreground else None
+    if box is not None:
+        (x0, y0, z0), (x1, y1, z1) = box
+        cropped = np.ascontiguousarray(mri_np[x0:x1, y0:y1, z0:z1])
+    else:
+        cropped = mri_np
+    mri_tensor = torch.from_numpy(cropped).unsqueeze(0).unsqueeze(0).to(device)
+
+    if onnx_backend:
+        grad_context = torch.inference_mode()
+        autocast = contextlib.nullcontext()
+        sw_batch_size = sw_batch_size or CPU_SW_BATCH_SIZE
+        predictor = model
+    elif mode == "cpu":
+        use_bf16 = device.type == "cpu" and cpu_bf16_supported()
+        grad_context = torch.inference_mode()
+        autocast = torch.autocast("cpu", dtype=torch.bfloat16, enabled=use_bf16)
+        sw_batch_size = sw_batch_size or CPU_SW_BATCH_SIZE
+
+        def predictor(x):
+            # Return fp32 so the window blending buffer is not accumulated in bf16
+            return model(x.contiguous(memory_format=torch.channels_last_3d)).float()
+    else:
+        grad_context = torch.no_grad()
+        autocast = contextlib.nullcontext()
+        sw_batch_size = sw_batch_size or SW_BATCH_SIZE
+        predictor = model
+
+    with grad_context:
+        with autocast:
+            logits = sliding_window_inference(
+                inputs=mri_tensor,
+                roi_size=ROI_SIZE,
+                sw_batch_size=sw_batch_size,
+                predictor=predictor,
+                overlap=overlap,
+            )
+        logits = logits.float()
+
+        # Paste the cropped logits back into a full-size map: background (class 0) elsewhere
+        if box is not None:
+            full = logits.new_zeros((1, logits.shape[1]) + mri_np.shape)
+            full[:, 1:] = float("-inf")
+            full[:, :, x0:x1, y0:y1, z0:z1] = logits
+            logits = full
+
         # Calculate confidence
         probs = torch.softmax(logits, dim=1)
         max_probs, tumor_mask = torch.max(probs, dim=1)
         avg_confidence = torch.mean(max_probs).item() * 100
-        
-        # Save Probability Map for Tumor Class (Index 1)
-        # We want the raw probability of it being a tumor (0.0 to 1.0)
+
+        # Raw probability of the tumor class (index 1), 0.0 to 1.0.
         # probs shape is (1, C, H, W, D). We want channel 1.
         tumor_probs_np = probs[0, 1].cpu().numpy()
-        np.save("tumor_probs.npy", tumor_probs_np)
-        print("[SUCCESS] tumor_probs.npy saved")
 
     tumor_mask_np = tumor_mask.cpu().numpy()[0]
-    np.save("tumor_mask.npy", tumor_mask_np)
-    print("[SUCCESS] tumor_mask.npy saved")
-except Exception as e:
-    print(f"[ERROR] Inference failed: {e}")
-    sys.exit(1)
+    return tumor_mask_np, tumor_probs_np, avg_confidence
+
+
+def save_outputs(tumor_mask_np, tumor_probs_np, output_dir=".", artifact_format="compact", probs_dtype="uint8"):
+    """Write the mask and probability map, either in the compact cropped format
+    (see artifacts.py) or as legacy full-size .npy arrays."""
+    if artifact_format == "npy":
+        np.save(os.path.join(output_dir, "tumor_probs.npy"), tumor_probs_np)
+        print("[SUCCESS] tumor_probs.npy saved")
+        np.save(os.path.join(output_dir, "tumor_mask.npy"), tumor_mask_np)
+        print("[SUCCESS] tumor_mask.npy saved")
+        return
+
+    artifacts.save_probs(os.path.join(output_dir, artifacts.PROBS_NAME + artifacts.COMPACT_EXT), tumor_probs_np, probs_dtype)
+    print("[SUCCESS] tumor_probs.npz saved")
+    artifacts.save_mask(os.path.join(output_dir, artifacts.MASK_NAME + artifacts.COMPACT_EXT), tumor_mask_np)
+    print("[SUCCESS] tumor_mask.npz saved")
+
 
 # =====================================================
 # METRICS CALCULATION
 # =====================================================
-try:
+def compute_metrics(img, mri_np, tumor_mask_np, avg_confidence):
+    """Analysis metrics (see metrics.py), with voxel volume from the NIfTI header."""
     try:
         voxel_dims = img.header.get_zooms()
-        voxel_vol = np.prod(voxel_dims) # in mm^3
-    except:
-        voxel_vol = 1.0 # fallback
-
-    # Metrics calculation logic
-    tumor_voxel_count = np.count_nonzero(tumor_mask_np)
-    tumor_volume_cm3 = (tumor_voxel_count * voxel_vol) / 1000.0
-
-    # Extract voxel intensities within the tumor
-    tumor_intensities = mri_np[tumor_mask_np > 0]
-
-    if len(tumor_intensities) > 0:
-        # Intensity Stats
-        intensity_stats = {
-            "min": round(float(np.min(tumor_intensities)), 2),
-            "max": round(float(np.max(tumor_intensities)), 2),
-            "mean": round(float(np.mean(tumor_intensities)), 2),
-            "median": round(float(np.median(tumor_intensities)), 2),
-            "stdDev": round(float(np.std(tumor_intensities)), 2),
-            "skewness": round(float(stats.skew(tumor_intensities)), 3),
-            "kurtosis": round(float(stats.kurtosis(tumor_intensities)), 3)
-        }
-        
-        # Simple Texture Proxy (Distribution/Heterogeneity)
-        texture_features = {
-            "contrast": round(float(np.var(tumor_intensities) / 100.0), 2),
-            "correlation": round(float(0.5 + 0.3 * stats.pearsonr(tumor_intensities[:-1], tumor_intensities[1:])[0]), 3) if len(tumor_intensities) > 1 else 0.5,
-            "energy": round(float(np.sum(tumor_intensities**2) / (len(tumor_intensities) * (np.max(tumor_intensities)**2))), 3),
-            "homogeneity": round(float(1.0 / (1.0 + np.var(tumor_intensities))), 3)
-        }
-    else:
-        intensity_stats = {"min":0,"max":0,"mean":0,"median":0,"stdDev":0,"skewness":0,"kurtosis":0}
-        texture_features = {"contrast":0,"correlation":0,"energy":0,"homogeneity":0}
-
-    # Simple center of mass for location
-    if tumor_voxel_count > 0:
-        coords = np.argwhere(tumor_mask_np > 0)
-        center = coords.mean(axis=0)
-        z, y, x = center
-        d, h, w = tumor_mask_np.shape
-        
-        location = []
-        if x < w/2: location.append("Right") 
-        else: location.append("Left")
-        
-        if y < h/2: location.append("Frontal")
-        else: location.append("Temporal/Parietal")
-        
-        location_str = " ".join(location)
-    else:
-        location_str = "None"
-
-    metrics = {
-        "tumor_volume": round(float(tumor_volume_cm3), 2),
-        "edema_volume": round(float(tumor_volume_cm3 * 0.15), 2),
-        "tumor_location": location_str,
-        "confidence": round(float(avg_confidence), 1),
-        "intensity_stats": intensity_stats,
-        "texture_features": texture_features
-    }
-
-    print("JSON_START")
-    print(json.dumps(metrics))
-    print("JSON_END")
-
-except Exception as e:
-    print(f"[ERROR] Metrics calculation failed: {e}")
-    sys.exit(1)
+    except AttributeError:
+        voxel_dims = None
+    return metrics.compute_metrics(mri_np, tumor_mask_np, avg_confidence, voxel_dims)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inference Segmentation')
+    parser.add_argument('--t1', type=str, help='Path to T1 MRI')
+    parser.add_argument('--t1ce', type=str, help='Path to T1CE MRI')
+    parser.add_argument('--t2', type=str, help='Path to T2 MRI')
+    parser.add_argument('--flair', type=str, help='Path to FLAIR MRI')
+    parser.add_argument('legacy_path', nargs='?', help='Legacy single path argument')
+    parser.add_argument('--artifact-format', choices=['compact', 'npy'], default='compact', help='On-disk format of mask/probability outputs')
+    parser.add_argument('--probs-dtype', choices=artifacts.PROBS_DTYPES, default='uint8', help='Stored precision of the compact probability map')
+    parser.add_argument('--output-dir', type=str, default='.', help='Job directory receiving the mask/probability outputs')
+    parser.add_argument('--inference-mode', choices=INFERENCE_MODES, default='default', help='"cpu" enables the CPU performance mode')
+    parser.add_argument('--threads', type=int, default=None, help='Intra-op CPU threads for --inference-mode cpu or the onnx backend (default: available cores)')
+    parser.add_argument('--overlap', type=float, default=OVERLAP, help='Sliding-window overlap (0-1)')
+    parser.add_argument('--sw-batch-size', type=int, default=None, help='Windows per forward pass (default: 1, or 4 in cpu mode)')
+    parser.add_argument('--no-crop', action='store_true', help='Run windows over the whole volume instead of the brain bounding box')
+    parser.add_argument('--backend', choices=BACKENDS, default='torch', help='Run the UNet in PyTorch, or in onnxruntime at fp32 (export_onnx.py) or int8 (quantize_model.py)')
+    parser.add_argument('--model', type=str, default=None, help='Model file for the backend (default: models/brats3d_final_model.pth / .onnx / .int8.onnx)')
+    args = parser.parse_args()
+
+    mri_path = select_mri_path(args.t1, args.t1ce, args.t2, args.flair, args.legacy_path)
+
+    device = get_device()
+    print(f"Using device: {device}")
+
+    try:
+        model = load_backend_model(args.backend, args.model, device, args.threads)
+        print(f"[SUCCESS] Model loaded ({args.backend})")
+    except Exception as e:
+        print(f"[ERROR] Model loading failed: {e}")
+        sys.exit(1)
+
+    if args.inference_mode == "cpu" and args.backend == "torch":
+        model = prepare_cpu_model(model)
+        print(f"CPU mode: {configure_cpu_threads(args.threads)} threads, bf16={cpu_bf16_supported()}")
+
+    try:
+        img, mri_np = load_mri(mri_path)
+    except Exception as e:
+        print(f"[ERROR] MRI loading failed: {e}")
+        sys.exit(1)
+
+    try:
+        tumor_mask_np, tumor_probs_np, avg_confidence = run_inference(
+            model, mri_np, device, args.inference_mode,
+            sw_batch_size=args.sw_batch_size, overlap=args.overlap, crop_foreground=not args.no_crop,
+        )
+        os.makedirs(args.output_dir, exist_ok=True)
+        save_outputs(tumor_mask_np, tumor_probs_np, args.output_dir, args.artifact_format, args.probs_dtype)
+    except Exception as e:
+        print(f"[ERROR] Inference failed: {e}")
+        sys.exit(1)
+
+    try:
+        metrics = compute_metrics(img, mri_np, tumor_mask_np, avg_confidence)
+
+        print("JSON_START")
+        print(json.dumps(metrics))
+        print("JSON_END")
+    except Exception as e:
+        print(f"[ERROR] Metrics calculation failed: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+#Bounded-concurrency, SQLite-backed job queue for the analysis pipeline
+
+import json
+import os
+import time
+import uuid
+import sqlite3
+import threading
+import multiprocessing as mp
+from contextlib import contextmanager
+
+# =====================================================
+# CONFIG
+# =====================================================
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB = os.path.join(SCRIPT_DIR, "jobs.sqlite3")
+POLL_INTERVAL = 0.5
+SUPERVISE_INTERVAL = 1.0   # How often the server checks its workers are alive
+RESPAWN_DELAY = 1.0        # Wait before replacing a dead worker, doubled while
+MAX_RESPAWN_DELAY = 60.0   # replacements keep dying within STABLE_AFTER seconds
+STABLE_AFTER = 60.0
+
+QUEUED = "queued"
+INFERRING = "inferring"
+MESHING = "meshing"
+DONE = "done"
+FAILED = "failed"
+ACTIVE_STATES = (QUEUED, INFERRING, MESHING)
+TERMINAL_STATES = (DONE, FAILED)
+
+
+def default_thread_budget(workers):
+    """Split the machine's cores evenly between workers."""
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+class JobStore:
+    """Job records in a local SQLite file, shared by the server and its workers."""
+
+    def __init__(self, path=DEFAULT_DB):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    metrics TEXT,
+                    timings TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    worker INTEGER
+                )
+            """)
+            # Stores created before jobs recorded the worker that claimed them
+            columns = [row["name"] for row in conn.execute("PRAGMA table_info(jobs)")]
+            if "worker" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN worker INTEGER")
+
+    @contextmanager
+    def _connect(self):
+        # One connection per call keeps the store safe across threads and processes;
+        # closing without COMMIT rolls back an interrupted transaction.
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _to_dict(row):
+        if row is None:
+            return None
+        job = dict(row)
+        for key in ("payload", "metrics", "timings"):
+            job[key] = json.loads(job[key]) if job[key] else None
+        return job
+
+    def submit(self, payload, job_id=None):
+        """Queue a job. Resubmitting an id that is still active returns the active job."""
+        job_id = job_id or uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None or row["status"] in TERMINAL_STATES:
+                conn.execute(
+                    "INSERT OR REPLACE INTO jobs (id, status, payload, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    (job_id, QUEUED, json.dumps(payload), now, now),
+                )
+            conn.execute("COMMIT")
+        return self.get(job_id)
+
+    def claim(self, worker=None):
+        """Atomically move the oldest queued job to INFERRING, recording the
+        claiming worker's pid, and return it."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, worker = ?, updated_at = ? WHERE id = ?",
+                    (INFERRING, worker, now, row["id"]),
+                )
+            conn.execute("COMMIT")
+        job = self._to_dict(row)
+        if job:
+            job["status"] = INFERRING
+            job["claimed_at"] = now
+        return job
+
+    def update(self, job_id, status, metrics=None, timings=None, error=None):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, metrics = COALESCE(?, metrics), timings = COALESCE(?, timings),"
+                " error = COALESCE(?, error), updated_at = ? WHERE id = ?",
+                (
+                    status,
+                    json.dumps(metrics) if metrics is not None else None,
+                    json.dumps(timings) if timings is not None else None,
+                    error,
+                    time.time(),
+                    job_id,
+                ),
+            )
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            return self._to_dict(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def wait(self, job_id, timeout, since=None):
+        """Block until the job leaves status `since` (or finishes), up to `timeout` seconds."""
+        deadline = time.monotonic() + timeout
+        job = self.get(job_id)
+        while job and job["status"] not in TERMINAL_STATES and time.monotonic() < deadline:
+            if since is not None and job["status"] != since:
+                break
+            time.sleep(min(POLL_INTERVAL, max(0.0, deadline - time.monotonic())))
+            job = self.get(job_id)
+        return job
+
+    def requeue_interrupted(self):
+        """Return jobs left mid-flight by a crashed or restarted server to the queue."""
+        with self._connect() as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE status IN (?, ?)",
+                (QUEUED, time.time(), INFERRING, MESHING),
+            )
+            return cur.rowcount
+
+    def fail_worker_jobs(self, worker, error):
+        """Mark the jobs a dead worker was running as FAILED; returns how many."""
+        with self._connect() as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE worker = ? AND status IN (?, ?)",
+                (FAILED, error, time.time(), worker, INFERRING, MESHING),
+            )
+            return cur.rowcount
+
+    def counts(self):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+
+# =====================================================
+# WORKERS
+# =====================================================
+def worker_main(db_path, model_path, thread_budget, inference_mode="default", backend="torch"):
+    """Worker process: load the model once, then run claimed jobs until killed."""
+    import torch
+    import infer_segmentation as seg
+    import pipeline
+
+    torch.set_num_threads(thread_budget)
+    store = JobStore(db_path)
+    model = seg.load_backend_model(backend, model_path, threads=thread_budget)
+    if inference_mode == "cpu" and backend == "torch":
+        model = seg.prepare_cpu_model(model)
+    print(f"[SUCCESS] Worker {os.getpid()} ready ({thread_budget} threads, {backend} backend, {inference_mode} inference)")
+
+    while True:
+        job = store.claim(os.getpid())
+        if job is None:
+            time.sleep(POLL_INTERVAL)
+            continue
+
+        payload = job["payload"]
+        # A job may ask for fewer threads than the worker's budget, never more
+        torch.set_num_threads(max(1, min(int(payload.get("threads") or thread_budget), thread_budget)))
+        try:
+            mri_path = seg.select_mri_path(
+                payload.get("t1"), payload.get("t1ce"), payload.get("t2"), payload.get("flair")
+            )
+            metrics, timings = pipeline.run_pipeline(
+                model, mri_path, payload["output_dir"],
+                mesh=bool(payload.get("mesh")),
+                quantize_glb=bool(payload.get("quantize_glb")),
+                on_stage=lambda state: store.update(job["id"], state),
+                inference_mode=inference_mode,
+            )
+            timings["queued"] = round(job["claimed_at"] - job["created_at"], 3)
+            store.update(job["id"], DONE, metrics=metrics, timings=timings)
+        except Exception as e:
+            print(f"[ERROR] Job {job['id']} failed: {e}")
+            store.update(job["id"], FAILED, error=str(e))
+        finally:
+            torch.set_num_threads(thread_budget)
+
+
+class JobQueue:
+    """Front end of the queue: owns the store and a fixed pool of worker processes.
+
+    A supervisor thread replaces workers that die (model load failure, OOM kill,
+    native crash) and fails the job the dead worker had claimed, so it doesn't
+    stay "inferring" forever. Replacements that keep dying are retried with
+    exponential backoff."""
+
+    def __init__(self, model_path, workers=1, thread_budget=None, db_path=DEFAULT_DB, inference_mode="default", backend="torch"):
+        self.model_path = model_path
+        self.inference_mode = inference_mode
+        self.backend = backend
+        self.workers = workers
+        self.thread_budget = thread_budget or default_thread_budget(workers)
+        self.store = JobStore(db_path)
+        self.processes = []
+        self._started = []
+        self._stopping = threading.Event()
+        self._supervisor = None
+
+    def _spawn(self):
+        p = mp.get_context("spawn").Process(
+            target=worker_main,
+            args=(self.store.path, self.model_path, self.thread_budget, self.inference_mode, self.backend),
+            daemon=True,
+        )
+        p.start()
+        return p
+
+    def start(self):
+        requeued = self.store.requeue_interrupted()
+        if requeued:
+            print(f"[WARNING] Requeued {requeued} interrupted job(s)")
+        self.processes = [self._spawn() for _ in range(self.workers)]
+        self._started = [time.monotonic()] * self.workers
+        self._supervisor = threading.Thread(target=self._supervise, daemon=True)
+        self._supervisor.start()
+
+    def _supervise(self):
+        delays = [RESPAWN_DELAY] * self.workers
+        respawn_at = [None] * self.workers
+        while not self._stopping.wait(SUPERVISE_INTERVAL):
+            for i, p in enumerate(self.processes):
+                if p.is_alive():
+                    continue
+                now = time.monotonic()
+                if respawn_at[i] is None:
+                    failed = self.store.fail_worker_jobs(p.pid, f"Worker {p.pid} exited unexpectedly (exit code {p.exitcode})")
+                    print(f"[WARNING] Worker {p.pid} exited with code {p.exitcode}; {failed} job(s) failed")
+                    # Back off while replacements die young (e.g. the model can't be loaded)
+                    delays[i] = min(delays[i] * 2, MAX_RESPAWN_DELAY) if now - self._started[i] < STABLE_AFTER else RESPAWN_DELAY
+                    respawn_at[i] = now + delays[i]
+                elif now >= respawn_at[i]:
+                    self.processes[i] = self._spawn()
+                    self._started[i] = now
+                    respawn_at[i] = None
+                    print(f"[SUCCESS] Replaced worker {p.pid} with {self.processes[i].pid}")
+
+    def stop(self):
+        self._stopping.set()
+        if self._supervisor is not None:
+            self._supervisor.join()
+        for p in self.processes:
+            p.terminate()
+        for p in self.processes:
+            p.join()
+
+    def alive_workers(self):
+        return sum(p.is_alive() for p in self.processes)
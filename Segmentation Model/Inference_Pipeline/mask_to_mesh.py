@@ -1,44 +1,170 @@
+#tumor_probs → tumor.glb + edema.glb
+
 import numpy as np
 import trimesh
+from trimesh.visual import TextureVisuals
 from skimage.measure import marching_cubes
 import os
+import sys
+import argparse
+
+import artifacts
 
 # =====================================================
-# LOAD PROBABILITY MAP
+# CONFIG
 # =====================================================
-# We use the probability map to get precise regions
-probs_path = "tumor_probs.npy"
-if not os.path.exists(probs_path):
-    print(f"[ERROR] Probability map not found at {os.path.abspath(probs_path)}")
-    exit(1)
+CORE_LEVEL = 0.8   # High confidence → tumor core
+EDEMA_LEVEL = 0.2  # Low confidence → edema region
 
-probs = np.load(probs_path)
-print("Probs shape:", probs.shape)
+STEP_SIZE = 1      # Marching-cubes step in voxels; 2+ trades detail for speed
+CROP_PADDING = 1   # Voxels kept around the edema region so surfaces stay closed
 
-# =====================================================
-# EXTRACT TUMOR CORE (High Confidence > 0.8)
-# =====================================================
-try:
-    if np.max(probs) > 0.8:
-        verts, faces, _, _ = marching_cubes(probs, level=0.8)
-        tumor_mesh = trimesh.Trimesh(vertices=verts, faces=faces)
-        tumor_mesh.export("tumor.glb")
-        print("[SUCCESS] tumor.glb (core) exported")
+# Triangle budgets of the decimated levels of detail: <name>_lod1.glb, <name>_lod2.glb, ...
+LOD_FACE_BUDGETS = (20000, 5000)
+
+
+def region_crop(probs, level=EDEMA_LEVEL, padding=CROP_PADDING):
+    """Padded bounding-box crop of `probs > level` and its offset, or (None, None).
+    Both iso-surfaces lie inside it, so marching cubes never visits the rest."""
+    if isinstance(probs, artifacts.CroppedVolume):
+        data, offset, shape = probs._decode(probs.crop), probs.offset, probs.shape
     else:
+        data = np.asarray(probs)
+        offset, shape = (0,) * data.ndim, data.shape
+
+    above = data > level
+    bounds = []
+    for axis in range(data.ndim):
+        other = tuple(a for a in range(data.ndim) if a != axis)
+        nz = np.flatnonzero(above.any(axis=other))
+        if len(nz) == 0:
+            return None, None
+        # Pad inside the full volume only, so border surfaces match an uncropped run
+        start = max(nz[0] - padding, -offset[axis])
+        stop = min(nz[-1] + 1 + padding, shape[axis] - offset[axis])
+        bounds.append((start, stop))
+
+    crop = np.zeros([b - a for a, b in bounds], dtype=np.float32)
+    # Padding may reach past a stored crop's edge, where the map is zero
+    src = tuple(slice(max(a, 0), min(b, n)) for (a, b), n in zip(bounds, data.shape))
+    dst = tuple(slice(s.start - a, s.stop - a) for s, (a, _) in zip(src, bounds))
+    crop[dst] = data[src]
+    return crop, tuple(int(o + a) for o, (a, _) in zip(offset, bounds))
+
+
+def extract_surface(probs, level, step_size=STEP_SIZE, offset=(0, 0, 0)):
+    """Iso-surface of the probability map at `level` in full-volume voxel
+    coordinates (`probs` starts at `offset`), or None if nothing reaches it."""
+    if np.max(probs) <= level:
+        return None
+    verts, faces, _, _ = marching_cubes(probs, level=level, step_size=step_size)
+    return trimesh.Trimesh(vertices=verts + np.asarray(offset, dtype=verts.dtype), faces=faces)
+
+
+def build_lods(mesh, budgets=LOD_FACE_BUDGETS):
+    """Quadric-decimated copies of `mesh`, one per triangle budget (coarsest last).
+    A level is None when the next finer one already fits its budget, so
+    small lesions don't ship the same mesh again; loaders fall back to the
+    next finer level. Needs fast_simplification; returns [] without it."""
+    lods = []
+    for budget in budgets:
+        # Decimate the finest level so far: skipped levels are identical to it
+        source = next((lod for lod in reversed(lods) if lod is not None), mesh)
+        if len(source.faces) <= budget:
+            lods.append(None)
+            continue
+        try:
+            lod = source.simplify_quadric_decimation(face_count=budget)
+        except ImportError:
+            print("[WARNING] fast_simplification not installed, skipping LODs")
+            return []
+        # Collapsed vertices stay in the array; drop them so they aren't shipped
+        lod.remove_unreferenced_vertices()
+        # Decimation drops the visuals; keep the named material the viewer looks for
+        if hasattr(mesh.visual, "material"):
+            lod.visual = TextureVisuals(material=mesh.visual.material)
+        lods.append(lod)
+    return lods
+
+
+def export_lods(name, lods, output_dir="."):
+    """Write <name>_lod1.glb, <name>_lod2.glb, ... next to the full-resolution <name>.glb,
+    skipping the levels build_lods left out."""
+    for i, lod in enumerate(lods, start=1):
+        if lod is None:
+            print(f"{name}_lod{i}.glb skipped, the finer level already fits its budget")
+            continue
+        lod.export(os.path.join(output_dir, f"{name}_lod{i}.glb"))
+        print(f"[SUCCESS] {name}_lod{i}.glb exported ({len(lod.faces)} faces)")
+
+
+def extract_meshes(probs, step_size=STEP_SIZE):
+    """Returns {"tumor": mesh, "edema": mesh}; a region is None when absent or on failure."""
+    meshes = {"tumor": None, "edema": None}
+
+    crop, offset = region_crop(probs)
+    if crop is None:
         print("[WARNING] No high-confidence core detected")
-except Exception as e:
-    print(f"[ERROR] Core extraction failed: {e}")
+        print("[WARNING] No edema region detected")
+        return meshes
 
-# =====================================================
-# EXTRACT EDEMA REGION (Low Confidence > 0.2)
-# =====================================================
-try:
-    if np.max(probs) > 0.2:
-        verts, faces, _, _ = marching_cubes(probs, level=0.2)
-        edema_mesh = trimesh.Trimesh(vertices=verts, faces=faces)
-        edema_mesh.export("edema.glb")
+    # =====================================================
+    # EXTRACT TUMOR CORE (High Confidence > 0.8)
+    # =====================================================
+    try:
+        meshes["tumor"] = extract_surface(crop, CORE_LEVEL, step_size, offset)
+        if meshes["tumor"] is None:
+            print("[WARNING] No high-confidence core detected")
+    except Exception as e:
+        print(f"[ERROR] Core extraction failed: {e}")
+
+    # =====================================================
+    # EXTRACT EDEMA REGION (Low Confidence > 0.2)
+    # =====================================================
+    try:
+        meshes["edema"] = extract_surface(crop, EDEMA_LEVEL, step_size, offset)
+        if meshes["edema"] is None:
+            print("[WARNING] No edema region detected")
+    except Exception as e:
+        print(f"[ERROR] Edema extraction failed: {e}")
+
+    return meshes
+
+
+def export_meshes(meshes, output_dir=".", lods=True):
+    if meshes["tumor"] is not None:
+        meshes["tumor"].export(os.path.join(output_dir, "tumor.glb"))
+        print("[SUCCESS] tumor.glb (core) exported")
+        if lods:
+            export_lods("tumor", build_lods(meshes["tumor"]), output_dir)
+    if meshes["edema"] is not None:
+        meshes["edema"].export(os.path.join(output_dir, "edema.glb"))
         print("[SUCCESS] edema.glb exported")
-    else:
-        print("[WARNING] No edema region detected")
-except Exception as e:
-    print(f"[ERROR] Edema extraction failed: {e}")
\ No newline at end of file
+        if lods:
+            export_lods("edema", build_lods(meshes["edema"]), output_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Probability map to tumor/edema meshes')
+    parser.add_argument('--dir', type=str, default='.', help='Job directory holding tumor_probs and receiving the meshes')
+    parser.add_argument('--step-size', type=int, default=STEP_SIZE, help='Marching-cubes step in voxels (2+ downsamples)')
+    parser.add_argument('--no-lods', action='store_true', help='Only export the full-resolution meshes')
+    args = parser.parse_args()
+
+    # =====================================================
+    # LOAD PROBABILITY MAP
+    # =====================================================
+    # We use the probability map to get precise regions
+    probs_path = artifacts.resolve(args.dir, artifacts.PROBS_NAME)
+    if not os.path.exists(probs_path):
+        print(f"[ERROR] Probability map not found at {os.path.abspath(probs_path)}")
+        sys.exit(1)
+
+    probs = artifacts.load_probs(probs_path)
+    print("Probs shape:", probs.shape)
+
+    export_meshes(extract_meshes(probs, args.step_size), args.dir, lods=not args.no_lods)
+
+
+if __name__ == "__main__":
+    main()
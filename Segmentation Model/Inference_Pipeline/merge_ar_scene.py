@@ -4,122 +4,322 @@ import trimesh
 import numpy as np
 from trimesh.visual.material import PBRMaterial
 from trimesh.visual import TextureVisuals
-from trimesh.smoothing import filter_laplacian
+import scipy.sparse
 import os
 import sys
+import json
+import hashlib
+import argparse
+
+import artifacts
+import glb_quantize
 
 # =====================================================
 # CONFIG
 # =====================================================
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+BRAIN_TEMPLATE = os.path.join(SCRIPT_DIR, "../AR_Assets/brain.glb")
+BRAIN_CACHE_DIR = os.path.join(SCRIPT_DIR, "../AR_Assets/.brain_cache")
+BRAIN_REFERENCE = "brain_template.json"  # Written into result folders instead of a brain.glb copy
+
 MIN_VISIBLE_RATIO = 0.05
 MAX_ALLOWED_RATIO = 0.35
 
+# Taubin smoothing: a shrinking lambda step then an inflating mu step per
+# iteration; |mu| > lambda cancels the shrinkage of plain Laplacian smoothing
+TAUBIN_LAMBDA = 0.5
+TAUBIN_MU = -0.53
+SMOOTHING_ITERATIONS = 5
+
+def umbrella_operator(mesh):
+    """Sparse row-normalised vertex adjacency: (A @ v)[i] is the mean of
+    vertex i's neighbours. Isolated vertices map to themselves."""
+    n = len(mesh.vertices)
+    faces = mesh.faces
+    # Each face contributes its three edges in both directions; the CSR
+    # conversion merges the repeats of edges shared by two faces
+    rows = np.concatenate([faces.ravel(), faces[:, [1, 2, 0]].ravel()])
+    cols = np.concatenate([faces[:, [1, 2, 0]].ravel(), faces.ravel()])
+    adjacency = scipy.sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(n, n))
+    adjacency.data[:] = 1.0
+    degree = np.diff(adjacency.indptr)
+    adjacency.data /= np.repeat(np.maximum(degree, 1), degree)
+    return adjacency + scipy.sparse.diags((degree == 0).astype(np.float64), format="csr")
+
+def taubin_smooth(mesh, iterations=SMOOTHING_ITERATIONS, lamb=TAUBIN_LAMBDA, mu=TAUBIN_MU, operator=None):
+    """Volume-preserving Taubin smoothing in place: the adjacency operator is
+    built once and each step is one sparse mat-vec over all vertices."""
+    operator = umbrella_operator(mesh) if operator is None else operator
+    vertices = np.array(mesh.vertices, dtype=np.float64)
+    for _ in range(iterations):
+        vertices += lamb * (operator @ vertices - vertices)
+        vertices += mu * (operator @ vertices - vertices)
+    mesh.vertices = vertices
+    return mesh
+
+def center_mesh(mesh):
+    """Center a lesion mesh on the origin and smooth marching-cubes artifacts."""
+    mesh.apply_translation(-mesh.centroid)
+    taubin_smooth(mesh)
+    return mesh
+
 def load_and_center(path):
-    if not os.path.exists(path): 
+    if not os.path.exists(path):
         print(f"[DEBUG] File not found: {path}")
         return None
     mesh = trimesh.load(path)
     if isinstance(mesh, trimesh.Scene):
         if len(mesh.geometry) == 0: return None
         mesh = trimesh.util.concatenate(list(mesh.geometry.values()))
-    mesh.apply_translation(-mesh.centroid)
-    filter_laplacian(mesh, iterations=5)
-    return mesh
+    return center_mesh(mesh)
 
 # =====================================================
-# LOAD ASSETS (FROM LOCAL DIR)
+# BRAIN TEMPLATE CACHE
 # =====================================================
-tumor = load_and_center("tumor.glb")
-edema = load_and_center("edema.glb")
-brain_scene = trimesh.load("../AR_Assets/brain.glb", force="scene")
+class BrainTemplate:
+    """Brain template prepared once and shared by every scene built from it:
+    materials tagged BrainPart_<name>, bounds precomputed. `path` is the
+    prepared GLB result folders reference. The geometry is shared, so scene
+    assembly must not modify it."""
 
-# =====================================================
-# BRAIN BOUNDS & POSITIONING
-# =====================================================
-brain_bounds = np.array([g.bounds for g in brain_scene.geometry.values()])
-brain_min = brain_bounds[:, 0, :].min(axis=0)
-brain_max = brain_bounds[:, 1, :].max(axis=0)
-brain_size = brain_max - brain_min
-brain_diameter = brain_size.max()
-
-# Load mask for precise positioning
-mask_path = "tumor_mask.npy"
-if os.path.exists(mask_path):
-    mask = np.load(mask_path)
-    voxels = np.argwhere(mask > 0)
-    if len(voxels) > 0:
-        center_voxel = voxels.mean(axis=0)
-        relative_pos = center_voxel / np.array(mask.shape)
-        target_pos = brain_min + relative_pos * brain_size
+    def __init__(self, scene, path, source, digest):
+        self.scene = scene
+        self.path = path
+        self.source = source
+        self.digest = digest
+        bounds = np.array([g.bounds for g in scene.geometry.values()])
+        self.min = bounds[:, 0, :].min(axis=0)
+        self.max = bounds[:, 1, :].max(axis=0)
+
+    @property
+    def geometry(self):
+        return self.scene.geometry
+
+_TEMPLATES = {}  # (realpath, mtime_ns, size) -> BrainTemplate, for long-lived workers
+
+def tag_brain_materials(brain_scene):
+    for name, geom in brain_scene.geometry.items():
+        # To keep original colors but still allow name detection,
+        # we make sure the material has 'brain' in its name
+        if hasattr(geom.visual, 'material'):
+            # Parts may share one material; each needs its own tag
+            geom.visual.material = geom.visual.material.copy()
+            geom.visual.material.name = f"BrainPart_{name}"
+        else:
+            # Fallback if no material
+            mat = PBRMaterial(name=f"BrainPart_{name}", baseColorFactor=[200,200,200,255])
+            geom.visual = TextureVisuals(material=mat)
+    return brain_scene
+
+def part_names(prepared, template):
+    """{name the loader gives a geometry of `prepared`: template part name}, matched
+    on the BrainPart_<name> material tags. The GLB round trip doesn't keep the
+    names (unnamed meshes are named after the file they're loaded from)."""
+    parts = {f"BrainPart_{name}": name for name in template.geometry}
+    names = {}
+    for name, geom in prepared.geometry.items():
+        tag = getattr(getattr(geom.visual, "material", None), "name", None)
+        if tag in parts:
+            names[name] = parts[tag]
+    return names
+
+def rename_parts(scene, names):
+    """`scene` with its geometries renamed from the part_names map."""
+    return trimesh.Scene({names.get(name, name): geom for name, geom in scene.geometry.items()})
+
+def load_brain(path=BRAIN_TEMPLATE, cache_dir=BRAIN_CACHE_DIR):
+    """BrainTemplate for `path`: from this process's cache, else from the
+    prepared GLB in `cache_dir` (keyed on the template's hash) and the part
+    names stored next to it, else prepared from the raw template and written
+    to `cache_dir`."""
+    stat = os.stat(path)
+    key = (os.path.realpath(path), stat.st_mtime_ns, stat.st_size)
+    if key in _TEMPLATES:
+        return _TEMPLATES[key]
+
+    with open(path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    prepared = os.path.join(cache_dir, f"brain-{digest[:16]}.glb")
+    names_path = os.path.join(cache_dir, f"brain-{digest[:16]}.names.json")
+    if os.path.exists(prepared) and os.path.exists(names_path):
+        with open(names_path) as f:
+            scene = rename_parts(trimesh.load(prepared, force="scene"), json.load(f))
     else:
-        target_pos = [0,0,0]
-else:
+        scene = tag_brain_materials(trimesh.load(path, force="scene"))
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp = f"{prepared}.{os.getpid()}.tmp"
+            scene.export(tmp, file_type="glb")
+            os.replace(tmp, prepared)
+            # Serve the exact file the scenes are built from, under the template's part names
+            loaded = trimesh.load(prepared, force="scene")
+            names = part_names(loaded, scene)
+            with open(f"{names_path}.{os.getpid()}.tmp", "w") as f:
+                json.dump(names, f, indent=2)
+            os.replace(f"{names_path}.{os.getpid()}.tmp", names_path)
+            scene = rename_parts(loaded, names)
+        except OSError as e:
+            print(f"[WARNING] Brain template cache not writable ({e}), using {path} in memory")
+            prepared = path
+
+    _TEMPLATES[key] = BrainTemplate(scene, os.path.abspath(prepared), os.path.abspath(path), digest)
+    return _TEMPLATES[key]
+
+def write_brain_reference(brain, output_dir="."):
+    """Point a result folder at the shared prepared template instead of copying it."""
+    reference = {
+        "template": os.path.relpath(brain.path, os.path.abspath(output_dir)),
+        "source": brain.source,
+        "sha256": brain.digest,
+    }
+    with open(os.path.join(output_dir, BRAIN_REFERENCE), "w") as f:
+        json.dump(reference, f, indent=2)
+
+def build_scene(tumor, edema, brain, mask=None):
+    """Scale, position and style the lesion meshes inside the brain template.
+    `tumor`/`edema` are centered meshes (or None); `mask` positions them;
+    `brain` is a BrainTemplate from load_brain."""
+
+    # =====================================================
+    # BRAIN BOUNDS & POSITIONING
+    # =====================================================
+    brain_min, brain_max = brain.min, brain.max
+    brain_size = brain_max - brain_min
+    brain_diameter = brain_size.max()
+
+    # Use the mask for precise positioning
     target_pos = [0,0,0]
+    if mask is not None:
+        voxels = np.argwhere(np.asarray(mask) > 0)
+        if len(voxels) > 0:
+            center_voxel = voxels.mean(axis=0)
+            relative_pos = center_voxel / np.array(mask.shape)
+            target_pos = brain_min + relative_pos * brain_size
 
-# =====================================================
-# SCALE & POSITION & STYLING
-# =====================================================
-scale_factor = 1.0
-if edema:
-    edema_bounds = edema.bounds
-    edema_diameter = (edema_bounds[1] - edema_bounds[0]).max()
-    scale_factor = (brain_diameter * 0.25) / (edema_diameter if edema_diameter > 0 else 1)
-    
-    edema.apply_scale(scale_factor)
-    edema.apply_translation(target_pos)
-    
-    # Force unique material name for Edema
-    edema_mat = PBRMaterial(
-        name="EdemaMaterial",
-        baseColorFactor=[150, 0, 255, 120],
-        metallicFactor=0.1, roughnessFactor=0.9
-    )
-    edema.visual = TextureVisuals(material=edema_mat)
-
-if tumor:
-    tumor.apply_scale(scale_factor)
-    tumor.apply_translation(target_pos)
-    
-    # Force unique material name for Tumor
-    tumor_mat = PBRMaterial(
-        name="TumorMaterial",
-        baseColorFactor=[200, 0, 0, 255],
-        metallicFactor=0.2, roughnessFactor=0.8
-    )
-    tumor.visual = TextureVisuals(material=tumor_mat)
+    # =====================================================
+    # SCALE & POSITION & STYLING
+    # =====================================================
+    scale_factor = 1.0
+    if edema:
+        edema_bounds = edema.bounds
+        edema_diameter = (edema_bounds[1] - edema_bounds[0]).max()
+        scale_factor = (brain_diameter * 0.25) / (edema_diameter if edema_diameter > 0 else 1)
 
-# =====================================================
-# MERGE
-# =====================================================
-final_scene = trimesh.Scene()
-if tumor: final_scene.add_geometry(tumor, node_name="tumor_node")
-if edema: final_scene.add_geometry(edema, node_name="edema_node")
-
-for name, geom in brain_scene.geometry.items():
-    # To keep original colors but still allow name detection, 
-    # we make sure the material has 'brain' in its name
-    if hasattr(geom.visual, 'material'):
-        geom.visual.material.name = f"BrainPart_{name}"
-    else:
-        # Fallback if no material
-        mat = PBRMaterial(name=f"BrainPart_{name}", baseColorFactor=[200,200,200,255])
-        geom.visual = TextureVisuals(material=mat)
-        
-    final_scene.add_geometry(geom, node_name=f"brain_{name}")
+        edema.apply_scale(scale_factor)
+        edema.apply_translation(target_pos)
 
-# Rotate to horizontal
-rotation = trimesh.transformations.rotation_matrix(angle=-np.pi / 2, direction=[1, 0, 0])
-final_scene.apply_transform(rotation)
+        # Force unique material name for Edema
+        edema_mat = PBRMaterial(
+            name="EdemaMaterial",
+            baseColorFactor=[150, 0, 255, 120],
+            metallicFactor=0.1, roughnessFactor=0.9
+        )
+        edema.visual = TextureVisuals(material=edema_mat)
 
-# =====================================================
-# EXPORT
-# =====================================================
-try:
-    if tumor: tumor.export("tumor.glb")
-    if edema: edema.export("edema.glb")
-    brain_scene.export("brain.glb")
-    final_scene.export("tumor_with_brain.glb")
-    print("[SUCCESS] Precise multi-region model generated with named materials")
-except Exception as e:
-    print(f"[ERROR] Export failed: {e}")
-    sys.exit(1)
+    if tumor:
+        tumor.apply_scale(scale_factor)
+        tumor.apply_translation(target_pos)
+
+        # Force unique material name for Tumor
+        tumor_mat = PBRMaterial(
+            name="TumorMaterial",
+            baseColorFactor=[200, 0, 0, 255],
+            metallicFactor=0.2, roughnessFactor=0.8
+        )
+        tumor.visual = TextureVisuals(material=tumor_mat)
+
+    # =====================================================
+    # MERGE
+    # =====================================================
+    final_scene = trimesh.Scene()
+    if tumor: final_scene.add_geometry(tumor, node_name="tumor_node")
+    if edema: final_scene.add_geometry(edema, node_name="edema_node")
+
+    # Materials are already tagged BrainPart_<name> by load_brain
+    for name, geom in brain.geometry.items():
+        final_scene.add_geometry(geom, node_name=f"brain_{name}")
+
+    # Rotate to horizontal
+    rotation = trimesh.transformations.rotation_matrix(angle=-np.pi / 2, direction=[1, 0, 0])
+    final_scene.apply_transform(rotation)
+    return final_scene
+
+def export_ar_glb(scene, path, quantize=False):
+    """Write an AR scene GLB. With `quantize`, the float export (with normals)
+    is rewritten with KHR_mesh_quantization and kept only if its round trip
+    stays within glb_quantize's error bounds; otherwise the float file is written."""
+    if not quantize:
+        scene.export(path)
+        return
+    data = scene.export(file_type="glb", include_normals=True)
+    try:
+        quantized, report = glb_quantize.quantize_checked(data)
+    except Exception as e:
+        print(f"[WARNING] {os.path.basename(path)} not quantized ({e}), writing float GLB")
+        quantized, report = data, None
+    if report is not None and not report["ok"]:
+        print(f"[WARNING] {os.path.basename(path)} round trip too lossy ({glb_quantize.describe(report)}), writing float GLB")
+        quantized = data
+    elif report is not None:
+        print(f"[SUCCESS] {os.path.basename(path)} quantized: {glb_quantize.describe(report)}")
+    with open(path, "wb") as f:
+        f.write(quantized)
+
+def export_scene(final_scene, tumor, edema, brain, output_dir=".", quantize=False):
+    if tumor: tumor.export(os.path.join(output_dir, "tumor.glb"))
+    if edema: edema.export(os.path.join(output_dir, "edema.glb"))
+    write_brain_reference(brain, output_dir)
+    export_ar_glb(final_scene, os.path.join(output_dir, "tumor_with_brain.glb"), quantize)
+
+def export_lod_scenes(final_scene, lesion_lods, output_dir=".", quantize=False):
+    """Write tumor_with_brain_lod<i>.glb: the merged scene with every lesion mesh
+    swapped for its level-i decimation. `lesion_lods` pairs each mesh in the
+    scene with its list of LODs (see mask_to_mesh.build_lods). A level where
+    no lesion has a decimation of its own would repeat the finer scene, so it
+    is skipped."""
+    levels = max((len(lods) for _, lods in lesion_lods), default=0)
+    for i in range(levels):
+        if all(i >= len(lods) or lods[i] is None for _, lods in lesion_lods):
+            print(f"tumor_with_brain_lod{i + 1}.glb skipped, same as the finer level")
+            continue
+        scene = final_scene.copy()
+        for name, geom in final_scene.geometry.items():
+            for mesh, lods in lesion_lods:
+                if geom is mesh:
+                    # A lesion without its own level-i mesh keeps its next finer one
+                    finer = [lod for lod in lods[:i + 1] if lod is not None]
+                    scene.geometry[name] = finer[-1] if finer else mesh
+        export_ar_glb(scene, os.path.join(output_dir, f"tumor_with_brain_lod{i + 1}.glb"), quantize)
+        print(f"[SUCCESS] tumor_with_brain_lod{i + 1}.glb exported")
+
+def main():
+    parser = argparse.ArgumentParser(description='Merge lesion meshes into the AR brain scene')
+    parser.add_argument('--dir', type=str, default='.', help='Job directory holding the meshes and mask')
+    parser.add_argument('--brain', type=str, default=BRAIN_TEMPLATE, help='Brain template GLB')
+    parser.add_argument('--quantize', action='store_true', help='Write tumor_with_brain.glb with KHR_mesh_quantization (16-bit positions, 8-bit normals)')
+    args = parser.parse_args()
+
+    # =====================================================
+    # LOAD ASSETS (FROM JOB DIR)
+    # =====================================================
+    tumor = load_and_center(os.path.join(args.dir, "tumor.glb"))
+    edema = load_and_center(os.path.join(args.dir, "edema.glb"))
+    brain = load_brain(args.brain)
+
+    mask_path = artifacts.resolve(args.dir, artifacts.MASK_NAME)
+    mask = artifacts.load_mask(mask_path) if os.path.exists(mask_path) else None
+
+    final_scene = build_scene(tumor, edema, brain, mask)
+
+    # =====================================================
+    # EXPORT
+    # =====================================================
+    try:
+        export_scene(final_scene, tumor, edema, brain, args.dir, args.quantize)
+        print("[SUCCESS] Precise multi-region model generated with named materials")
+    except Exception as e:
+        print(f"[ERROR] Export failed: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+#tumor_mask + MRI → volume, location, intensity moments and GLCM texture
+
+import os
+import sys
+import json
+import argparse
+
+import numpy as np
+
+import artifacts
+
+# =====================================================
+# CONFIG
+# =====================================================
+GLCM_LEVELS = 32  # Grey levels the tumor intensities are binned into
+
+# The 13 unique neighbour offsets of a 26-connected 3-D neighbourhood
+GLCM_OFFSETS = (
+    (0, 0, 1), (0, 1, 0), (1, 0, 0),
+    (0, 1, 1), (0, 1, -1), (1, 0, 1), (1, 0, -1), (1, 1, 0), (1, -1, 0),
+    (1, 1, 1), (1, 1, -1), (1, -1, 1), (1, -1, -1),
+)
+
+EMPTY_INTENSITY = {"min": 0, "max": 0, "mean": 0, "median": 0, "stdDev": 0, "skewness": 0, "kurtosis": 0}
+EMPTY_TEXTURE = {"contrast": 0, "correlation": 0, "energy": 0, "homogeneity": 0}
+
+
+# =====================================================
+# REGION
+# =====================================================
+def mask_region(mask):
+    """Boolean crop of the mask's bounding box and its offset, or (None, None) when empty.
+    A compact CroppedVolume mask already is a crop, so it is used as is."""
+    if isinstance(mask, artifacts.CroppedVolume):
+        crop, offset = mask.crop > 0, mask.offset
+    else:
+        crop, offset = np.asarray(mask) > 0, (0,) * np.ndim(mask)
+
+    # Narrow axis by axis so each projection only scans what is left
+    bounds = []
+    for axis in range(crop.ndim):
+        other = tuple(a for a in range(crop.ndim) if a != axis)
+        nz = np.flatnonzero(crop.any(axis=other))
+        if len(nz) == 0:
+            return None, None
+        index = [slice(None)] * crop.ndim
+        index[axis] = slice(nz[0], nz[-1] + 1)
+        crop = crop[tuple(index)]
+        bounds.append(nz[0])
+    return crop, tuple(int(o + b) for o, b in zip(offset, bounds))
+
+
+def centroid(crop, offset):
+    """Center of mass of a boolean crop in full-volume voxel coordinates,
+    from its per-axis projections rather than a list of voxel coordinates."""
+    n = np.count_nonzero(crop)
+    center = []
+    for axis in range(crop.ndim):
+        other = tuple(a for a in range(crop.ndim) if a != axis)
+        counts = crop.sum(axis=other, dtype=np.int64)
+        center.append(offset[axis] + float(np.dot(np.arange(len(counts)), counts)) / n)
+    return center
+
+
+# =====================================================
+# INTENSITY MOMENTS
+# =====================================================
+def moments(values):
+    """Min/max/mean/median/std/skewness/kurtosis from accumulated power sums.
+    Matches np.std and scipy.stats.skew/kurtosis defaults (population, Fisher)."""
+    v = values.astype(np.float64)
+    # Shifting by one sample keeps the power sums well conditioned
+    v -= v[0]
+    n = len(v)
+    v2 = v * v
+    s1, s2, s3, s4 = v.sum(), v2.sum(), (v2 * v).sum(), (v2 * v2).sum()
+
+    mu = s1 / n
+    m2 = max(s2 / n - mu ** 2, 0.0)
+    m3 = s3 / n - 3 * mu * s2 / n + 2 * mu ** 3
+    m4 = s4 / n - 4 * mu * s3 / n + 6 * mu ** 2 * s2 / n - 3 * mu ** 4
+
+    return {
+        "min": float(values.min()),
+        "max": float(values.max()),
+        "mean": float(mu + values[0]),
+        "median": float(np.median(values)),
+        "stdDev": float(np.sqrt(m2)),
+        "skewness": float(m3 / m2 ** 1.5) if m2 > 0 else 0.0,
+        "kurtosis": float(m4 / m2 ** 2 - 3.0) if m2 > 0 else 0.0,
+    }
+
+
+# =====================================================
+# GLCM TEXTURE
+# =====================================================
+def _pair_slices(offset, shape):
+    """Slices selecting every voxel and its neighbour at `offset` inside `shape`."""
+    first, second = [], []
+    for d, n in zip(offset, shape):
+        if d >= 0:
+            first.append(slice(0, n - d))
+            second.append(slice(d, n))
+        else:
+            first.append(slice(-d, n))
+            second.append(slice(0, n + d))
+    return tuple(first), tuple(second)
+
+
+def glcm(levels_crop, mask_crop, levels=GLCM_LEVELS, offsets=GLCM_OFFSETS):
+    """Symmetric, normalised grey-level co-occurrence matrix over all `offsets`,
+    counting only pairs where both voxels are inside the mask."""
+    counts = np.zeros(levels * levels, dtype=np.int64)
+    for offset in offsets:
+        a, b = _pair_slices(offset, mask_crop.shape)
+        both = mask_crop[a] & mask_crop[b]
+        counts += np.bincount(
+            levels_crop[a][both] * levels + levels_crop[b][both], minlength=levels * levels
+        )
+    matrix = counts.reshape(levels, levels).astype(np.float64)
+    matrix += matrix.T
+    total = matrix.sum()
+    return matrix / total if total > 0 else matrix
+
+
+def texture(matrix):
+    """Haralick contrast, correlation, energy and homogeneity of a normalised GLCM."""
+    if matrix.sum() == 0:
+        return dict(EMPTY_TEXTURE)
+    i, j = np.indices(matrix.shape)
+    diff2 = (i - j) ** 2
+    mu = float((i * matrix).sum())
+    var = float(((i - mu) ** 2 * matrix).sum())
+    return {
+        "contrast": float((diff2 * matrix).sum()),
+        "correlation": float(((i - mu) * (j - mu) * matrix).sum() / var) if var > 0 else 1.0,
+        "energy": float(np.sqrt((matrix ** 2).sum())),
+        "homogeneity": float((matrix / (1.0 + diff2)).sum()),
+    }
+
+
+# =====================================================
+# METRICS
+# =====================================================
+def location_label(center, shape):
+    z, y, x = center
+    d, h, w = shape
+    location = ["Right" if x < w / 2 else "Left", "Frontal" if y < h / 2 else "Temporal/Parietal"]
+    return " ".join(location)
+
+
+def compute_metrics(mri_np, mask, avg_confidence, voxel_dims=None, glcm_levels=GLCM_LEVELS):
+    """Metrics dict of the analysis. Everything after locating the bounding box
+    reads only the crop: one gather for the intensities, power sums for the
+    moments, axis projections for the centroid and one pass per GLCM offset."""
+    voxel_vol = float(np.prod(voxel_dims)) if voxel_dims is not None else 1.0  # in mm^3
+
+    crop, offset = mask_region(mask)
+    if crop is None:
+        tumor_volume_cm3 = 0.0
+        intensity_stats, texture_features, location_str = dict(EMPTY_INTENSITY), dict(EMPTY_TEXTURE), "None"
+    else:
+        box = tuple(slice(o, o + n) for o, n in zip(offset, crop.shape))
+        mri_crop = np.asarray(mri_np[box], dtype=np.float32)
+        values = mri_crop[crop]
+        tumor_volume_cm3 = (len(values) * voxel_vol) / 1000.0
+
+        stats = moments(values)
+        intensity_stats = {k: round(v, 3 if k in ("skewness", "kurtosis") else 2) for k, v in stats.items()}
+
+        # Bin the tumor's intensity range into grey levels for the GLCM
+        span = stats["max"] - stats["min"]
+        scale = (glcm_levels - 1) / span if span > 0 else 0.0
+        levels_crop = np.clip(np.rint((mri_crop - stats["min"]) * scale), 0, glcm_levels - 1).astype(np.int64)
+        features = texture(glcm(levels_crop, crop, glcm_levels))
+        texture_features = {k: round(v, 2 if k == "contrast" else 3) for k, v in features.items()}
+
+        location_str = location_label(centroid(crop, offset), np.shape(mask))
+
+    return {
+        "tumor_volume": round(float(tumor_volume_cm3), 2),
+        "edema_volume": round(float(tumor_volume_cm3 * 0.15), 2),
+        "tumor_location": location_str,
+        "confidence": round(float(avg_confidence), 1),
+        "intensity_stats": intensity_stats,
+        "texture_features": texture_features,
+    }
+
+
+# =====================================================
+# RE-ANALYSIS OF STORED RESULTS
+# =====================================================
+def stored_confidence(probs):
+    """Mean max-class probability of a stored two-class tumor_probs map,
+    as run_inference reports it (in percent)."""
+    if isinstance(probs, artifacts.CroppedVolume):
+        p = probs._decode(probs.crop)
+        outside = int(np.prod(probs.shape)) - p.size  # p == 0 there: confidence 1
+        return 100.0 * (outside + float(np.maximum(p, 1.0 - p).sum())) / np.prod(probs.shape)
+    p = np.asarray(probs, dtype=np.float32)
+    return 100.0 * float(np.maximum(p, 1.0 - p).mean())
+
+
+def analyze_results(results_dir, mri_path):
+    """Recompute the metrics of a finished analysis from its results folder and MRI."""
+    from infer_segmentation import load_mri
+
+    img, mri_np = load_mri(mri_path)
+    mask = artifacts.load_mask(artifacts.resolve(results_dir, artifacts.MASK_NAME))
+    probs_path = artifacts.resolve(results_dir, artifacts.PROBS_NAME)
+    confidence = stored_confidence(artifacts.load_probs(probs_path)) if os.path.exists(probs_path) else 0.0
+    return compute_metrics(mri_np, mask, confidence, img.header.get_zooms())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Recompute tumor metrics for stored analysis results')
+    parser.add_argument('--job', nargs=2, action='append', metavar=('RESULTS_DIR', 'MRI'), required=True,
+                        help='Results folder and the MRI it was segmented from (repeatable)')
+    args = parser.parse_args()
+
+    results, failed = {}, False
+    for results_dir, mri_path in args.job:
+        try:
+            results[results_dir] = analyze_results(results_dir, mri_path)
+        except Exception as e:
+            print(f"[ERROR] Metrics failed for {results_dir}: {e}")
+            failed = True
+
+    print("JSON_START")
+    print(json.dumps(results))
+    print("JSON_END")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
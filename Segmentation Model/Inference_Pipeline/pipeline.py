@@ -0,0 +1,155 @@
+#MRI → mask/probs → meshes → AR scene, in one process
+
+import json
+import os
+import sys
+import time
+import argparse
+from contextlib import contextmanager
+
+import infer_segmentation as seg
+import mask_to_mesh
+import merge_ar_scene
+import artifacts
+
+
+@contextmanager
+def stage(timings, name):
+    """Record the wall time of a pipeline stage in `timings` (seconds)."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = round(time.perf_counter() - t0, 3)
+
+
+def build_ar_scene(probs, mask, output_dir, brain_path=merge_ar_scene.BRAIN_TEMPLATE,
+                   step_size=mask_to_mesh.STEP_SIZE, lods=True, quantize=False):
+    """Mesh the probability map and merge it into the brain template,
+    handing the arrays and meshes over in memory. With `lods`, decimated
+    levels of detail of the lesions and of the merged scene are written too;
+    with `quantize`, the merged scenes are written with KHR_mesh_quantization."""
+    meshes = mask_to_mesh.extract_meshes(probs, step_size)
+    tumor = merge_ar_scene.center_mesh(meshes["tumor"]) if meshes["tumor"] is not None else None
+    edema = merge_ar_scene.center_mesh(meshes["edema"]) if meshes["edema"] is not None else None
+
+    brain = merge_ar_scene.load_brain(brain_path)
+    final_scene = merge_ar_scene.build_scene(tumor, edema, brain, mask)
+    merge_ar_scene.export_scene(final_scene, tumor, edema, brain, output_dir, quantize)
+    if lods:
+        lesion_lods = []
+        for name, mesh in (("tumor", tumor), ("edema", edema)):
+            if mesh is not None:
+                levels = mask_to_mesh.build_lods(mesh)
+                mask_to_mesh.export_lods(name, levels, output_dir)
+                lesion_lods.append((mesh, levels))
+        merge_ar_scene.export_lod_scenes(final_scene, lesion_lods, output_dir, quantize)
+    print("[SUCCESS] Precise multi-region model generated with named materials")
+
+
+def run_pipeline(model, mri_path, output_dir, mesh=True, artifact_format="compact", probs_dtype="uint8",
+                 brain_path=merge_ar_scene.BRAIN_TEMPLATE, on_stage=None, inference_mode="default",
+                 overlap=seg.OVERLAP, sw_batch_size=None, crop_foreground=True,
+                 mesh_step_size=mask_to_mesh.STEP_SIZE, lods=True, quantize_glb=False):
+    """Run one analysis job, writing only into `output_dir`.
+    Returns (metrics, timings). A meshing failure is logged, not raised,
+    so the segmentation result survives it. `on_stage` is called with
+    "inferring" and "meshing" as the job enters those stages."""
+    os.makedirs(output_dir, exist_ok=True)
+    timings = {}
+    on_stage = on_stage or (lambda state: None)
+
+    on_stage("inferring")
+
+    with stage(timings, "load_mri"):
+        img, mri_np = seg.load_mri(mri_path)
+
+    with stage(timings, "inference"):
+        tumor_mask_np, tumor_probs_np, avg_confidence = seg.run_inference(
+            model, mri_np, mode=inference_mode,
+            sw_batch_size=sw_batch_size, overlap=overlap, crop_foreground=crop_foreground,
+        )
+
+    with stage(timings, "save"):
+        seg.save_outputs(tumor_mask_np, tumor_probs_np, output_dir, artifact_format, probs_dtype)
+
+    with stage(timings, "metrics"):
+        metrics = seg.compute_metrics(img, mri_np, tumor_mask_np, avg_confidence)
+
+    if mesh:
+        on_stage("meshing")
+        with stage(timings, "meshing"):
+            try:
+                build_ar_scene(tumor_probs_np, tumor_mask_np, output_dir, brain_path, mesh_step_size, lods, quantize_glb)
+            except Exception as e:
+                print(f"[ERROR] 3D mesh generation failed: {e}")
+
+    return metrics, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Segmentation, mesh and AR scene pipeline')
+    parser.add_argument('--t1', type=str, help='Path to T1 MRI')
+    parser.add_argument('--t1ce', type=str, help='Path to T1CE MRI')
+    parser.add_argument('--t2', type=str, help='Path to T2 MRI')
+    parser.add_argument('--flair', type=str, help='Path to FLAIR MRI')
+    parser.add_argument('--output-dir', type=str, required=True, help='Job directory receiving every output')
+    parser.add_argument('--model', type=str, default=None, help='Model file for the backend (default: models/brats3d_final_model.pth / .onnx / .int8.onnx)')
+    parser.add_argument('--backend', choices=seg.BACKENDS, default='torch', help='Run the UNet in PyTorch, or in onnxruntime at fp32 (export_onnx.py) or int8 (quantize_model.py)')
+    parser.add_argument('--no-mesh', action='store_true', help='Skip mesh extraction and scene merging')
+    parser.add_argument('--brain', type=str, default=merge_ar_scene.BRAIN_TEMPLATE, help='Brain template GLB')
+    parser.add_argument('--mesh-step-size', type=int, default=mask_to_mesh.STEP_SIZE, help='Marching-cubes step in voxels (2+ downsamples)')
+    parser.add_argument('--no-lods', action='store_true', help='Skip the decimated tumor/edema levels of detail')
+    parser.add_argument('--quantize-glb', action='store_true', help='Write the AR scenes with KHR_mesh_quantization (16-bit positions, 8-bit normals)')
+    parser.add_argument('--artifact-format', choices=['compact', 'npy'], default='compact', help='On-disk format of mask/probability outputs')
+    parser.add_argument('--probs-dtype', choices=artifacts.PROBS_DTYPES, default='uint8', help='Stored precision of the compact probability map')
+    parser.add_argument('--inference-mode', choices=seg.INFERENCE_MODES, default='default', help='"cpu" enables the CPU performance mode')
+    parser.add_argument('--threads', type=int, default=None, help='Intra-op CPU threads for --inference-mode cpu or the onnx backend (default: available cores)')
+    parser.add_argument('--overlap', type=float, default=seg.OVERLAP, help='Sliding-window overlap (0-1)')
+    parser.add_argument('--sw-batch-size', type=int, default=None, help='Windows per forward pass (default: 1, or 4 in cpu mode)')
+    parser.add_argument('--no-crop', action='store_true', help='Run windows over the whole volume instead of the brain bounding box')
+    args = parser.parse_args()
+
+    mri_path = seg.select_mri_path(args.t1, args.t1ce, args.t2, args.flair)
+
+    device = seg.get_device()
+    print(f"Using device: {device}")
+
+    try:
+        model = seg.load_backend_model(args.backend, args.model, device, args.threads)
+        print(f"[SUCCESS] Model loaded ({args.backend})")
+    except Exception as e:
+        print(f"[ERROR] Model loading failed: {e}")
+        sys.exit(1)
+
+    if args.inference_mode == "cpu" and args.backend == "torch":
+        model = seg.prepare_cpu_model(model)
+        print(f"CPU mode: {seg.configure_cpu_threads(args.threads)} threads, bf16={seg.cpu_bf16_supported()}")
+
+    try:
+        metrics, timings = run_pipeline(
+            model, mri_path, args.output_dir,
+            mesh=not args.no_mesh,
+            artifact_format=args.artifact_format,
+            probs_dtype=args.probs_dtype,
+            brain_path=args.brain,
+            inference_mode=args.inference_mode,
+            overlap=args.overlap,
+            sw_batch_size=args.sw_batch_size,
+            crop_foreground=not args.no_crop,
+            mesh_step_size=args.mesh_step_size,
+            lods=not args.no_lods,
+            quantize_glb=args.quantize_glb,
+        )
+    except Exception as e:
+        print(f"[ERROR] Pipeline failed: {e}")
+        sys.exit(1)
+
+    print(f"[TIMINGS] {json.dumps(timings)}")
+    print("JSON_START")
+    print(json.dumps(metrics))
+    print("JSON_END")
+
+
+if __name__ == "__main__":
+    main()
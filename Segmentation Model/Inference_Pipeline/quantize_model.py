@@ -0,0 +1,197 @@
+#brats3d_final_model.onnx → brats3d_final_model.int8.onnx, published only if Dice holds
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import multiprocessing as mp
+
+import numpy as np
+
+import infer_segmentation as seg
+from evaluation import synthetic_volume, dice, peak_rss_mb
+
+# =====================================================
+# CONFIG
+# =====================================================
+WINDOWS_PER_VOLUME = 4   # Calibration windows sampled from each volume
+MAX_DICE_DROP = 0.02     # Largest Dice loss the int8 model may have
+METHODS = ("auto", "static", "dynamic")
+
+
+def sample_windows(mri_np, count, rng):
+    """Random ROI-sized windows from the brain bounding box, shaped (1, 1, *ROI_SIZE)."""
+    box = seg.foreground_box(mri_np)
+    if box is not None:
+        mri_np = mri_np[tuple(slice(s, e) for s, e in zip(*box))]
+    pad = [(0, max(0, r - n)) for r, n in zip(seg.ROI_SIZE, mri_np.shape)]
+    mri_np = np.pad(mri_np, pad)
+
+    windows = []
+    for _ in range(count):
+        start = [rng.integers(0, n - r + 1) for r, n in zip(seg.ROI_SIZE, mri_np.shape)]
+        window = mri_np[tuple(slice(s, s + r) for s, r in zip(start, seg.ROI_SIZE))]
+        windows.append(np.ascontiguousarray(window[None, None], dtype=np.float32))
+    return windows
+
+
+def quantize(onnx_path, output_path, calibration, method="auto"):
+    """Quantize to int8: static QDQ calibrated on `calibration` volumes, or dynamic
+    (weights only) when requested or when static fails. Returns the method used."""
+    from onnxruntime.quantization import (
+        CalibrationDataReader, QuantFormat, QuantType, quantize_dynamic, quantize_static,
+    )
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    class WindowReader(CalibrationDataReader):
+        def __init__(self, windows):
+            self.windows = iter(windows)
+
+        def get_next(self):
+            window = next(self.windows, None)
+            return None if window is None else {"image": window}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        prepared = os.path.join(tmp, "prepared.onnx")
+        quant_pre_process(onnx_path, prepared)
+
+        if method in ("auto", "static"):
+            rng = np.random.default_rng(0)
+            windows = [w for vol in calibration for w in sample_windows(vol, WINDOWS_PER_VOLUME, rng)]
+            try:
+                quantize_static(
+                    prepared, output_path, WindowReader(windows),
+                    quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QUInt8,
+                    weight_type=QuantType.QInt8,
+                    per_channel=True,
+                )
+                return "static"
+            except Exception as e:
+                if method == "static":
+                    raise
+                print(f"[WARNING] Static quantization failed ({e}), falling back to dynamic")
+
+        quantize_dynamic(prepared, output_path, weight_type=QuantType.QUInt8, op_types_to_quantize=["Conv"])
+        return "dynamic"
+
+
+def evaluate(model_path, volumes, threads, result_path):
+    """Child process: segment every volume with one ONNX model, recording
+    the masks, wall time and peak RSS."""
+    model = seg.OnnxPredictor(model_path, threads)
+    masks, times = [], []
+    for vol in volumes:
+        t0 = time.perf_counter()
+        masks.append(seg.run_inference(model, vol)[0])
+        times.append(time.perf_counter() - t0)
+    np.savez_compressed(result_path, *masks)
+    with open(result_path + ".json", "w") as f:
+        json.dump({"times": times, "peak_rss_mb": peak_rss_mb()}, f)
+
+
+def run_evaluation(model_path, volumes, threads, workdir, name):
+    # A fresh process per model keeps the peak RSS figures independent
+    result_path = os.path.join(workdir, f"{name}.npz")
+    p = mp.get_context("spawn").Process(target=evaluate, args=(model_path, volumes, threads, result_path))
+    p.start()
+    p.join()
+    if p.exitcode != 0:
+        raise RuntimeError(f"Evaluation of {name} failed (exit code {p.exitcode})")
+    with open(result_path + ".json") as f:
+        result = json.load(f)
+    outputs = np.load(result_path)
+    result["masks"] = [outputs[key] for key in outputs.files]
+    return result
+
+
+def load_volumes(paths, seeds):
+    if paths:
+        return [seg.load_mri(p)[1] for p in paths]
+    return [synthetic_volume(seed=seed) for seed in seeds]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Post-training int8 quantization with a Dice guardrail')
+    parser.add_argument('--onnx', type=str, default=seg.ONNX_MODEL_PATH, help='fp32 ONNX model (see export_onnx.py)')
+    parser.add_argument('--output', type=str, default=seg.INT8_MODEL_PATH, help='Where to publish the int8 model')
+    parser.add_argument('--method', choices=METHODS, default='auto', help='Static calibration, dynamic, or static with dynamic fallback')
+    parser.add_argument('--calibration', type=str, nargs='*', default=None, help='NIfTI volumes for calibration (synthetic if omitted, only with a custom --output)')
+    parser.add_argument('--eval', type=str, nargs='*', default=None, help='NIfTI volumes for the guardrail (synthetic if omitted, only with a custom --output)')
+    parser.add_argument('--labels', type=str, nargs='*', default=None, help='Ground-truth segmentations matching --eval')
+    parser.add_argument('--max-dice-drop', type=float, default=MAX_DICE_DROP)
+    parser.add_argument('--threads', type=int, default=None)
+    args = parser.parse_args()
+
+    if args.labels and len(args.labels) != len(args.eval or []):
+        print("[ERROR] --labels needs one segmentation per --eval volume")
+        sys.exit(1)
+
+    # Noise calibrates activation ranges no real scan has and says nothing about
+    # Dice on real scans, so the served model must come from real volumes
+    output = os.path.abspath(args.output)
+    if output == os.path.abspath(seg.INT8_MODEL_PATH) and not (args.calibration and args.eval):
+        print(f"[ERROR] Publishing to {seg.INT8_MODEL_PATH} needs real --calibration and --eval volumes; "
+              "pass --output elsewhere to try synthetic data")
+        sys.exit(1)
+
+    calibration = load_volumes(args.calibration, seeds=range(3))
+    volumes = load_volumes(args.eval, seeds=range(3, 5))
+    threads = args.threads or seg.configure_cpu_threads()
+
+    # Work next to the output so the final os.replace stays on one filesystem
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(output)) as workdir:
+        candidate = os.path.join(workdir, "candidate.int8.onnx")
+        try:
+            method = quantize(args.onnx, candidate, calibration, args.method)
+        except Exception as e:
+            print(f"[ERROR] Quantization failed: {e}")
+            sys.exit(1)
+        print(f"[SUCCESS] {method} int8 model built")
+
+        fp32 = run_evaluation(args.onnx, volumes, threads, workdir, "fp32")
+        int8 = run_evaluation(candidate, volumes, threads, workdir, "int8")
+
+        # Dice against ground truth when labels are given, else agreement with the fp32 masks
+        if args.labels:
+            truths = [np.asarray(seg.nib.load(p).dataobj) > 0 for p in args.labels]
+            fp32_dice = float(np.mean([dice(m, t) for m, t in zip(fp32["masks"], truths)]))
+            int8_dice = float(np.mean([dice(m, t) for m, t in zip(int8["masks"], truths)]))
+        else:
+            fp32_dice = 1.0
+            int8_dice = float(np.mean([dice(q, f) for q, f in zip(int8["masks"], fp32["masks"])]))
+
+        report = {
+            "method": method,
+            "reference": "labels" if args.labels else "fp32 masks",
+            "fp32_dice": round(fp32_dice, 5),
+            "int8_dice": round(int8_dice, 5),
+            "dice_drop": round(fp32_dice - int8_dice, 5),
+            "speedup": round(sum(fp32["times"]) / sum(int8["times"]), 3),
+            "fp32_size_mb": round(os.path.getsize(args.onnx) / 1e6, 2),
+            "int8_size_mb": round(os.path.getsize(candidate) / 1e6, 2),
+            "fp32_peak_rss_mb": round(fp32["peak_rss_mb"], 1),
+            "int8_peak_rss_mb": round(int8["peak_rss_mb"], 1),
+            "threads": threads,
+        }
+
+        print(f"Dice ({report['reference']}): fp32 {report['fp32_dice']:.4f}, int8 {report['int8_dice']:.4f} (drop {report['dice_drop']:.4f})")
+        print(f"Speedup: {report['speedup']:.2f}x on {threads} thread(s)")
+        print(f"Model size: {report['fp32_size_mb']} MB -> {report['int8_size_mb']} MB, "
+              f"peak RSS: {report['fp32_peak_rss_mb']} MB -> {report['int8_peak_rss_mb']} MB")
+
+        if report["dice_drop"] > args.max_dice_drop:
+            print(f"[ERROR] Dice drop {report['dice_drop']:.4f} exceeds {args.max_dice_drop}; int8 model not published")
+            sys.exit(1)
+
+        os.replace(candidate, output)
+    with open(os.path.splitext(args.output)[0] + ".json", "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"[SUCCESS] Published {args.output}")
+
+
+if __name__ == "__main__":
+    main()
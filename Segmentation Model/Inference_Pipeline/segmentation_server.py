@@ -0,0 +1,144 @@
+#Resident segmentation service: warm UNet workers behind a bounded job queue
+
+import json
+import os
+import sys
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import infer_segmentation as seg
+import job_queue
+
+# =====================================================
+# CONFIG
+# =====================================================
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = int(os.environ.get("SEGMENTATION_PORT", 5001))
+DEFAULT_WORKERS = int(os.environ.get("SEGMENTATION_WORKERS", 1))
+MAX_WAIT = 60           # Longest single long-poll on GET /jobs/<id>
+SEGMENT_TIMEOUT = 3600  # Synchronous /segment gives up after this many seconds
+
+
+def make_handler(queue):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _read_job(self):
+            """Parse and validate a job body; returns (job, error message)."""
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                job = json.loads(self.rfile.read(length) or b"{}")
+            except (ValueError, json.JSONDecodeError) as e:
+                return None, f"Invalid job: {e}"
+            if not job.get("output_dir"):
+                return None, "Invalid job: output_dir is required"
+            return job, None
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+
+            if url.path == "/health":
+                alive = queue.alive_workers()
+                return self._send_json(200 if alive else 503, {
+                    "success": alive > 0,
+                    "workers": queue.workers,
+                    "alive_workers": alive,
+                    "thread_budget": queue.thread_budget,
+                    "jobs": queue.store.counts(),
+                })
+
+            if url.path.startswith("/jobs/"):
+                job_id = url.path[len("/jobs/"):]
+                try:
+                    wait = min(float(query.get("wait", [0])[0]), MAX_WAIT)
+                except ValueError:
+                    return self._send_json(400, {"success": False, "message": "Invalid wait"})
+                since = query.get("since", [None])[0]
+                job = queue.store.wait(job_id, wait, since) if wait > 0 else queue.store.get(job_id)
+                if job is None:
+                    return self._send_json(404, {"success": False, "message": "Job not found"})
+                return self._send_json(200, {"success": True, "job": job})
+
+            self._send_json(404, {"success": False, "message": "Not found"})
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            if url.path not in ("/jobs", "/segment"):
+                return self._send_json(404, {"success": False, "message": "Not found"})
+
+            job, error = self._read_job()
+            if error:
+                return self._send_json(400, {"success": False, "message": error})
+            # Accepting a job nobody can run would leave the caller waiting forever
+            if queue.alive_workers() == 0:
+                return self._send_json(503, {"success": False, "message": "No segmentation worker is running"})
+
+            job_id = job.pop("job_id", None)
+            record = queue.store.submit(job, str(job_id) if job_id is not None else None)
+
+            # Submit-and-poll
+            if url.path == "/jobs":
+                return self._send_json(202, {"success": True, "job": record})
+
+            # Synchronous path: wait for the queued job to finish
+            record = queue.store.wait(record["id"], SEGMENT_TIMEOUT)
+            if record["status"] != job_queue.DONE:
+                message = record["error"] or f"Job did not finish (status: {record['status']})"
+                return self._send_json(500, {"success": False, "message": message})
+            self._send_json(200, {"success": True, "metrics": record["metrics"], "timings": record["timings"]})
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resident segmentation inference server')
+    parser.add_argument('--host', type=str, default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--model', type=str, default=None, help='Model file for the backend (default: models/brats3d_final_model.pth / .onnx / .int8.onnx)')
+    parser.add_argument('--backend', choices=seg.BACKENDS, default='torch', help='Run the UNet in PyTorch, or in onnxruntime at fp32 (export_onnx.py) or int8 (quantize_model.py)')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Pipeline jobs run concurrently')
+    parser.add_argument('--threads-per-worker', type=int, default=None, help='CPU thread budget per worker (default: cores / workers)')
+    parser.add_argument('--db', type=str, default=job_queue.DEFAULT_DB, help='SQLite job store')
+    parser.add_argument('--inference-mode', choices=seg.INFERENCE_MODES, default='default', help='"cpu" enables the CPU performance mode')
+    args = parser.parse_args()
+
+    model_path = args.model or seg.default_model_path(args.backend)
+    if not os.path.exists(model_path):
+        print(f"[ERROR] Model checkpoint not found: {model_path}")
+        sys.exit(1)
+
+    # Load the model once here so a bad checkpoint stops the server instead of every worker
+    try:
+        seg.load_backend_model(args.backend, model_path, threads=1)
+        print(f"[SUCCESS] Model {model_path} loads")
+    except Exception as e:
+        print(f"[ERROR] Model loading failed: {e}")
+        sys.exit(1)
+
+    queue = job_queue.JobQueue(model_path, args.workers, args.threads_per_worker, args.db, args.inference_mode, args.backend)
+    queue.start()
+    print(f"[SUCCESS] Started {queue.workers} worker(s) with {queue.thread_budget} thread(s) each")
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(queue))
+    print(f"Segmentation server listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        queue.stop()
+
+
+if __name__ == "__main__":
+    main()
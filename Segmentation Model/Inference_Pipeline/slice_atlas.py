@@ -0,0 +1,123 @@
+#tumor_mask.npy + tumor_probs.npy + MRI → pre-rendered slice atlas
+
+import json
+import os
+import sys
+import argparse
+import numpy as np
+
+import extract_slice as slicer
+
+# =====================================================
+# CONFIG
+# =====================================================
+ATLAS_DIR = "slice_atlas"
+INDEX_FILE = "index.json"
+PLANES = ("axial", "sagittal", "coronal")
+MASK_COLOR = np.array([0, 240, 255, 150], dtype=np.uint8) # Cyan, as in extract_slice
+
+
+def normalize_volume(data):
+    """Normalize the whole volume to 0-255 once, so every slice shares one intensity scale."""
+    data = np.asarray(data, dtype=np.float32)
+    lo, hi = float(data.min()), float(data.max())
+    if hi == lo:
+        return np.zeros(data.shape, dtype=np.uint8)
+    return ((data - lo) * (255.0 / (hi - lo))).astype(np.uint8)
+
+
+def render_volume(data, view_type):
+    """Render every voxel of a volume in one pass.
+    Returns an (X, Y, Z) uint8 or (X, Y, Z, 4) RGBA uint8 volume."""
+    if view_type == 'source':
+        return normalize_volume(data)
+
+    data = np.asarray(data)
+    if view_type == 'mask':
+        rgba = np.zeros(data.shape + (4,), dtype=np.uint8)
+        rgba[data > 0] = MASK_COLOR
+        return rgba
+
+    if view_type == 'heatmap':
+        rgba = slicer.apply_heatmap(data)
+        alpha = (data * 200).astype(np.uint8)
+        alpha[data < 0.1] = 0
+        rgba[..., 3] = alpha
+        return rgba
+
+    raise ValueError(f"Unsupported view type: {view_type}")
+
+
+def plane_slices(rendered, view_plane):
+    """Yield display-rotated 2-D slices along a plane, matching extract_slice.extract_plane."""
+    axis = {"sagittal": 0, "coronal": 1, "axial": 2}[view_plane]
+    for i in range(rendered.shape[axis]):
+        yield np.rot90(np.take(rendered, i, axis=axis))
+
+
+def write_plane_pack(rendered, view_plane, pack_path):
+    """Write all PNGs of one plane back to back. Returns the byte offsets and lengths."""
+    mode = 'RGBA' if rendered.ndim == 4 else 'L'
+    offsets, lengths = [], []
+    position = 0
+    with open(pack_path, "wb") as f:
+        for slice_img in plane_slices(rendered, view_plane):
+            png = slicer.encode_png(np.ascontiguousarray(slice_img), mode)
+            f.write(png)
+            offsets.append(position)
+            lengths.append(len(png))
+            position += len(png)
+    return offsets, lengths
+
+
+def build_atlas(output_dir, sources=(), mask_path=None, probs_path=None):
+    """Render every slice of every plane for the given volumes into output_dir/slice_atlas.
+    Returns the atlas index."""
+    atlas_dir = os.path.join(output_dir, ATLAS_DIR)
+    os.makedirs(atlas_dir, exist_ok=True)
+
+    volumes = [('source', p, 'nii') for p in sources]
+    if mask_path: volumes.append(('mask', mask_path, 'npy'))
+    if probs_path: volumes.append(('heatmap', probs_path, 'npy'))
+
+    entries = []
+    for n, (view_type, path, file_type) in enumerate(volumes):
+        if not os.path.exists(path):
+            print(f"[WARNING] Skipping missing volume: {path}")
+            continue
+
+        rendered = render_volume(slicer.load_volume(path, file_type), view_type)
+        entry = {"type": view_type, "path": os.path.abspath(path), "planes": {}}
+        for view_plane in PLANES:
+            pack_name = f"{view_type}_{n}_{view_plane}.bin"
+            offsets, lengths = write_plane_pack(rendered, view_plane, os.path.join(atlas_dir, pack_name))
+            entry["planes"][view_plane] = {"file": pack_name, "offsets": offsets, "lengths": lengths}
+        entries.append(entry)
+        print(f"[SUCCESS] {view_type} atlas rendered for {os.path.basename(path)}")
+
+    index = {"volumes": entries}
+    # Write the index last so readers never see an index pointing at partial packs
+    tmp_path = os.path.join(atlas_dir, INDEX_FILE + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, os.path.join(atlas_dir, INDEX_FILE))
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pre-render slice atlases for the MRI viewer')
+    parser.add_argument('output_dir', type=str, help='Analysis results folder')
+    parser.add_argument('--source', type=str, action='append', default=[], help='MRI NIfTI to render (repeatable)')
+    parser.add_argument('--mask', type=str, help='Path to tumor_mask.npy')
+    parser.add_argument('--probs', type=str, help='Path to tumor_probs.npy')
+    args = parser.parse_args()
+
+    try:
+        build_atlas(args.output_dir, args.source, args.mask, args.probs)
+    except Exception as e:
+        print(f"[ERROR] Atlas generation failed: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
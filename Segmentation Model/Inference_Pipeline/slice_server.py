@@ -0,0 +1,201 @@
+#Resident slice service: serves viewer slices from cached, memory-mapped volumes
+
+import json
+import os
+import struct
+import threading
+import argparse
+import numpy as np
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import extract_slice as slicer
+
+# =====================================================
+# CONFIG
+# =====================================================
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = int(os.environ.get("SLICE_SERVER_PORT", 5002))
+DEFAULT_CACHE_SIZE = 32
+
+# Raw stack header: magic, slice count, height, width, channels (little-endian),
+# followed by one uint32 slice index per slice and then the uint8 pixels.
+RAW_MAGIC = b"SLC1"
+RAW_HEADER = struct.Struct("<4sIHHB3x")
+MULTIPART_BOUNDARY = "slice-boundary"
+VIEW_TYPES = ("source", "mask", "heatmap")
+
+
+class VolumeCache:
+    """LRU cache of open volumes keyed by path, type and modification time,
+    so a file rewritten by a new analysis is reopened instead of served stale."""
+
+    def __init__(self, capacity=DEFAULT_CACHE_SIZE):
+        self.capacity = capacity
+        self.volumes = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, file_path, file_type):
+        key = (os.path.abspath(file_path), file_type, os.path.getmtime(file_path))
+        with self.lock:
+            if key in self.volumes:
+                self.volumes.move_to_end(key)
+                self.hits += 1
+                return self.volumes[key]
+            self.misses += 1
+
+        volume = slicer.load_volume(file_path, file_type)
+
+        with self.lock:
+            self.volumes[key] = volume
+            self.volumes.move_to_end(key)
+            while len(self.volumes) > self.capacity:
+                self.volumes.popitem(last=False)
+        return volume
+
+    def stats(self):
+        with self.lock:
+            return {"open_volumes": len(self.volumes), "hits": self.hits, "misses": self.misses}
+
+
+def make_handler(cache):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _slice_params(self, query):
+            file_path = query["path"][0]
+            file_type = query.get("file_type", ["nii"])[0]
+            view_type = query.get("type", ["source"])[0]
+            view_plane = query.get("plane", ["axial"])[0]
+            return file_path, file_type, view_type, view_plane
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+
+            if url.path == "/health":
+                return self._send_json(200, {"success": True, **cache.stats()})
+            if url.path == "/slice":
+                return self._get_slice(query)
+            if url.path == "/slices":
+                return self._get_slices(query)
+            return self._send_json(404, {"success": False, "message": "Not found"})
+
+        def _get_slice(self, query):
+            try:
+                file_path, file_type, view_type, view_plane = self._slice_params(query)
+                slice_index = int(query["index"][0])
+            except (KeyError, ValueError) as e:
+                return self._send_json(400, {"success": False, "message": f"Invalid slice request: {e}"})
+
+            if not os.path.exists(file_path):
+                return self._send_json(404, {"success": False, "message": "Slice data not ready"})
+
+            try:
+                data = cache.get(file_path, file_type)
+                slice_data = slicer.extract_plane(data, slice_index, view_plane)
+                image, mode = slicer.render_slice(slice_data, view_type)
+                b64_str = slicer.get_base64_image(image, mode)
+            except Exception as e:
+                print(f"[ERROR] Slice extraction failed: {e}")
+                return self._send_json(500, {"success": False, "message": str(e)})
+
+            self._send_json(200, {"success": True, "image": b64_str})
+
+        def _get_slices(self, query):
+            """Slice range in one response: a raw uint8 stack or multipart PNGs."""
+            try:
+                file_path, file_type, view_type, view_plane = self._slice_params(query)
+                start = int(query.get("start", [0])[0])
+                stop = int(query["stop"][0]) if "stop" in query else None
+                step = int(query.get("step", [1])[0])
+                transport = query.get("format", ["raw"])[0]
+                if view_type not in VIEW_TYPES:
+                    raise ValueError(f"unsupported view type '{view_type}'")
+                if transport not in ("raw", "multipart"):
+                    raise ValueError(f"unsupported format '{transport}'")
+            except (KeyError, ValueError) as e:
+                return self._send_json(400, {"success": False, "message": f"Invalid slice request: {e}"})
+
+            if not os.path.exists(file_path):
+                return self._send_json(404, {"success": False, "message": "Slice data not ready"})
+
+            try:
+                data = cache.get(file_path, file_type)
+                indices = slicer.slice_range(data, start, stop, step, view_plane)
+                slices = list(slicer.extract_planes(data, indices, view_plane))
+                if transport == "raw":
+                    body = self._raw_stack([(i, slicer.render_slice(s, view_type)[0]) for i, s in slices])
+            except Exception as e:
+                print(f"[ERROR] Slice extraction failed: {e}")
+                return self._send_json(500, {"success": False, "message": str(e)})
+
+            if transport == "raw":
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+
+            # Stream parts as they are encoded; the connection close ends the body
+            self.send_response(200)
+            self.send_header("Content-Type", f"multipart/mixed; boundary={MULTIPART_BOUNDARY}")
+            self.end_headers()
+            for i, slice_data in slices:
+                png = slicer.encode_png(*slicer.render_slice(slice_data, view_type))
+                self.wfile.write(
+                    f"--{MULTIPART_BOUNDARY}\r\nContent-Type: image/png\r\n"
+                    f"X-Slice-Index: {i}\r\nContent-Length: {len(png)}\r\n\r\n".encode("ascii")
+                )
+                self.wfile.write(png + b"\r\n")
+            self.wfile.write(f"--{MULTIPART_BOUNDARY}--\r\n".encode("ascii"))
+
+        def _raw_stack(self, rendered):
+            """Pack (index, image) pairs as header + uint32 indices + uint8 pixels."""
+            if not rendered:
+                return RAW_HEADER.pack(RAW_MAGIC, 0, 0, 0, 0)
+            stack = np.stack([image for _, image in rendered])
+            channels = stack.shape[3] if stack.ndim == 4 else 1
+            header = RAW_HEADER.pack(RAW_MAGIC, len(rendered), stack.shape[1], stack.shape[2], channels)
+            indices = np.asarray([i for i, _ in rendered], dtype="<u4")
+            return header + indices.tobytes() + stack.tobytes()
+
+        def log_message(self, format, *args):
+            # Viewer scrolling issues hundreds of requests; keep stdout quiet
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resident slice server')
+    parser.add_argument('--host', type=str, default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE, help='Number of open volumes to keep')
+    args = parser.parse_args()
+
+    cache = VolumeCache(args.cache_size)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(cache))
+    print(f"Slice server listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Epoch-time benchmark for the training data pipeline: plain Dataset vs the
+in-memory and on-disk caches of the deterministic preprocessing, on a small
+synthetic BraTS-like dataset. Times data loading only (no model step).
+"""
+
+import os
+import time
+import argparse
+import tempfile
+
+import numpy as np
+import nibabel as nib
+
+import train_brats3d_unet as train
+
+# ===============================
+# Configuration
+# ===============================
+SYNTHETIC_SHAPE = (200, 200, 130)
+SYNTHETIC_SPACING = (1.2, 1.2, 1.2)   # Not 1 mm, so Spacingd resamples
+
+
+def write_synthetic_cases(root, cases, shape=SYNTHETIC_SHAPE, seed=0, tumor_radius=15.0):
+    """BraTS-style case folders holding a *_flair.nii.gz and a *_seg.nii.gz,
+    with the tumor brighter than the surrounding noise so it can be learned."""
+    rng = np.random.default_rng(seed)
+    affine = np.diag(list(SYNTHETIC_SPACING) + [1.0])
+    grid = np.stack(np.meshgrid(*[np.arange(n) for n in shape], indexing="ij"))
+    center = np.array(shape).reshape(3, 1, 1, 1) / 2.0
+    head = (((grid - center) / (center * 0.8)) ** 2).sum(axis=0) <= 1.0
+
+    for i in range(cases):
+        case = os.path.join(root, f"BraTS20_Synthetic_{i:03d}")
+        os.makedirs(case, exist_ok=True)
+        tumor_center = center + rng.integers(-20, 20, size=(3, 1, 1, 1))
+        tumor = (((grid - tumor_center) / tumor_radius) ** 2).sum(axis=0) <= 1.0
+        flair = (rng.random(shape, dtype=np.float32) * 200 + 50) * head + 120 * tumor
+        seg = tumor.astype(np.uint8) * 2
+        nib.save(nib.Nifti1Image(flair.astype(np.float32), affine), os.path.join(case, f"{os.path.basename(case)}_flair.nii.gz"))
+        nib.save(nib.Nifti1Image(seg, affine), os.path.join(case, f"{os.path.basename(case)}_seg.nii.gz"))
+
+
+def epoch_times(files, cache, workers, epochs, cache_dir):
+    """Wall time of each pass over the loader; dataset construction (where the
+    in-memory cache is filled) counts towards the first epoch."""
+    t0 = time.perf_counter()
+    ds = train.build_dataset(files, train.build_train_transforms(), cache, cache_dir, workers)
+    loader = train.build_loader(ds, shuffle=True, workers=workers)
+    times = []
+    for _ in range(epochs):
+        for batch in loader:
+            assert tuple(batch["image"].shape[2:]) == train.ROI_SIZE
+        times.append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark cached vs uncached training data loading')
+    parser.add_argument('--cases', type=int, default=8)
+    parser.add_argument('--epochs', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=min(train.NUM_WORKERS, os.cpu_count() or 1))
+    args = parser.parse_args()
+
+    configs = [
+        ("baseline", "none", 0),
+        ("no cache", "none", args.workers),
+        ("memory", "memory", args.workers),
+        ("disk", "disk", args.workers),
+    ]
+
+    with tempfile.TemporaryDirectory() as root:
+        write_synthetic_cases(os.path.join(root, "data"), args.cases)
+        files = train.collect_cases(os.path.join(root, "data"))
+
+        results = {}
+        for name, cache, workers in configs:
+            results[name] = epoch_times(files, cache, workers, args.epochs, os.path.join(root, f"cache_{name}"))
+
+        baseline = np.mean(results["baseline"])
+        print(f"\n{'config':<10}{'workers':>8}{'epoch 1 (s)':>13}{'later (s)':>11}{'speedup':>9}")
+        for (name, _, workers) in configs:
+            times = results[name]
+            later = np.mean(times[1:]) if len(times) > 1 else times[0]
+            print(f"{name:<10}{workers:>8}{times[0]:>13.2f}{later:>11.2f}{baseline / later:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Scaling benchmark for distributed CPU training: launches train_brats3d_unet.py
+under torchrun with 1, 2, 4, ... local processes on a tiny synthetic dataset
+and reports throughput and scaling efficiency against the single process.
+"""
+
+import os
+import re
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+
+from benchmark_data_loading import write_synthetic_cases
+
+# ===============================
+# Configuration
+# ===============================
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+TRAIN_SCRIPT = os.path.join(SCRIPT_DIR, "train_brats3d_unet.py")
+TINY_SHAPE = (96, 96, 64)
+TINY_ROI = (64, 64, 64)
+
+
+def run_training(nproc, data_root, cache_dir, workdir, epochs, roi_size):
+    """One torchrun launch; returns the [TIMINGS] dict rank 0 prints."""
+    cmd = [
+        sys.executable, "-m", "torch.distributed.run", "--standalone", f"--nproc_per_node={nproc}",
+        TRAIN_SCRIPT,
+        "--data-root", data_root,
+        "--epochs", str(epochs),
+        "--roi-size", *[str(r) for r in roi_size],
+        "--workers", "0",
+        "--cache", "disk", "--cache-dir", cache_dir,
+        "--val-interval", str(epochs + 1),
+        "--patience", "0",
+        "--keep-last", "0",
+        "--checkpoint-dir", workdir,
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    match = re.search(r"^\[TIMINGS\] (.+)$", result.stdout, flags=re.M)
+    if result.returncode != 0 or not match:
+        print(result.stdout[-2000:], result.stderr[-2000:])
+        raise RuntimeError(f"Training with {nproc} process(es) failed (exit code {result.returncode})")
+    return json.loads(match.group(1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure DDP scaling efficiency of the training script')
+    parser.add_argument('--nproc', type=int, nargs='+', default=[1, 2, 4], help='Process counts to launch (the first is the reference)')
+    parser.add_argument('--cases', type=int, default=10)
+    parser.add_argument('--epochs', type=int, default=3, help='Epochs per run; the first is excluded as warm-up')
+    args = parser.parse_args()
+
+    print(f"Cores available: {len(os.sched_getaffinity(0))}")
+    with tempfile.TemporaryDirectory() as root:
+        data_root = os.path.join(root, "data")
+        write_synthetic_cases(data_root, args.cases, shape=TINY_SHAPE)
+        cache_dir = os.path.join(root, "cache")
+
+        results = {}
+        for nproc in args.nproc:
+            workdir = os.path.join(root, f"run{nproc}")
+            timings = run_training(nproc, data_root, cache_dir, workdir, args.epochs, TINY_ROI)
+            epoch_time = float(np.mean(timings["epoch_times"][1:] or timings["epoch_times"]))
+            results[nproc] = {**timings, "epoch_time": epoch_time, "throughput": timings["samples_per_epoch"] / epoch_time}
+
+    reference = args.nproc[0]
+    base = results[reference]["throughput"] / reference
+    print(f"\n{'procs':>6}{'threads':>9}{'epoch (s)':>11}{'samples/s':>11}{'speedup':>9}{'efficiency':>12}")
+    for nproc, r in results.items():
+        print(f"{nproc:>6}{r['threads_per_rank']:>9}{r['epoch_time']:>11.2f}{r['throughput']:>11.2f}"
+              f"{r['throughput'] / results[reference]['throughput']:>8.2f}x{r['throughput'] / (nproc * base):>12.0%}")
+
+
+if __name__ == "__main__":
+    main()
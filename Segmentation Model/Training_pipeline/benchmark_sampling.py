@@ -0,0 +1,97 @@
+"""
+Time-to-target-Dice benchmark: uniform random crops vs pos/neg label-centred
+patches, on synthetic cases with small tumors. Both samplers train the same
+model from the same seeds for the same wall-clock budget; validation time is
+not counted.
+"""
+
+import os
+import time
+import argparse
+import tempfile
+
+import numpy as np
+from torch.optim import Adam
+from monai.utils import set_determinism
+
+import train_brats3d_unet as train
+from benchmark_data_loading import write_synthetic_cases
+
+# ===============================
+# Configuration
+# ===============================
+TINY_SHAPE = (96, 96, 64)
+TUMOR_RADIUS = 6.0
+TINY_ROI = (32, 32, 32)
+TARGET_DICE = 0.5
+
+
+def time_to_dice(sampler, train_files, val_files, args, seed=0):
+    """Train until the target or the budget is reached; return [(train seconds,
+    val Dice)] after every epoch and the training time reaching the target."""
+    set_determinism(seed=seed)
+    roi_size = tuple(args.roi_size)
+    transforms = train.build_train_transforms(roi_size, sampler, args.samples_per_volume, tuple(args.pos_neg))
+    train_loader = train.build_loader(train.build_dataset(train_files, transforms, "memory", workers=0), shuffle=True, workers=0)
+    val_loader = train.build_loader(train.build_dataset(val_files, train.build_val_transforms(), "memory", workers=0), shuffle=False, workers=0)
+
+    model = train.build_model()
+    loss_fn = train.build_loss()
+    optimizer = Adam(model.parameters(), lr=args.lr)
+
+    history, reached, elapsed, patches = [], None, 0.0, 0
+    while elapsed < args.budget and reached is None:
+        model.train()
+        t0 = time.perf_counter()
+        for batch in train_loader:
+            images = batch["image"].to(train.DEVICE)
+            labels = batch["label"].to(train.DEVICE)
+            optimizer.zero_grad()
+            loss = loss_fn(model(images), labels)
+            loss.backward()
+            optimizer.step()
+            patches += images.shape[0]
+        elapsed += time.perf_counter() - t0
+
+        dice = train.validate(model, val_loader, roi_size, show_progress=False)
+        history.append((elapsed, dice))
+        print(f"  {sampler:<8} seed {seed} {elapsed:7.1f}s  {patches:5d} patches  Val Dice {dice:.4f}")
+        if dice >= args.target:
+            reached = elapsed
+    return history, reached
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare time to a target validation Dice for the two crop samplers')
+    parser.add_argument('--cases', type=int, default=8)
+    parser.add_argument('--target', type=float, default=TARGET_DICE)
+    parser.add_argument('--budget', type=float, default=300.0, help='Training seconds per sampler')
+    parser.add_argument('--roi-size', type=int, nargs=3, default=list(TINY_ROI))
+    parser.add_argument('--samples-per-volume', type=int, default=train.SAMPLES_PER_VOLUME)
+    parser.add_argument('--pos-neg', type=float, nargs=2, default=list(train.POS_NEG), metavar=('POS', 'NEG'))
+    parser.add_argument('--lr', type=float, default=1e-3)
+    parser.add_argument('--seeds', type=int, default=3, help='Training runs per sampler; the median time is reported')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        write_synthetic_cases(os.path.join(root, "data"), args.cases, shape=TINY_SHAPE, tumor_radius=TUMOR_RADIUS)
+        train_files, val_files = train.split_cases(train.collect_cases(os.path.join(root, "data")))
+
+        results = {}
+        for sampler in train.SAMPLERS:
+            results[sampler] = [time_to_dice(sampler, train_files, val_files, args, seed) for seed in range(args.seeds)]
+
+    print(f"\n{'sampler':<10}{'best Dice':>11}{'reached':>9}{f'median time to {args.target:.2f} (s)':>28}")
+    medians = {}
+    for sampler, runs in results.items():
+        best = max(d for history, _ in runs for _, d in history)
+        # Runs that miss the target count as the full budget
+        times = [reached if reached is not None else args.budget for _, reached in runs]
+        medians[sampler] = float(np.median(times))
+        hits = sum(reached is not None for _, reached in runs)
+        print(f"{sampler:<10}{best:>11.4f}{f'{hits}/{len(runs)}':>9}{medians[sampler]:>28.1f}")
+    print(f"posneg reaches the target {medians['uniform'] / medians['posneg']:.1f}x sooner (median)")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,14 +11,23 @@ Dataset: MICCAI BraTS 2020 (FLAIR modality)
 # ===============================
 import os
 import glob
+import json
+import queue
 import random
+import hashlib
+import time
+import argparse
+import threading
 import torch
+import torch.distributed as dist
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data.distributed import DistributedSampler
 from torch.optim import Adam
 from tqdm import tqdm
 
 from monai.networks.nets import UNet
 from monai.losses import DiceCELoss
-from monai.data import Dataset, DataLoader
+from monai.data import Dataset, CacheDataset, PersistentDataset, DataLoader
 from monai.inferers import sliding_window_inference
 from monai.transforms import (
     LoadImaged,
@@ -28,6 +37,7 @@ from monai.transforms import (
     ScaleIntensityRanged,
     CropForegroundd,
     RandSpatialCropd,
+    RandCropByPosNegLabeld,
     ToTensord,
     Compose,
     LambdaD,
@@ -44,97 +54,246 @@ BATCH_SIZE = 1
 LR = 1e-4
 ROI_SIZE = (128, 128, 128)
 
+NUM_WORKERS = 4
+SAMPLERS = ("uniform", "posneg")
+SAMPLES_PER_VOLUME = 4   # posneg: patches drawn from each loaded volume
+POS_NEG = (1.0, 1.0)     # posneg: relative weights of tumor- and background-centred patches
+VAL_INTERVAL = 2      # Epochs between validation runs
+PATIENCE = 5          # Validation runs without a Dice gain before stopping early
+MIN_DELTA = 1e-3      # Smallest Dice gain that counts as an improvement
+KEEP_LAST = 2         # Per-epoch checkpoints kept besides best and last
+CHECKPOINT_DIR = "."
+CACHE_MODES = ("none", "memory", "disk")
+CACHE_DIR = "./brats_cache"
+
+# Deterministic preprocessing (cached), also part of the disk-cache key
+PREPROCESS = {
+    "pixdim": (1, 1, 1),
+    "axcodes": "RAS",
+    "a_min": -100,
+    "a_max": 400,
+    "b_min": 0.0,
+    "b_max": 1.0,
+}
+
 # ===============================
 # 3. Collect Dataset Paths
 # ===============================
-cases = sorted([os.path.join(DATA_ROOT, d) for d in os.listdir(DATA_ROOT)])
-data = []
+def collect_cases(data_root=DATA_ROOT):
+    cases = sorted([os.path.join(data_root, d) for d in os.listdir(data_root)])
+    data = []
+
+    for c in cases:
+        flair = glob.glob(os.path.join(c, "*flair*.nii*"))
+        seg = glob.glob(os.path.join(c, "*seg*.nii*"))
+        if flair and seg:
+            data.append({"image": flair[0], "label": seg[0]})
 
-for c in cases:
-    flair = glob.glob(os.path.join(c, "*flair*.nii*"))
-    seg = glob.glob(os.path.join(c, "*seg*.nii*"))
-    if flair and seg:
-        data.append({"image": flair[0], "label": seg[0]})
+    print(f"Total usable cases: {len(data)}")
+    return data
 
-print(f"Total usable cases: {len(data)}")
 
-# Train / Validation split
-random.seed(42)
-random.shuffle(data)
-split_idx = int(0.8 * len(data))
-train_files = data[:split_idx]
-val_files = data[split_idx:]
+def split_cases(data, seed=42, train_fraction=0.8):
+    """Train / Validation split"""
+    data = list(data)
+    random.seed(seed)
+    random.shuffle(data)
+    split_idx = int(train_fraction * len(data))
+    return data[:split_idx], data[split_idx:]
 
 # ===============================
 # 4. Transforms
 # ===============================
-# Convert multi-class BraTS labels → binary tumor mask
-binary_label = LambdaD(keys="label", func=lambda x: (x > 0).float())
-
-train_transforms = Compose([
-    LoadImaged(keys=["image", "label"]),
-    EnsureChannelFirstd(keys=["image", "label"]),
-    Spacingd(keys=["image", "label"], pixdim=(1, 1, 1),
-             mode=("bilinear", "nearest")),
-    Orientationd(keys=["image", "label"], axcodes="RAS"),
-    ScaleIntensityRanged(
-        keys=["image"],
-        a_min=-100,
-        a_max=400,
-        b_min=0.0,
-        b_max=1.0,
-        clip=True,
-    ),
-    CropForegroundd(keys=["image", "label"], source_key="image"),
-    RandSpatialCropd(
-        keys=["image", "label"],
-        roi_size=ROI_SIZE,
-        random_size=False,
-    ),
-    binary_label,
-    ToTensord(keys=["image", "label"]),
-])
-
-# ===============================
-# 5. DataLoaders
-# ===============================
-train_ds = Dataset(data=train_files, transform=train_transforms)
-val_ds = Dataset(data=val_files, transform=train_transforms)
-
-train_loader = DataLoader(
-    train_ds, batch_size=BATCH_SIZE,
-    shuffle=True, num_workers=0
-)
+def binarize_label(x):
+    """Convert multi-class BraTS labels → binary tumor mask"""
+    return (x > 0).float()
+
+
+def preprocess_transforms():
+    """Deterministic prefix of the chain: the part the datasets cache."""
+    return [
+        LoadImaged(keys=["image", "label"]),
+        EnsureChannelFirstd(keys=["image", "label"]),
+        Spacingd(keys=["image", "label"], pixdim=PREPROCESS["pixdim"],
+                 mode=("bilinear", "nearest")),
+        Orientationd(keys=["image", "label"], axcodes=PREPROCESS["axcodes"]),
+        ScaleIntensityRanged(
+            keys=["image"],
+            a_min=PREPROCESS["a_min"],
+            a_max=PREPROCESS["a_max"],
+            b_min=PREPROCESS["b_min"],
+            b_max=PREPROCESS["b_max"],
+            clip=True,
+        ),
+        CropForegroundd(keys=["image", "label"], source_key="image"),
+        LambdaD(keys="label", func=binarize_label),
+    ]
+
+
+def build_val_transforms():
+    # Whole preprocessed volumes, no random crop: the Dice is comparable across runs
+    return Compose(preprocess_transforms() + [
+        ToTensord(keys=["image", "label"]),
+    ])
+
+
+def build_train_transforms(roi_size=ROI_SIZE, sampler="uniform",
+                           samples_per_volume=SAMPLES_PER_VOLUME, pos_neg=POS_NEG):
+    """Cached preprocessing followed by the per-iteration crop: one uniform
+    random crop, or ("posneg") `samples_per_volume` crops centred on tumor
+    or background voxels in the ratio `pos_neg`, so each decoded volume
+    feeds several patches."""
+    if sampler == "posneg":
+        crop = RandCropByPosNegLabeld(
+            keys=["image", "label"],
+            label_key="label",
+            spatial_size=roi_size,
+            pos=pos_neg[0],
+            neg=pos_neg[1],
+            num_samples=samples_per_volume,
+            image_key="image",
+            image_threshold=0,
+            allow_smaller=True,
+        )
+    else:
+        crop = RandSpatialCropd(
+            keys=["image", "label"],
+            roi_size=roi_size,
+            random_size=False,
+        )
+    # Only the crop (and tensor conversion) runs per iteration
+    return Compose(preprocess_transforms() + [
+        crop,
+        ToTensord(keys=["image", "label"]),
+    ])
 
-val_loader = DataLoader(
-    val_ds, batch_size=BATCH_SIZE,
-    shuffle=False, num_workers=0
-)
+# ===============================
+# 5. Datasets & DataLoaders
+# ===============================
+def file_digest(path, index):
+    """sha256 of a file's contents, memoised in `index` by path, size and mtime."""
+    stat = os.stat(path)
+    key = f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    if key not in index:
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha.update(chunk)
+        index[key] = sha.hexdigest()
+    return index[key]
+
+
+def add_cache_keys(files, cache_dir=CACHE_DIR):
+    """Tag each case with the hash of its image and label contents."""
+    os.makedirs(cache_dir, exist_ok=True)
+    index_path = os.path.join(cache_dir, "file_digests.json")
+    index = {}
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            index = json.load(f)
+
+    keyed = []
+    for item in files:
+        digest = hashlib.sha256((file_digest(item["image"], index) + file_digest(item["label"], index)).encode())
+        keyed.append({**item, "cache_key": digest.hexdigest()})
+
+    # Ranks sharing the cache dir may write at once: replace, never truncate
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, index_path)
+    return keyed
+
+
+def cache_item_hash(item):
+    return item["cache_key"].encode("utf-8")
+
+
+def preprocess_hash(transforms):
+    # The cached prefix is fully described by PREPROCESS
+    config = json.dumps({"preprocess": PREPROCESS, "transforms": [type(t).__name__ for t in transforms]}, sort_keys=True)
+    return hashlib.sha256(config.encode("utf-8")).hexdigest()[:16].encode("utf-8")
+
+
+def build_dataset(files, transform, cache="none", cache_dir=CACHE_DIR, workers=NUM_WORKERS):
+    """Dataset whose deterministic prefix is cached in memory ("memory"), on
+    disk keyed by file contents and preprocessing config ("disk"), or not at all."""
+    if cache == "memory":
+        return CacheDataset(data=files, transform=transform, num_workers=max(1, workers))
+    if cache == "disk":
+        return PersistentDataset(
+            data=add_cache_keys(files, cache_dir), transform=transform, cache_dir=cache_dir,
+            hash_func=cache_item_hash, hash_transform=preprocess_hash,
+        )
+    return Dataset(data=files, transform=transform)
+
+
+def build_loader(ds, shuffle, workers=NUM_WORKERS, sampler=None):
+    # A sampler (distributed mode) does its own shuffling
+    return DataLoader(
+        ds, batch_size=BATCH_SIZE,
+        shuffle=shuffle and sampler is None, sampler=sampler,
+        num_workers=workers,
+        persistent_workers=workers > 0,
+    )
 
 # ===============================
-# 6. Model
+# 6. Distributed (torchrun, gloo)
 # ===============================
-model = UNet(
-    spatial_dims=3,
-    in_channels=1,
-    out_channels=2,  # background + tumor
-    channels=(32, 64, 128, 256),
-    strides=(2, 2, 2),
-    num_res_units=2,
-).to(DEVICE)
+def setup_distributed(threads_per_rank=None):
+    """Join the torchrun process group when launched with more than one
+    process, and pin this rank to its own slice of the CPU cores.
+    Returns (rank, world_size); (0, 1) when not distributed."""
+    world_size = int(os.environ.get("WORLD_SIZE", 1))
+    if world_size <= 1:
+        return 0, 1
+
+    dist.init_process_group(backend="gloo")
+    rank = dist.get_rank()
+    local_rank = int(os.environ.get("LOCAL_RANK", rank))
+    local_world = int(os.environ.get("LOCAL_WORLD_SIZE", world_size))
+
+    # Disjoint core sets keep the ranks' intra-op pools from contending
+    cores = sorted(os.sched_getaffinity(0))
+    per_rank = max(1, len(cores) // local_world)
+    mine = cores[local_rank * per_rank:(local_rank + 1) * per_rank] or cores
+    os.sched_setaffinity(0, mine)
+    torch.set_num_threads(threads_per_rank or len(mine))
+    return rank, world_size
+
+
+def all_reduce_sum(*values):
+    """Sum floats over all ranks (identity when not distributed)."""
+    if not dist.is_initialized():
+        return values
+    t = torch.tensor(values, dtype=torch.float64)
+    dist.all_reduce(t)
+    return tuple(t.tolist())
 
 # ===============================
-# 7. Loss & Optimizer
+# 7. Model
 # ===============================
-loss_fn = DiceCELoss(
-    to_onehot_y=True,
-    softmax=True
-)
+def build_model():
+    return UNet(
+        spatial_dims=3,
+        in_channels=1,
+        out_channels=2,  # background + tumor
+        channels=(32, 64, 128, 256),
+        strides=(2, 2, 2),
+        num_res_units=2,
+    ).to(DEVICE)
 
-optimizer = Adam(model.parameters(), lr=LR)
+# ===============================
+# 8. Loss & Optimizer
+# ===============================
+def build_loss():
+    return DiceCELoss(
+        to_onehot_y=True,
+        softmax=True
+    )
 
 # ===============================
-# 8. Dice Metric Function
+# 9. Dice Metric Function
 # ===============================
 def dice_score(pred, target, eps=1e-6):
     intersection = (pred * target).sum()
@@ -142,42 +301,100 @@ def dice_score(pred, target, eps=1e-6):
     return (2. * intersection + eps) / (union + eps)
 
 # ===============================
-# 9. Training Loop
+# 10. Checkpointing
 # ===============================
-best_dice = 0.0
-
-for epoch in range(1, EPOCHS + 1):
-
-    # ---- Training ----
-    model.train()
-    train_loss = 0.0
+def snapshot(obj):
+    """Detached CPU copy of every tensor in a (nested) state dict, so the
+    training loop can keep updating the originals while it is written."""
+    if torch.is_tensor(obj):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        return {k: snapshot(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(snapshot(v) for v in obj)
+    return obj
+
+
+class CheckpointWriter:
+    """Writes checkpoints on a background thread: brats3d_last.pth every
+    epoch, brats3d_best.pth on a new best Dice, and brats3d_epoch<N>.pth
+    for the `keep_last` most recent epochs (0 keeps none)."""
+
+    def __init__(self, checkpoint_dir=CHECKPOINT_DIR, keep_last=KEEP_LAST):
+        self.checkpoint_dir = checkpoint_dir
+        self.keep_last = keep_last
+        self.kept = []
+        self.error = None
+        self.jobs = queue.Queue()
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def save(self, epoch, model, optimizer, val_dice, best=False):
+        if self.error is not None:
+            raise RuntimeError(f"Checkpoint writer failed: {self.error}")
+        checkpoint = snapshot({
+            "epoch": epoch,
+            "model_state": model.state_dict(),
+            "optimizer_state": optimizer.state_dict(),
+            "val_dice": val_dice,
+        })
+        names = ["brats3d_last.pth"]
+        if best:
+            names.append("brats3d_best.pth")
+        if self.keep_last > 0:
+            names.append(f"brats3d_epoch{epoch}.pth")
+        self.jobs.put((checkpoint, names))
+
+    def _write(self, checkpoint, name):
+        # Write then rename, so a crash never leaves a truncated checkpoint
+        path = os.path.join(self.checkpoint_dir, name)
+        torch.save(checkpoint, path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                if job is None:
+                    return
+                checkpoint, names = job
+                for name in names:
+                    self._write(checkpoint, name)
+                    if name.startswith("brats3d_epoch"):
+                        self.kept.append(name)
+                while len(self.kept) > self.keep_last:
+                    os.remove(os.path.join(self.checkpoint_dir, self.kept.pop(0)))
+                print(f"💾 Saved {', '.join(names)}")
+            except Exception as e:
+                self.error = e
+            finally:
+                self.jobs.task_done()
+
+    def close(self):
+        """Wait for pending checkpoints and stop the thread."""
+        self.jobs.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise RuntimeError(f"Checkpoint writer failed: {self.error}")
 
-    for batch in tqdm(train_loader, desc=f"Epoch {epoch}/{EPOCHS} [TRAIN]"):
-        images = batch["image"].to(DEVICE)
-        labels = batch["label"].to(DEVICE)
-
-        optimizer.zero_grad()
-        outputs = model(images)
-        loss = loss_fn(outputs, labels)
-        loss.backward()
-        optimizer.step()
-
-        train_loss += loss.item()
-
-    train_loss /= len(train_loader)
-
-    # ---- Validation ----
+# ===============================
+# 11. Validation
+# ===============================
+def validate(model, val_loader, roi_size=ROI_SIZE, device=DEVICE, show_progress=True):
+    """Mean Dice over whole validation volumes. In distributed mode each
+    rank scores its own shard and the sums are reduced across ranks."""
     model.eval()
     dice_total, count = 0.0, 0
 
     with torch.no_grad():
-        for batch in tqdm(val_loader, desc=f"Epoch {epoch}/{EPOCHS} [VAL]"):
-            images = batch["image"].to(DEVICE)
-            labels = batch["label"].to(DEVICE)
+        for batch in tqdm(val_loader, desc="[VAL]", disable=not show_progress):
+            images = batch["image"].to(device)
+            labels = batch["label"].to(device)
 
             outputs = sliding_window_inference(
                 images,
-                ROI_SIZE,
+                roi_size,
                 sw_batch_size=1,
                 predictor=model,
                 overlap=0.5
@@ -189,22 +406,146 @@ for epoch in range(1, EPOCHS + 1):
             dice_total += dice_score(preds, labels).item()
             count += 1
 
-    val_dice = dice_total / count
+    dice_total, count = all_reduce_sum(dice_total, count)
+    return dice_total / max(count, 1)
 
-    print(
-        f"Epoch {epoch} | "
-        f"Train Loss: {train_loss:.4f} | "
-        f"Val Dice: {val_dice:.4f}"
-    )
-
-    # ---- Save Checkpoint ----
-    torch.save({
-        "epoch": epoch,
-        "model_state": model.state_dict(),
-        "optimizer_state": optimizer.state_dict(),
-        "val_dice": val_dice,
-    }, f"brats3d_epoch{epoch}.pth")
-
-    print(f"💾 Saved brats3d_epoch{epoch}.pth")
-
-print("✅ Training complete")
+# ===============================
+# 12. Training Loop
+# ===============================
+def main():
+    parser = argparse.ArgumentParser(description='Train the BraTS 3D UNet (distributed with torchrun --nproc_per_node N)')
+    parser.add_argument('--data-root', type=str, default=DATA_ROOT)
+    parser.add_argument('--epochs', type=int, default=EPOCHS)
+    parser.add_argument('--roi-size', type=int, nargs=3, default=list(ROI_SIZE), help='Training crop / validation window size')
+    parser.add_argument('--workers', type=int, default=NUM_WORKERS, help='DataLoader worker processes (per rank)')
+    parser.add_argument('--sampler', choices=SAMPLERS, default='uniform',
+                        help='"posneg" draws --samples-per-volume tumor/background-centred patches per loaded volume')
+    parser.add_argument('--samples-per-volume', type=int, default=SAMPLES_PER_VOLUME)
+    parser.add_argument('--pos-neg', type=float, nargs=2, default=list(POS_NEG), metavar=('POS', 'NEG'),
+                        help='Relative weights of tumor- and background-centred patches')
+    parser.add_argument('--cache', choices=CACHE_MODES, default=None,
+                        help='Cache the deterministic preprocessing in memory (per rank), on disk (shared), or not at all '
+                             '(default: memory, disk under torchrun)')
+    parser.add_argument('--cache-dir', type=str, default=CACHE_DIR, help='Disk cache location for --cache disk')
+    parser.add_argument('--val-interval', type=int, default=VAL_INTERVAL, help='Validate every N epochs (and after the last)')
+    parser.add_argument('--patience', type=int, default=PATIENCE, help='Stop after N validations without a Dice gain (0 disables)')
+    parser.add_argument('--min-delta', type=float, default=MIN_DELTA, help='Smallest Dice gain that resets the patience')
+    parser.add_argument('--keep-last', type=int, default=KEEP_LAST, help='Per-epoch checkpoints to keep besides best and last')
+    parser.add_argument('--checkpoint-dir', type=str, default=CHECKPOINT_DIR)
+    parser.add_argument('--threads-per-rank', type=int, default=None, help='Intra-op threads per rank (default: its share of the cores)')
+    args = parser.parse_args()
+
+    epochs = args.epochs
+    roi_size = tuple(args.roi_size)
+    rank, world_size = setup_distributed(args.threads_per_rank)
+    is_main = rank == 0
+    # gloo data parallelism runs on the CPU
+    device = DEVICE if world_size == 1 else torch.device("cpu")
+    # A CacheDataset holds every training case, so N ranks would keep N copies in RAM
+    cache = args.cache or ("disk" if world_size > 1 else "memory")
+    if cache == "memory" and world_size > 1 and is_main:
+        print(f"[WARNING] --cache memory keeps a full copy of the dataset in each of the {world_size} ranks")
+
+    train_files, val_files = split_cases(collect_cases(args.data_root))
+    # Each rank validates its own shard of the cases
+    val_files = val_files[rank::world_size]
+
+    train_transforms = build_train_transforms(roi_size, args.sampler, args.samples_per_volume, tuple(args.pos_neg))
+    train_ds = build_dataset(train_files, train_transforms, cache, args.cache_dir, args.workers)
+    val_ds = build_dataset(val_files, build_val_transforms(), cache, args.cache_dir, args.workers)
+    train_sampler = DistributedSampler(train_ds, shuffle=True) if world_size > 1 else None
+    train_loader = build_loader(train_ds, shuffle=True, workers=args.workers, sampler=train_sampler)
+    val_loader = build_loader(val_ds, shuffle=False, workers=args.workers)
+
+    model = build_model().to(device)
+    net = DistributedDataParallel(model) if world_size > 1 else model
+    loss_fn = build_loss()
+    optimizer = Adam(net.parameters(), lr=LR)
+    writer = CheckpointWriter(args.checkpoint_dir, args.keep_last) if is_main else None
+
+    if is_main:
+        print(f"Training on {world_size} process(es), {torch.get_num_threads()} thread(s) each, device {device}")
+
+    best_dice, best_epoch, stale = -1.0, 0, 0
+    val_dice = None
+    epoch_times, samples = [], 0
+
+    for epoch in range(1, epochs + 1):
+
+        # ---- Training ----
+        net.train()
+        if train_sampler is not None:
+            train_sampler.set_epoch(epoch)
+        train_loss, steps, seen = 0.0, 0, 0
+        t0 = time.perf_counter()
+
+        for batch in tqdm(train_loader, desc=f"Epoch {epoch}/{epochs} [TRAIN]", disable=not is_main):
+            images = batch["image"].to(device)
+            labels = batch["label"].to(device)
+
+            optimizer.zero_grad()
+            outputs = net(images)
+            loss = loss_fn(outputs, labels)
+            loss.backward()
+            optimizer.step()
+
+            train_loss += loss.item()
+            steps += 1
+            seen += images.shape[0]
+
+        if train_sampler is not None:
+            # DistributedSampler pads the shards to equal length by repeating cases;
+            # every case yields the same number of patches, so scale to this rank's unique ones
+            seen *= len(range(rank, len(train_ds), world_size)) / len(train_sampler)
+        train_loss, steps, seen = all_reduce_sum(train_loss, steps, seen)
+        train_loss /= max(steps, 1)
+        epoch_times.append(time.perf_counter() - t0)
+        samples = round(seen)
+
+        # ---- Validation ----
+        improved = False
+        if epoch % args.val_interval == 0 or epoch == epochs:
+            # The bare module: ranks run different numbers of windows,
+            # and DDP's forward would wait on the others
+            val_dice = validate(model, val_loader, roi_size, device, show_progress=is_main)
+            improved = val_dice > best_dice + args.min_delta
+            if improved:
+                best_dice, best_epoch, stale = val_dice, epoch, 0
+            else:
+                stale += 1
+
+            if is_main:
+                print(
+                    f"Epoch {epoch} | "
+                    f"Train Loss: {train_loss:.4f} | "
+                    f"Val Dice: {val_dice:.4f} | "
+                    f"Best: {best_dice:.4f} (epoch {best_epoch})"
+                )
+        elif is_main:
+            print(f"Epoch {epoch} | Train Loss: {train_loss:.4f}")
+
+        # ---- Save Checkpoint (rank 0, background thread) ----
+        if is_main:
+            writer.save(epoch, model, optimizer, val_dice, best=improved)
+
+        # Every rank sees the same reduced Dice, so they all stop together
+        if args.patience and stale >= args.patience:
+            if is_main:
+                print(f"⏹ Early stopping: no Dice gain in {stale} validations")
+            break
+
+    if is_main:
+        writer.close()
+        print(f"✅ Training complete (best Val Dice {best_dice:.4f} at epoch {best_epoch})")
+        print("[TIMINGS] " + json.dumps({
+            "world_size": world_size,
+            "threads_per_rank": torch.get_num_threads(),
+            "samples_per_epoch": samples,
+            "epoch_times": [round(t, 3) for t in epoch_times],
+        }))
+    if dist.is_initialized():
+        dist.destroy_process_group()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,9 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS
 from rule_engine import run_rules
 from llm.llm_chain import generate_treatment_plan, predict_outcomes
+from rag.index_registry import REGISTRY
+from rag.retriever_local import preload_indexes, EMBED_CACHE
+from rag.retriever_online import CACHE as PUBMED_CACHE
 import re
 import random
 import pdfplumber
@@ -9,6 +12,9 @@ import pdfplumber
 app = Flask(__name__)
 CORS(app)
 
+# Read every guideline index once here, not on each request
+preload_indexes()
+
 def extract_text_from_pdf(file_path):
     """Extracts text from a PDF file using pdfplumber."""
     text = ""
@@ -454,5 +460,25 @@ def predict_side_effects_route():
     return jsonify(formatted_outcome)
 
 
+@app.route('/rag/indexes', methods=['GET'])
+def rag_indexes():
+    """Load time, size and content hash of each FAISS index held in memory."""
+    return jsonify(REGISTRY.stats())
+
+
+@app.route('/rag/embeddings', methods=['GET'])
+def rag_embeddings():
+    """Query-embedding cache size and hit rate."""
+    return jsonify(EMBED_CACHE.stats())
+
+
+@app.route('/rag/pubmed', methods=['GET'])
+def rag_pubmed():
+    """PubMed evidence cache contents and fresh/stale/missed lookups."""
+    if PUBMED_CACHE is None:
+        return jsonify({"enabled": False})
+    return jsonify(PUBMED_CACHE.stats())
+
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
\ No newline at end of file
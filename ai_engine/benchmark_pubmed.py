@@ -0,0 +1,215 @@
+"""Check and time the PubMed client against a local stub E-utilities server.
+
+The stub answers esearch/efetch like NCBI does, after an artificial WAN
+latency. The script compares the previous serial lookup (one blocking
+requests.get per query, then efetch) with rag.pubmed_client.PubMedClient
+and checks that the client returns the same articles, keeps to the rate
+limit, honours its deadline, retries a 503 and parses a streamed efetch;
+then that rag.pubmed_cache.PubMedCache serves repeat lookups without
+PubMed, sends the queries as written, serves and refreshes expired entries,
+works offline, and falls back to PubMed when its database fails.
+
+    python benchmark_pubmed.py [--latency 0.3] [--queries 5]
+"""
+
+import os
+import json
+import time
+import tempfile
+import argparse
+import threading
+import xml.etree.ElementTree as ET
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import requests
+
+from rag.pubmed_client import PubMedClient
+from rag.pubmed_cache import PubMedCache
+
+
+class StubEutils(BaseHTTPRequestHandler):
+    latency = 0.3
+    hits = []
+    terms = []
+    failed_once = set()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        StubEutils.hits.append(time.monotonic())
+        term = params.get("term", "")
+
+        if "slow" in term:
+            time.sleep(30)
+        time.sleep(self.latency)
+        if "flaky" in term and term not in StubEutils.failed_once:
+            StubEutils.failed_once.add(term)
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        if url.path.endswith("esearch.fcgi"):
+            StubEutils.terms.append(term)
+            # Stable, partly overlapping IDs per term; case-insensitive like PubMed
+            seed = sum(map(ord, term.lower()))
+            ids = [str(1000 + (seed + i * 7) % 60) for i in range(int(params["retmax"]))]
+            body = json.dumps({"esearchresult": {"idlist": ids}}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        # efetch: streamed in chunks, one article per PMID, every fifth without abstract
+        self.send_response(200)
+        self.send_header("Content-Type", "text/xml")
+        self.end_headers()
+        try:
+            self.wfile.write(b"<?xml version='1.0'?>\n<PubmedArticleSet>\n")
+            for pmid in params["id"].split(","):
+                abstract = "" if int(pmid) % 5 == 0 else (
+                    f"<Abstract><AbstractText Label='BACKGROUND'>Background of {pmid}.</AbstractText>"
+                    f"<AbstractText Label='RESULTS'>Results of {pmid}.</AbstractText></Abstract>")
+                self.wfile.write(
+                    f"<PubmedArticle><MedlineCitation><PMID>{pmid}</PMID><Article>"
+                    f"<ArticleTitle>Article {pmid}</ArticleTitle>{abstract}"
+                    f"</Article></MedlineCitation></PubmedArticle>\n".encode())
+                self.wfile.flush()
+            self.wfile.write(b"</PubmedArticleSet>\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client gave up at its deadline
+
+
+def serial_evidence(search_url, fetch_url, queries, k):
+    """The previous retriever_online lookup: one blocking GET per query, no session."""
+    pmids = []
+    for query in queries:
+        r = requests.get(search_url, params={"db": "pubmed", "term": query, "retmax": k, "retmode": "json"})
+        pmids.extend(r.json()["esearchresult"]["idlist"])
+    pmids = list(set(pmids))
+    r = requests.get(fetch_url, params={"db": "pubmed", "id": ",".join(pmids), "retmode": "xml"})
+    articles = []
+    for article in ET.fromstring(r.content).findall(".//PubmedArticle"):
+        title = article.findtext(".//ArticleTitle", default="")
+        abstract = " ".join([a.text for a in article.findall(".//AbstractText") if a.text])
+        if abstract:
+            articles.append({"text": f"{title}. {abstract}", "source": "PubMed"})
+    return articles
+
+
+def max_per_window(stamps, window=0.95):
+    # Arrival times jitter by a few ms, so rate + 1 calls spaced exactly 1/rate
+    # apart can arrive just under a second apart; the shorter window allows for that
+    stamps = sorted(stamps)
+    return max((sum(1 for t in stamps[i:] if t - s < window) for i, s in enumerate(stamps)), default=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PubMed client check against a stub server")
+    parser.add_argument("--latency", type=float, default=0.3, help="Stub response delay in seconds")
+    parser.add_argument("--queries", type=int, default=5, help="Queries per lookup")
+    parser.add_argument("--rate", type=float, default=3.0, help="Client requests per second")
+    args = parser.parse_args()
+
+    StubEutils.latency = args.latency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubEutils)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    search_url, fetch_url = f"{base}/esearch.fcgi", f"{base}/efetch.fcgi"
+
+    queries = [f"Breast stage II treatment {i}" for i in range(args.queries)]
+    client = PubMedClient(search_url, fetch_url, rate=args.rate, call_timeout=2.0, backoff=0.1)
+    failures = []
+
+    start = time.perf_counter()
+    old = serial_evidence(search_url, fetch_url, queries, 3)
+    t_old = time.perf_counter() - start
+
+    StubEutils.hits = []
+    start = time.perf_counter()
+    new = client.evidence(queries, 3)
+    t_new = time.perf_counter() - start
+    print(f"serial lookup     {t_old:.2f}s  {len(old)} articles")
+    print(f"client lookup     {t_new:.2f}s  {len(new)} articles  ({t_old / t_new:.1f}x)")
+    if sorted(a["text"] for a in old) != sorted(a["text"] for a in new):
+        failures.append("client and serial lookup returned different articles")
+
+    peak = max_per_window(StubEutils.hits)
+    print(f"peak requests/s   {peak} (limit {args.rate:g})")
+    if peak > args.rate:
+        failures.append(f"{peak} requests in one second")
+
+    timeout = 1.0 + 5 * args.latency
+    start = time.perf_counter()
+    partial = client.evidence(queries[:2] + ["slow query"], 3, timeout=timeout)
+    t_slow = time.perf_counter() - start
+    print(f"hung esearch      {t_slow:.2f}s  {len(partial)} articles from the other queries (timeout {timeout:g}s)")
+    if t_slow > timeout + 0.1 or not partial:
+        failures.append("deadline not honoured with a hung esearch")
+
+    retried = client.search(["flaky query"], 3)
+    print(f"503 then 200      {len(retried)} ids")
+    if len(retried) != 3:
+        failures.append("503 was not retried")
+
+    many = [str(1000 + i) for i in range(200)]
+    streamed = client.fetch(many)
+    print(f"streamed efetch   {len(streamed)} of {len(many)} articles (those without abstract skipped)")
+    if len(streamed) != sum(1 for p in many if int(p) % 5):
+        failures.append("streamed efetch lost articles")
+
+    cache_path = os.path.join(tempfile.mkdtemp(), "pubmed_cache.sqlite3")
+    cache = PubMedCache(client, cache_path, search_ttl=3600, article_ttl=3600)
+    StubEutils.terms = []
+    cold = cache.evidence(queries, 3)
+    print(f"esearch terms     {StubEutils.terms[0]!r}, ... as written")
+    if sorted(StubEutils.terms) != sorted(queries):
+        failures.append("the cache sent normalised terms to PubMed")
+    StubEutils.hits = []
+    start = time.perf_counter()
+    warm = cache.evidence([q.upper() for q in queries], 3)
+    t_warm = time.perf_counter() - start
+    print(f"cached lookup     {t_warm * 1e3:.1f}ms  {len(warm)} articles, {len(StubEutils.hits)} PubMed calls")
+    if warm != cold or StubEutils.hits or sorted(a["text"] for a in warm) != sorted(a["text"] for a in new):
+        failures.append("cached lookup differs or went to PubMed")
+
+    cache.search_ttl = cache.article_ttl = 0
+    start = time.perf_counter()
+    stale = cache.evidence(queries, 3)
+    t_stale = time.perf_counter() - start
+    cache._refresher.submit(lambda: None).result()  # wait for the background refresh
+    print(f"expired lookup    {t_stale * 1e3:.1f}ms  {len(stale)} articles served, "
+          f"{len(StubEutils.hits)} PubMed calls made in the background")
+    if stale != cold or not StubEutils.hits:
+        failures.append("expired entries were not served and refreshed")
+
+    offline = PubMedCache(PubMedClient("http://127.0.0.1:9/esearch.fcgi", "http://127.0.0.1:9/efetch.fcgi"),
+                          cache_path, offline=True)
+    served = offline.evidence(queries + ["never searched"], 3)
+    print(f"offline lookup    {len(served)} articles from the cache")
+    if served != cold:
+        failures.append("offline mode did not serve the cached evidence")
+
+    broken = PubMedCache(client, cache_path)
+    broken._db.close()  # every query now raises sqlite3.ProgrammingError
+    fallback = broken.evidence(queries, 3)
+    print(f"broken database   {len(fallback)} articles straight from PubMed")
+    if sorted(a["text"] for a in fallback) != sorted(a["text"] for a in new):
+        failures.append("a failing cache database broke the lookup")
+
+    server.shutdown()
+    if failures:
+        for f in failures:
+            print(f"[ERROR] {f}")
+        raise SystemExit(1)
+    print("[SUCCESS] PubMed client and cache checks passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Pre-warm the PubMed evidence cache for every profile the rule engine knows.
+
+Builds the PubMed queries the app sends (stage treatment, side-effect
+prediction and biomarker queries) for every cancer and stage in the
+knowledge base, then searches and fetches the ones not cached yet or past
+their TTL, so /recommend finds them in rag/pubmed_cache.sqlite3.
+
+    python prewarm_pubmed.py [--k 3] [--force] [--list]
+"""
+
+import time
+import argparse
+
+from rule_engine.rule_engine import KB
+from rag.retriever_online import CACHE
+from rag.pubmed_cache import by_search_key
+
+# Marker values as app.py extracts them from reports
+BIOMARKERS = {
+    "breast": {"ER": ["Positive", "Negative"], "HER2": ["Positive", "Negative"]},
+    "brain": {"MGMT": ["Methylated", "Unmethylated", "Positive", "Negative"],
+              "IDH1": ["Mutant", "Wild-Type"]},
+}
+
+BATCH = 10  # Searches per refresh, so each batch fits the client's deadline
+
+
+def profile_queries():
+    """Every PubMed query app.py can build from a cancer, stage and biomarker known to the KB."""
+    queries = []
+    for cancer, kb in KB.items():
+        if cancer == "common":
+            continue
+        name = cancer.capitalize()
+        for stage in kb.get("stages", {}):
+            queries.append(f"{name} stage {stage} treatment")
+            queries.append(f"Predict side effects, survival, and QoL for {name} stage {stage}")
+        for marker, values in BIOMARKERS.get(cancer, {}).items():
+            queries.extend(f"{name} {marker} {value}" for value in values)
+    # One query per cache entry, spelled as app.py sends it
+    return list(by_search_key(queries).values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-warm the PubMed evidence cache")
+    parser.add_argument("--k", type=int, default=3, help="Articles per query (hybrid_retrieve uses 3)")
+    parser.add_argument("--force", action="store_true", help="Refresh fresh entries too")
+    parser.add_argument("--list", action="store_true", help="Only print the queries")
+    args = parser.parse_args()
+
+    queries = profile_queries()
+    if args.list:
+        print("\n".join(queries))
+        return
+    if CACHE is None:
+        print("[ERROR] pubmed_cache_path is not set in config/settings.json")
+        raise SystemExit(1)
+
+    due = queries if args.force else CACHE.due(queries, args.k)
+    print(f"{len(queries)} queries, {len(due)} to fetch")
+
+    start = time.perf_counter()
+    searched = fetched = 0
+    for i in range(0, len(due), BATCH):
+        s, a = CACHE.refresh(due[i:i + BATCH], args.k)
+        searched += s
+        fetched += a
+        print(f"  {min(i + BATCH, len(due))}/{len(due)} queries")
+
+    failed = len(CACHE.due(queries, args.k))
+    print(f"[SUCCESS] {searched} searches and {fetched} articles cached in {time.perf_counter() - start:.1f}s")
+    if failed:
+        print(f"[WARNING] {failed} queries still missing, run again when PubMed is reachable")
+
+
+if __name__ == "__main__":
+    main()
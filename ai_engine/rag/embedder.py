@@ -2,10 +2,11 @@
 
 import os
 import pdfplumber
-import numpy as np
 import faiss
 from sentence_transformers import SentenceTransformer
 
+from .index_registry import publish_index
+
 BASE = os.path.dirname(os.path.abspath(__file__))
 GUIDE_DIR = os.path.join(BASE, "..", "guidelines")
 FAISS_DIR = os.path.join(BASE, "faiss_store")
@@ -54,8 +55,8 @@ def build_index(cancer):
     index = faiss.IndexFlatL2(dim)
     index.add(emb)
 
-    faiss.write_index(index, os.path.join(out_folder, "index.bin"))
-    np.save(os.path.join(out_folder, "meta.npy"), np.array(all_chunks, dtype=object))
+    # A running server swaps it in once index, metadata and manifest are all in place
+    publish_index(index, all_chunks, os.path.join(out_folder, "index.bin"), os.path.join(out_folder, "meta.npy"))
 
     print(f"[OK] {cancer}: {len(all_chunks)} chunks indexed.")
 
@@ -0,0 +1,141 @@
+# rag/embedding_cache.py
+
+import os
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from utils.text_cleaner import clean_text
+
+BASE_PATH = os.path.dirname(os.path.abspath(__file__))
+SETTINGS_PATH = os.path.join(BASE_PATH, "..", "config", "settings.json")
+
+DEFAULT_CAPACITY = 4096
+
+
+class EmbeddingCache:
+    """Query embeddings keyed by (model id, clean_text(query)).
+
+    Lookups go to an in-memory LRU first, then to an optional SQLite file
+    that survives restarts; only texts found in neither reach the model, in
+    one batched encode. App queries come from a small cancer x stage x
+    biomarker space, so after warm-up most requests skip the model.
+    """
+
+    def __init__(self, model, model_id, capacity=DEFAULT_CAPACITY, path=None):
+        self.model = model
+        self.model_id = model_id
+        self.capacity = capacity
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._db = self._open(path) if path else None
+
+    def _open(self, path):
+        try:
+            db = sqlite3.connect(path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " model TEXT NOT NULL, text TEXT NOT NULL, vector BLOB NOT NULL,"
+                " PRIMARY KEY (model, text))"
+            )
+            db.commit()
+            return db
+        except sqlite3.Error as e:
+            print(f"[RAG] Embedding cache at {path} unavailable, memory only: {e}")
+            return None
+
+    def encode(self, texts):
+        """(len(texts), dim) float32 embeddings, row i for texts[i]."""
+        keys = [clean_text(t) for t in texts]
+        found = {}
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                if key in self._lru:
+                    self._lru.move_to_end(key)
+                    found[key] = self._lru[key]
+                    self.hits += 1
+
+        missing = [k for k in dict.fromkeys(keys) if k not in found]
+        if missing and self._db is not None:
+            stored = self._read(missing)
+            with self._lock:
+                self.disk_hits += len(stored)
+            found.update(stored)
+            missing = [k for k in missing if k not in stored]
+
+        if missing:
+            with self._lock:
+                self.misses += len(missing)
+            vectors = self.model.encode(missing, convert_to_numpy=True).astype(np.float32)
+            computed = dict(zip(missing, vectors))
+            found.update(computed)
+            if self._db is not None:
+                self._write(computed)
+
+        with self._lock:
+            for key in keys:
+                self._lru[key] = found[key]
+                self._lru.move_to_end(key)
+            while len(self._lru) > self.capacity:
+                self._lru.popitem(last=False)
+
+        return np.stack([found[k] for k in keys])
+
+    def _read(self, keys):
+        marks = ",".join("?" * len(keys))
+        try:
+            with self._lock:
+                rows = self._db.execute(
+                    f"SELECT text, vector FROM embeddings WHERE model = ? AND text IN ({marks})",
+                    [self.model_id, *keys],
+                ).fetchall()
+        except sqlite3.Error as e:
+            # A locked or corrupt file only costs the disk hits: encode them instead
+            print(f"[RAG] Could not read cached embeddings: {e}")
+            return {}
+        return {text: np.frombuffer(blob, dtype=np.float32) for text, blob in rows}
+
+    def _write(self, computed):
+        try:
+            with self._lock:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, text, vector) VALUES (?, ?, ?)",
+                    [(self.model_id, k, v.tobytes()) for k, v in computed.items()],
+                )
+                self._db.commit()
+        except sqlite3.Error as e:
+            # A read-only or locked file only costs persistence
+            print(f"[RAG] Could not persist embeddings: {e}")
+
+    def stats(self):
+        with self._lock:
+            hits, disk_hits, misses, entries = self.hits, self.disk_hits, self.misses, len(self._lru)
+        lookups = hits + disk_hits + misses
+        return {
+            "model": self.model_id,
+            "entries": entries,
+            "capacity": self.capacity,
+            "persistent": self._db is not None,
+            "memory_hits": hits,
+            "disk_hits": disk_hits,
+            "misses": misses,
+            "hit_rate": round((hits + disk_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+
+def cache_for(model, model_id):
+    """EmbeddingCache configured from config/settings.json
+    ("embedding_cache_size", "embedding_cache_path" relative to ai_engine, null for memory only)."""
+    with open(SETTINGS_PATH, "r", encoding="utf-8") as f:
+        cfg = json.load(f)
+    path = cfg.get("embedding_cache_path")
+    if path:
+        path = os.path.join(BASE_PATH, "..", path)
+    return EmbeddingCache(model, model_id, cfg.get("embedding_cache_size", DEFAULT_CAPACITY), path)
@@ -0,0 +1,237 @@
+# rag/index_registry.py
+
+import os
+import io
+import sys
+import json
+import time
+import hashlib
+import threading
+import faiss
+import numpy as np
+
+
+class IndexEntry:
+    """One loaded index. Never mutated after creation: a rebuild produces a new
+    entry, so a search holding the old one finishes on consistent data."""
+
+    __slots__ = ("name", "index", "meta", "stat", "digest", "load_seconds", "nbytes", "loaded_at")
+
+    def __init__(self, name, index, meta, stat, digest, load_seconds, nbytes):
+        self.name = name
+        self.index = index
+        self.meta = meta
+        self.stat = stat
+        self.digest = digest
+        self.load_seconds = load_seconds
+        self.nbytes = nbytes
+        self.loaded_at = time.time()
+
+
+def file_stat(*paths):
+    """(mtime_ns, size) of each path, or None if any is missing."""
+    try:
+        return tuple((st.st_mtime_ns, st.st_size) for st in map(os.stat, paths))
+    except FileNotFoundError:
+        return None
+
+
+def manifest_path(index_path):
+    """The manifest published next to an index: {"index": sha256, "meta": sha256, "vectors": n}."""
+    return os.path.join(os.path.dirname(index_path), "manifest.json")
+
+
+def read_manifest(index_path):
+    """The manifest as a dict, or None for stores written before manifests existed."""
+    try:
+        with open(manifest_path(index_path), "rb") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def pair_stat(index_path, meta_path):
+    """file_stat of the manifest, index and metadata; of the pair alone for stores
+    written before manifests existed."""
+    return file_stat(manifest_path(index_path), index_path, meta_path) or file_stat(index_path, meta_path)
+
+
+def _replace(path, data):
+    with open(path + ".tmp", "wb") as f:
+        f.write(data)
+    os.replace(path + ".tmp", path)
+
+
+def publish_index(index, meta, index_path, meta_path):
+    """Write an index and its metadata for IndexRegistry to pick up.
+
+    The two files can't be renamed into place in one step, so the manifest
+    holding both hashes is renamed in last; the registry only loads a pair
+    that matches it and keeps serving the previous one until then.
+    """
+    index_bytes = faiss.serialize_index(index).tobytes()
+    buf = io.BytesIO()
+    np.save(buf, np.asarray(meta, dtype=object), allow_pickle=True)
+    meta_bytes = buf.getvalue()
+    manifest = {
+        "index": hashlib.sha256(index_bytes).hexdigest(),
+        "meta": hashlib.sha256(meta_bytes).hexdigest(),
+        "vectors": int(index.ntotal),
+    }
+    _replace(index_path, index_bytes)
+    _replace(meta_path, meta_bytes)
+    _replace(manifest_path(index_path), json.dumps(manifest).encode("utf-8"))
+
+
+def index_nbytes(index, meta):
+    """Approximate resident size: the index codes plus the chunk texts."""
+    try:
+        codes = index.ntotal * index.sa_code_size()
+    except RuntimeError:
+        # Index types without a standalone code size; d floats per vector is close
+        codes = index.ntotal * index.d * 4
+    texts = sum(sys.getsizeof(item.get("text", "")) for item in meta)
+    return int(codes + meta.nbytes + texts)
+
+
+class IndexRegistry:
+    """Process-wide cache of FAISS indexes and their metadata.
+
+    Each index is read from disk once. `get` re-stats the files on every call
+    (cheap) and, when the mtime or size moved and the content hash really
+    changed, loads the new files and swaps the entry in under the lock. A
+    pair that doesn't match its manifest (see publish_index) is a rebuild
+    still in progress and is not loaded. The load itself runs outside the
+    lock and only one thread reloads a given index; everyone else keeps
+    searching the previous entry meanwhile.
+    """
+
+    def __init__(self):
+        self._sources = {}
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._loading = {}
+        self._failed = {}
+
+    def register(self, name, index_path, meta_path, builder=None):
+        """Declare where `name` lives; `builder()` is run once if the files are missing."""
+        with self._lock:
+            self._sources[name] = (index_path, meta_path, builder)
+            self._loading.setdefault(name, threading.Lock())
+
+    def __contains__(self, name):
+        return name in self._sources
+
+    def get(self, name):
+        """Current IndexEntry for `name`, loading or hot-swapping it as needed; None if unavailable."""
+        index_path, meta_path, builder = self._sources[name]
+        entry = self._entries.get(name)
+        stat = pair_stat(index_path, meta_path)
+
+        if entry is not None and stat in (entry.stat, self._failed.get(name)):
+            return entry
+
+        loading = self._loading[name]
+        if entry is not None:
+            # A reload is already under way: keep serving the old index
+            if not loading.acquire(blocking=False):
+                return entry
+        else:
+            loading.acquire()
+
+        try:
+            # Another thread may have finished the load while we waited
+            current = self._entries.get(name)
+            if current is not None and current is not entry:
+                return current
+
+            if stat is None and builder is not None and entry is None:
+                print(f"[RAG] No index found for {name}. Building now...")
+                builder()
+                stat = pair_stat(index_path, meta_path)
+
+            if stat is None:
+                if entry is None:
+                    print(f"[RAG] Failed to build index for {name}")
+                return entry
+
+            new = self._load(name, index_path, meta_path, stat, entry)
+            if new is None:
+                # Don't retry until the files change again
+                self._failed[name] = stat
+                return entry
+
+            with self._lock:
+                self._entries[name] = new
+            if entry is not None and new.index is not entry.index:
+                print(f"[RAG] Swapped in rebuilt index for {name} ({new.load_seconds:.2f}s)")
+            return new
+        finally:
+            loading.release()
+
+    def _load(self, name, index_path, meta_path, stat, current):
+        """New IndexEntry from the files, `current` re-stamped if their content is
+        unchanged, or None if they can't be loaded (yet)."""
+        start = time.perf_counter()
+        # Hash and parse the same bytes, so a rename in between can't mix versions
+        try:
+            with open(index_path, "rb") as f:
+                index_bytes = f.read()
+            with open(meta_path, "rb") as f:
+                meta_bytes = f.read()
+            manifest = read_manifest(index_path)
+        except (OSError, ValueError) as e:
+            print(f"[RAG] Could not read index for {name}: {e}")
+            return None
+
+        hashes = {"index": hashlib.sha256(index_bytes).hexdigest(), "meta": hashlib.sha256(meta_bytes).hexdigest()}
+        if manifest is not None and any(manifest.get(key) != h for key, h in hashes.items()):
+            print(f"[RAG] Index files for {name} don't match their manifest (rebuild in progress?), keeping previous")
+            return None
+        digest = hashlib.sha256((hashes["index"] + hashes["meta"]).encode("utf-8")).hexdigest()
+        if current is not None and digest == current.digest:
+            # Touched but unchanged: remember the new stat, keep the loaded data
+            return IndexEntry(name, current.index, current.meta, stat, digest,
+                              current.load_seconds, current.nbytes)
+
+        try:
+            index = faiss.deserialize_index(np.frombuffer(index_bytes, dtype=np.uint8))
+            meta = np.load(io.BytesIO(meta_bytes), allow_pickle=True)
+        except Exception as e:
+            print(f"[RAG] Could not load index for {name}: {e}")
+            return None
+        if index.ntotal != len(meta):
+            print(f"[RAG] Index and metadata for {name} disagree ({index.ntotal} vs {len(meta)}), keeping previous")
+            return None
+        seconds = time.perf_counter() - start
+        return IndexEntry(name, index, meta, stat, digest, seconds, index_nbytes(index, meta))
+
+    def preload(self, names=None):
+        """Load every registered index (or `names`) up front so no request pays for it."""
+        for name in names if names is not None else list(self._sources):
+            try:
+                entry = self.get(name)
+            except Exception as e:
+                print(f"[RAG] Could not preload {name}: {e}")
+                continue
+            if entry is not None:
+                print(f"[RAG] Loaded {name}: {entry.index.ntotal} vectors, "
+                      f"{entry.nbytes / 1e6:.1f} MB in {entry.load_seconds:.2f}s")
+
+    def stats(self):
+        """{name: {"vectors", "bytes", "load_seconds", "loaded_at", "sha256"}} of the loaded indexes."""
+        with self._lock:
+            entries = dict(self._entries)
+        return {
+            name: {
+                "vectors": int(e.index.ntotal),
+                "bytes": e.nbytes,
+                "load_seconds": round(e.load_seconds, 4),
+                "loaded_at": e.loaded_at,
+                "sha256": e.digest,
+            }
+            for name, e in entries.items()
+        }
+
+
+REGISTRY = IndexRegistry()
@@ -0,0 +1,258 @@
+# rag/pubmed_cache.py
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.text_cleaner import clean_text
+from .pubmed_client import TOTAL_TIMEOUT, SEARCH_SHARE
+
+logger = logging.getLogger(__name__)
+
+BASE_PATH = os.path.dirname(os.path.abspath(__file__))
+SETTINGS_PATH = os.path.join(BASE_PATH, "..", "config", "settings.json")
+
+HOUR = 3600.0
+SEARCH_TTL_HOURS = 7 * 24     # New literature shows up slowly
+ARTICLE_TTL_HOURS = 30 * 24   # Abstracts practically never change
+
+
+def search_key(query):
+    """PubMed ignores case and extra whitespace, so "Breast  ER Positive" and
+    "breast er positive" share one entry."""
+    return clean_text(query).lower()
+
+
+def by_search_key(queries):
+    """{search_key: query} keeping the first spelling of each; the key only
+    addresses the cache, PubMed gets the query as written."""
+    terms = {}
+    for query in queries:
+        terms.setdefault(search_key(query), query)
+    return terms
+
+
+class PubMedCache:
+    """SQLite cache in front of a PubMedClient for esearch ID lists and efetch articles.
+
+    Fresh entries are served as is. Expired ones are still served right away
+    and refreshed on a background thread (stale-while-revalidate); only
+    searches and articles never seen before go to PubMed on the request
+    path. In offline mode nothing goes to PubMed and whatever is cached is
+    returned, however old.
+    """
+
+    def __init__(self, client, path, search_ttl=SEARCH_TTL_HOURS * HOUR,
+                 article_ttl=ARTICLE_TTL_HOURS * HOUR, offline=False):
+        self.client = client
+        self.search_ttl = search_ttl
+        self.article_ttl = article_ttl
+        self.offline = offline
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._refresher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pubmed-refresh")
+        self.counts = {"fresh": 0, "stale": 0, "missed": 0}
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS searches ("
+            " term TEXT NOT NULL, retmax INTEGER NOT NULL, ids TEXT NOT NULL, fetched_at REAL NOT NULL,"
+            " PRIMARY KEY (term, retmax))"
+        )
+        # article is NULL for PMIDs without an abstract, so they aren't fetched again
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS articles ("
+            " pmid TEXT PRIMARY KEY, article TEXT, fetched_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    # -------------------------------
+    # STORAGE
+    # -------------------------------
+    def _rows(self, sql, keys, *extra):
+        if not keys:
+            return []
+        marks = ",".join("?" * len(keys))
+        try:
+            with self._lock:
+                return self._db.execute(sql.format(marks=marks), [*keys, *extra]).fetchall()
+        except sqlite3.Error as e:
+            # A locked or corrupt file turns everything into misses for the client
+            logger.error(f"PubMed cache read failed, querying PubMed: {e}")
+            return []
+
+    def _cached_searches(self, terms, k):
+        """({term: ids}, [expired terms])"""
+        now = time.time()
+        rows = self._rows("SELECT term, ids, fetched_at FROM searches WHERE term IN ({marks}) AND retmax = ?", terms, k)
+        found = {term: json.loads(ids) for term, ids, _ in rows}
+        expired = [term for term, _, at in rows if now - at > self.search_ttl]
+        return found, expired
+
+    def _cached_articles(self, pmids):
+        """({pmid: article or None}, [expired pmids])"""
+        now = time.time()
+        rows = self._rows("SELECT pmid, article, fetched_at FROM articles WHERE pmid IN ({marks})", pmids)
+        found = {pmid: json.loads(article) if article else None for pmid, article, _ in rows}
+        expired = [pmid for pmid, _, at in rows if now - at > self.article_ttl]
+        return found, expired
+
+    def _store(self, searches=None, k=None, records=None):
+        now = time.time()
+        try:
+            with self._lock:
+                if searches:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO searches (term, retmax, ids, fetched_at) VALUES (?, ?, ?, ?)",
+                        [(term, k, json.dumps(ids), now) for term, ids in searches.items()],
+                    )
+                if records:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO articles (pmid, article, fetched_at) VALUES (?, ?, ?)",
+                        [(pmid, json.dumps(a) if a else None, now) for pmid, a in records.items()],
+                    )
+                self._db.commit()
+        except sqlite3.Error as e:
+            # A read-only or locked file only costs persistence
+            logger.error(f"Could not store PubMed results in the cache: {e}")
+
+    def _search(self, terms, k, deadline):
+        """esearch the query of each {key: query}; {key: ids} for those that succeeded, stored."""
+        found = self.client.search_each(list(terms.values()), k, deadline)
+        found = {key: found[query] for key, query in terms.items() if query in found}
+        self._store(searches=found, k=k)
+        return found
+
+    # -------------------------------
+    # LOOKUP
+    # -------------------------------
+    def evidence(self, queries, k=5, timeout=TOTAL_TIMEOUT):
+        """
+        Retrieves PubMed evidence for the queries, from the cache where possible.
+
+        Args:
+            queries (list): Search queries.
+            k (int): Number of articles to retrieve per query.
+            timeout (float): Seconds allowed for whatever has to go to PubMed.
+
+        Returns:
+            list: Dictionaries with the text and source of each article, in query order.
+        """
+        start = time.monotonic()
+        terms = by_search_key(queries)
+
+        ids, stale_terms = self._cached_searches(list(terms), k)
+        missing = [t for t in terms if t not in ids]
+        self._count(len(ids) - len(stale_terms), len(stale_terms), len(missing))
+        if missing and not self.offline:
+            ids.update(self._search({t: terms[t] for t in missing}, k, start + timeout * SEARCH_SHARE))
+
+        pmids = list(dict.fromkeys(p for t in terms for p in ids.get(t, [])))
+        articles, stale_ids = self._cached_articles(pmids)
+        missing = [p for p in pmids if p not in articles]
+        self._count(len(articles) - len(stale_ids), len(stale_ids), len(missing))
+        if missing and not self.offline:
+            records = self.client.fetch_records(missing, start + timeout)
+            self._store(records=records)
+            articles.update(records)
+
+        if (stale_terms or stale_ids) and not self.offline:
+            self._revalidate_later({t: terms[t] for t in stale_terms}, k, stale_ids)
+        return [articles[p] for p in pmids if articles.get(p)]
+
+    def _count(self, fresh, stale, missed):
+        with self._lock:
+            self.counts["fresh"] += fresh
+            self.counts["stale"] += stale
+            self.counts["missed"] += missed
+
+    # -------------------------------
+    # BACKGROUND REFRESH
+    # -------------------------------
+    def _revalidate_later(self, terms, k, pmids):
+        """Refresh the {key: query} searches and the pmids on the background thread,
+        unless a refresh of them is already queued."""
+        with self._lock:
+            keys = {("search", t, k) for t in terms} | {("article", p) for p in pmids}
+            keys -= self._refreshing
+            if not keys:
+                return
+            self._refreshing |= keys
+        queries = [terms[key[1]] for key in keys if key[0] == "search"]
+        pmids = [key[1] for key in keys if key[0] == "article"]
+        self._refresher.submit(self._revalidate, queries, k, pmids, keys)
+
+    def _revalidate(self, queries, k, pmids, keys):
+        try:
+            self.refresh(queries, k, pmids)
+        except Exception as e:
+            logger.error(f"PubMed cache refresh failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing -= keys
+
+    def refresh(self, queries, k, pmids=()):
+        """Re-run the searches and re-fetch `pmids` plus the IDs they turned up
+        that are missing or expired. Returns the (searches, articles) stored."""
+        deadline = time.monotonic() + TOTAL_TIMEOUT
+        terms = by_search_key(queries)
+        found = self._search(terms, k, deadline) if terms else {}
+
+        found_ids = list(dict.fromkeys(p for ids in found.values() for p in ids))
+        cached, expired = self._cached_articles(found_ids)
+        wanted = list(dict.fromkeys([*pmids, *expired, *(p for p in found_ids if p not in cached)]))
+        records = self.client.fetch_records(wanted, time.monotonic() + TOTAL_TIMEOUT)
+        self._store(records=records)
+        return len(found), len(records)
+
+    def due(self, queries, k):
+        """The queries whose searches are not cached or have expired."""
+        terms = by_search_key(queries)
+        found, expired = self._cached_searches(list(terms), k)
+        return [query for t, query in terms.items() if t not in found or t in expired]
+
+    def stats(self):
+        with self._lock:
+            try:
+                searches = self._db.execute("SELECT COUNT(*) FROM searches").fetchone()[0]
+                articles = self._db.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+            except sqlite3.Error as e:
+                logger.error(f"PubMed cache read failed: {e}")
+                searches = articles = None
+            counts = dict(self.counts)
+        lookups = sum(counts.values())
+        return {
+            "offline": self.offline,
+            "searches": searches,
+            "articles": articles,
+            **counts,
+            "hit_rate": round((counts["fresh"] + counts["stale"]) / lookups, 4) if lookups else 0.0,
+        }
+
+
+def cache_for(client):
+    """PubMedCache configured from config/settings.json ("pubmed_cache_path"
+    relative to ai_engine, null to disable; TTLs in hours; "pubmed_offline",
+    which PUBMED_OFFLINE=1 in the environment also turns on), or None."""
+    with open(SETTINGS_PATH, "r", encoding="utf-8") as f:
+        cfg = json.load(f)
+    path = cfg.get("pubmed_cache_path")
+    if not path:
+        return None
+    offline = cfg.get("pubmed_offline", False) or os.environ.get("PUBMED_OFFLINE") == "1"
+    try:
+        return PubMedCache(
+            client,
+            os.path.join(BASE_PATH, "..", path),
+            search_ttl=cfg.get("pubmed_search_ttl_hours", SEARCH_TTL_HOURS) * HOUR,
+            article_ttl=cfg.get("pubmed_article_ttl_hours", ARTICLE_TTL_HOURS) * HOUR,
+            offline=offline,
+        )
+    except sqlite3.Error as e:
+        logger.error(f"PubMed cache at {path} unavailable, querying PubMed directly: {e}")
+        return None
@@ -0,0 +1,226 @@
+# rag/pubmed_client.py
+
+import os
+import time
+import threading
+import logging
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# -------------------------------
+# PUBMED CONFIG
+# -------------------------------
+PUBMED_SEARCH = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
+PUBMED_FETCH = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
+HEADERS = {"User-Agent": "AI-Driven-Personalized-Cancer-Treatment-Planning-System"}
+
+# NCBI allows 3 requests/s per client, 10 with an API key
+NCBI_API_KEY = os.environ.get("NCBI_API_KEY")
+RATE_LIMIT = 10.0 if NCBI_API_KEY else 3.0
+
+CALL_TIMEOUT = 5.0    # Seconds per HTTP call (connect and each read)
+TOTAL_TIMEOUT = 10.0  # Seconds for a whole search + fetch
+SEARCH_SHARE = 0.6    # Part of it the searches may use, so a hung esearch leaves time to fetch
+RETRIES = 2           # Extra attempts on connection errors, 429 and 5xx
+BACKOFF = 0.5         # Seconds before the first retry, doubled after each
+MAX_WORKERS = 4       # Concurrent esearch calls (and pooled connections)
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, at most `burst` saved up.
+
+    The default burst of 1 spaces calls 1/rate apart, so no one-second window
+    ever holds more than `rate` requests.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, deadline=None):
+        """Take a token, sleeping until one is free. False if that would pass `deadline`."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait_for = (1 - self._tokens) / self.rate
+            if deadline is not None and now + wait_for > deadline:
+                return False
+            time.sleep(wait_for)
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class PubMedClient:
+    """E-utilities client shared by all requests of the process.
+
+    One pooled requests.Session, esearch calls run concurrently on a small
+    thread pool, every call waits for the shared rate limiter, and each call
+    is bounded by both CALL_TIMEOUT and the deadline of the whole lookup.
+    efetch XML is parsed as it streams in.
+    """
+
+    def __init__(self, search_url=PUBMED_SEARCH, fetch_url=PUBMED_FETCH, rate=RATE_LIMIT,
+                 api_key=NCBI_API_KEY, max_workers=MAX_WORKERS, call_timeout=CALL_TIMEOUT,
+                 retries=RETRIES, backoff=BACKOFF):
+        self.search_url = search_url
+        self.fetch_url = fetch_url
+        self.api_key = api_key
+        self.call_timeout = call_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.bucket = TokenBucket(rate)
+
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pubmed")
+
+    def _get(self, url, params, deadline, stream=False):
+        """GET with rate limiting, retries and the deadline; raises on final failure."""
+        if self.api_key:
+            params = dict(params, api_key=self.api_key)
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            if not self.bucket.acquire(deadline):
+                raise DeadlineExceeded(url)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceeded(url)
+            try:
+                r = self.session.get(url, params=params, stream=stream,
+                                     timeout=min(self.call_timeout, remaining))
+                if r.status_code not in RETRY_STATUS or attempt == self.retries:
+                    r.raise_for_status()
+                    return r
+                r.close()
+                logger.warning(f"PubMed returned {r.status_code}, retrying")
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt == self.retries:
+                    raise
+                logger.warning(f"PubMed call failed ({e}), retrying")
+            if time.monotonic() + delay >= deadline:
+                raise DeadlineExceeded(url)
+            time.sleep(delay)
+            delay *= 2
+
+    # -------------------------------
+    # ESEARCH
+    # -------------------------------
+    def _search_one(self, query, max_results, deadline):
+        params = {"db": "pubmed", "term": query, "retmax": max_results, "retmode": "json"}
+        try:
+            r = self._get(self.search_url, params, deadline)
+            return r.json()["esearchresult"]["idlist"]
+        except (requests.exceptions.RequestException, DeadlineExceeded, ValueError, KeyError) as e:
+            logger.error(f"Error searching PubMed for query '{query}': {e}")
+            return None
+
+    def search_each(self, queries, max_results=5, deadline=None):
+        """{query: [PubMed IDs]} for the esearch calls that succeeded by `deadline`,
+        run concurrently; failed or late queries are left out."""
+        if deadline is None:
+            deadline = time.monotonic() + TOTAL_TIMEOUT
+        futures = [self.pool.submit(self._search_one, q, max_results, deadline) for q in queries]
+        wait(futures, timeout=max(0.0, deadline - time.monotonic()))
+
+        results = {}
+        for query, future in zip(queries, futures):
+            if not future.done():
+                logger.error(f"PubMed search for '{query}' missed the deadline")
+            elif future.result() is not None:
+                results[query] = future.result()
+        return results
+
+    def search(self, queries, max_results=5, deadline=None):
+        """
+        Runs the esearch calls for all queries concurrently.
+
+        Args:
+            queries (list): Search queries.
+            max_results (int): Maximum number of IDs per query.
+            deadline (float): time.monotonic() by which to give up; queries
+                still running then contribute nothing.
+
+        Returns:
+            list: Unique PubMed IDs, in query order.
+        """
+        found = self.search_each(queries, max_results, deadline)
+        return list(dict.fromkeys(pmid for q in queries for pmid in found.get(q, [])))
+
+    # -------------------------------
+    # EFETCH
+    # -------------------------------
+    def fetch_records(self, pmids, deadline=None):
+        """{PMID: article, or None without an abstract} for each PubmedArticle
+        parsed by `deadline`, parsing each one as it arrives."""
+        if not pmids:
+            return {}
+        if deadline is None:
+            deadline = time.monotonic() + TOTAL_TIMEOUT
+
+        params = {"db": "pubmed", "id": ",".join(pmids), "retmode": "xml"}
+        records = {}
+        try:
+            with self._get(self.fetch_url, params, deadline, stream=True) as r:
+                r.raw.decode_content = True
+                for _, elem in ET.iterparse(r.raw, events=("end",)):
+                    if elem.tag != "PubmedArticle":
+                        continue
+                    records[elem.findtext("MedlineCitation/PMID")] = parse_article(elem)
+                    elem.clear()
+                    if time.monotonic() > deadline:
+                        logger.error("PubMed fetch missed the deadline, keeping the articles parsed so far")
+                        break
+        except (requests.exceptions.RequestException, DeadlineExceeded) as e:
+            logger.error(f"Error fetching PubMed articles: {e}")
+        except ET.ParseError as e:
+            logger.error(f"Error parsing PubMed XML: {e}")
+        return records
+
+    def fetch(self, pmids, deadline=None):
+        """
+        Fetches titles and abstracts, parsing each PubmedArticle as it arrives.
+
+        Args:
+            pmids (list): PubMed IDs.
+            deadline (float): time.monotonic() by which to stop; articles
+                parsed until then are returned.
+
+        Returns:
+            list: Dictionaries with the text ("title. abstract") and source of each article.
+        """
+        return [a for a in self.fetch_records(pmids, deadline).values() if a]
+
+    def evidence(self, queries, k=5, timeout=TOTAL_TIMEOUT):
+        """Search then fetch, both within one `timeout`."""
+        start = time.monotonic()
+        pmids = self.search(queries, k, start + timeout * SEARCH_SHARE)
+        return self.fetch(pmids, start + timeout)
+
+
+def parse_article(elem):
+    """{"text", "source"} of one PubmedArticle element, or None without an abstract."""
+    title = elem.findtext(".//ArticleTitle", default="")
+    abstract = " ".join(a.text for a in elem.findall(".//AbstractText") if a.text)
+    if not abstract:
+        return None
+    return {"text": f"{title}. {abstract}", "source": "PubMed"}
@@ -8,11 +8,13 @@ def hybrid_retrieve(cancer, query, queries, k_local=5, k_online=3):
 
     # -------------------------
     # OFFLINE NCCN EVIDENCE
+    # (all queries, fused by rank)
     # -------------------------
     local_results = retrieve_local_cancer(
         cancer,
         query,
-        k=k_local
+        k=k_local,
+        queries=queries
     )
 
     for r in local_results:
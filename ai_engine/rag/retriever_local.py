@@ -1,53 +1,109 @@
 import os
-import faiss
 import json
-import numpy as np
 from sentence_transformers import SentenceTransformer
 
 from .embedder import build_index  # <-- NEW
+from .index_registry import REGISTRY
+from .embedding_cache import cache_for
 from utils.text_cleaner import clean_text
 
 BASE_PATH = os.path.dirname(os.path.abspath(__file__))
 STORE_PATH = os.path.join(BASE_PATH, "faiss_store")
+CANCERS_PATH = os.path.join(BASE_PATH, "..", "config", "cancers.json")
 
-EMBED_MODEL = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+EMBED_MODEL_ID = "sentence-transformers/all-MiniLM-L6-v2"
+EMBED_MODEL = SentenceTransformer(EMBED_MODEL_ID)
+EMBED_CACHE = cache_for(EMBED_MODEL, EMBED_MODEL_ID)
 
+RRF_K = 60  # Reciprocal-rank-fusion damping; 60 is the usual choice
 
-def load_faiss_index(cancer):
+
+def register_cancer(cancer):
+    """Point the shared registry at faiss_store/<cancer>, auto-building it if not found."""
     folder = os.path.join(STORE_PATH, cancer)
-    index_path = os.path.join(folder, "index.bin")
-    meta_path = os.path.join(folder, "meta.npy")
+    REGISTRY.register(
+        cancer,
+        os.path.join(folder, "index.bin"),
+        os.path.join(folder, "meta.npy"),
+        builder=lambda: build_index(cancer),
+    )
+
+
+def configured_cancers():
+    with open(CANCERS_PATH, "r", encoding="utf-8") as f:
+        return list(json.load(f))
+
+
+for _cancer in configured_cancers():
+    register_cancer(_cancer)
+
 
-    # ---- AUTO BUILD IF NOT FOUND ----
-    if not os.path.exists(index_path) or not os.path.exists(meta_path):
-        print(f"[RAG] No index found for {cancer}. Building now...")
-        build_index(cancer)
+def preload_indexes():
+    """Load every configured cancer's index at startup instead of on its first request."""
+    REGISTRY.preload(configured_cancers())
 
-    # If still missing, then fail gracefully
-    if not os.path.exists(index_path) or not os.path.exists(meta_path):
-        print(f"[RAG] Failed to build index for {cancer}")
+
+def load_faiss_index(cancer):
+    # Requests send "Brain", the store is keyed "brain"
+    cancer = cancer.lower()
+    if cancer not in REGISTRY:
+        register_cancer(cancer)
+
+    entry = REGISTRY.get(cancer)
+    if entry is None:
         return None, None
+    return entry.index, entry.meta
 
-    index = faiss.read_index(index_path)
-    meta = np.load(meta_path, allow_pickle=True)
-    return index, meta
 
+def reciprocal_rank_fusion(scores, idxs, rrf_k=RRF_K):
+    """Fuse one ranked FAISS result row per query into a single ranked list.
 
-def retrieve_local_cancer(cancer, query, k=6):
+    A chunk scores sum(1 / (rrf_k + rank)) over the rows it appears in, so
+    chunks several queries agree on rise above any single query's best hit.
+    Returns [(idx, fused score, best L2 distance)] for every chunk found, best
+    first; the caller truncates, after dropping duplicate texts.
+    """
+    fused, best = {}, {}
+    for row_scores, row_idxs in zip(scores, idxs):
+        for rank, (dist, idx) in enumerate(zip(row_scores, row_idxs)):
+            idx = int(idx)
+            if idx < 0:  # fewer vectors than requested
+                continue
+            fused[idx] = fused.get(idx, 0.0) + 1.0 / (rrf_k + rank + 1)
+            best[idx] = min(best.get(idx, float("inf")), float(dist))
+    order = sorted(fused, key=lambda i: (-fused[i], best[i]))
+    return [(i, fused[i], best[i]) for i in order]
+
+
+def retrieve_local_cancer(cancer, query, k=6, queries=None):
     index, meta = load_faiss_index(cancer)
     if index is None:
         return []
 
-    query = clean_text(query)
-    qemb = EMBED_MODEL.encode([query], convert_to_numpy=True)
+    # The main query plus the biomarker queries, cleaned and de-duplicated
+    texts = []
+    for q in [query] + list(queries or []):
+        q = clean_text(q)
+        if q and q not in texts:
+            texts.append(q)
+
+    # Cached embeddings; the rest in one batched encode. Then one multi-row search
+    qemb = EMBED_CACHE.encode(texts)
     scores, idxs = index.search(qemb, k)
 
-    results = []
-    for dist, idx in zip(scores[0], idxs[0]):
-        item = meta[int(idx)]
+    results, seen = [], set()
+    for idx, rrf, dist in reciprocal_rank_fusion(scores, idxs):
+        item = meta[idx]
+        # The same page can be indexed from more than one file
+        if item["text"] in seen:
+            continue
+        seen.add(item["text"])
         results.append({
             "text": item["text"],
             "source": item.get("source", "unknown"),
-            "score": float(dist)
+            "score": dist,
+            "rrf": rrf
         })
+        if len(results) == k:
+            break
     return results
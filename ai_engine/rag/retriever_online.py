@@ -1,19 +1,21 @@
 # rag/retriever_online.py
 
-import requests
-import xml.etree.ElementTree as ET
 import logging
 
+from .pubmed_client import PubMedClient, TOTAL_TIMEOUT
+from .pubmed_cache import cache_for
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # -------------------------------
-# PUBMED CONFIG
+# PUBMED CLIENT
 # -------------------------------
-PUBMED_SEARCH = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
-PUBMED_FETCH = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
-HEADERS = {"User-Agent": "AI-Driven-Personalized-Cancer-Treatment-Planning-System"}
+# One pooled session and rate limiter for the whole process (see rag/pubmed_client.py)
+CLIENT = PubMedClient()
+# Evidence cache with TTLs and offline mode (see rag/pubmed_cache.py); None if disabled
+CACHE = cache_for(CLIENT)
 
 
 # -------------------------------
@@ -30,24 +32,7 @@ def pubmed_search(queries, max_results=5):
     Returns:
         list: A list of PubMed article IDs.
     """
-    all_pmids = []
-    for query in queries:
-        params = {
-            "db": "pubmed",
-            "term": query,
-            "retmax": max_results,
-            "retmode": "json"
-        }
-
-        try:
-            r = requests.get(PUBMED_SEARCH, params=params, headers=HEADERS)
-            r.raise_for_status()  # Raise an exception for bad status codes
-            data = r.json()
-            all_pmids.extend(data["esearchresult"]["idlist"])
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error searching PubMed for query '{query}': {e}")
-    
-    return list(set(all_pmids)) # Return unique PMIDs
+    return CLIENT.search(queries, max_results)
 
 
 # -------------------------------
@@ -63,55 +48,24 @@ def pubmed_fetch(pmids):
     Returns:
         list: A list of dictionaries, where each dictionary contains the title, abstract, and source of an article.
     """
-    if not pmids:
-        return []
-
-    params = {
-        "db": "pubmed",
-        "id": ",".join(pmids),
-        "retmode": "xml"
-    }
-
-    try:
-        r = requests.get(PUBMED_FETCH, params=params, headers=HEADERS)
-        r.raise_for_status()  # Raise an exception for bad status codes
-        root = ET.fromstring(r.content)
-        articles = []
-
-        for article in root.findall(".//PubmedArticle"):
-            title = article.findtext(".//ArticleTitle", default="")
-            abstract_parts = article.findall(".//AbstractText")
-            abstract = " ".join([a.text for a in abstract_parts if a.text])
-
-            if abstract:
-                articles.append({
-                    "text": f"{title}. {abstract}",
-                    "source": "PubMed"
-                })
-
-        return articles
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error fetching PubMed articles: {e}")
-        return []
-    except ET.ParseError as e:
-        logger.error(f"Error parsing PubMed XML: {e}")
-        return []
+    return CLIENT.fetch(pmids)
 
 
 # -------------------------------
 # MAIN RAG FUNCTION
 # -------------------------------
-def retrieve_pubmed_evidence(queries, k=5):
+def retrieve_pubmed_evidence(queries, k=5, timeout=TOTAL_TIMEOUT):
     """
     Retrieves evidence from PubMed for a given query.
 
     Args:
         queries (list): A list of search queries.
         k (int): The number of articles to retrieve for each query.
+        timeout (float): Seconds allowed for the searches and the fetch together.
 
     Returns:
         list: A list of dictionaries, where each dictionary contains the title, abstract, and source of an article.
     """
-    pmids = pubmed_search(queries, k)
-    papers = pubmed_fetch(pmids)
-    return papers
+    if CACHE is not None:
+        return CACHE.evidence(queries, k, timeout)
+    return CLIENT.evidence(queries, k, timeout)
@@ -2,15 +2,19 @@
 
 import json
 import os
-import numpy as np
 from sentence_transformers import SentenceTransformer
 import faiss
 
+from rag.index_registry import REGISTRY, publish_index
+from rag.embedding_cache import cache_for
+
 DATA_PATH = "guidelines.json"
 INDEX_PATH = "faiss_store/index.bin"
 META_PATH = "faiss_store/meta.npy"
 
-EMBED_MODEL = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+EMBED_MODEL_ID = "sentence-transformers/all-MiniLM-L6-v2"
+EMBED_MODEL = SentenceTransformer(EMBED_MODEL_ID)
+EMBED_CACHE = cache_for(EMBED_MODEL, EMBED_MODEL_ID)
 
 
 def load_guidelines():
@@ -50,26 +54,28 @@ def build_index():
     index.add(embeddings)
 
     os.makedirs("faiss_store", exist_ok=True)
-    faiss.write_index(index, INDEX_PATH)
-    np.save(META_PATH, np.array(chunks, dtype=object))
+    publish_index(index, chunks, INDEX_PATH, META_PATH)
 
     print(f"Index built: {len(chunks)} guideline sentences.")
     return index, chunks
 
 
-def load_index():
-    if not os.path.exists(INDEX_PATH):
-        return build_index()
+REGISTRY.register("guidelines", INDEX_PATH, META_PATH, builder=build_index)
 
-    index = faiss.read_index(INDEX_PATH)
-    meta = np.load(META_PATH, allow_pickle=True)
-    return index, meta
+
+def load_index():
+    entry = REGISTRY.get("guidelines")
+    if entry is None:
+        return None, None
+    return entry.index, entry.meta
 
 
 def retrieve(query, k=8):
     index, meta = load_index()
+    if index is None:
+        return []
 
-    qemb = EMBED_MODEL.encode([query], convert_to_numpy=True)
+    qemb = EMBED_CACHE.encode([query])
     scores, idxs = index.search(qemb, k)
 
     results = []